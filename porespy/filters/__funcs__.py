@@ -3,15 +3,16 @@ import scipy as sp
 import numpy as np
 import scipy.ndimage as spim
 import scipy.spatial as sptl
-from scipy.signal import fftconvolve
 from tqdm import tqdm
-from numba import jit
+from numba import prange
 from skimage.segmentation import clear_border
-from skimage.morphology import ball, disk, square, cube, diamond, octahedron
 from skimage.morphology import reconstruction, watershed
-from porespy.tools import randomize_colors, fftmorphology
+from porespy.tools import randomize_colors, morphology
 from porespy.tools import get_border, extend_slice
-from porespy.tools import ps_disk, ps_ball
+from porespy.tools import edt, get_strel
+from porespy.tools import RegionIndex
+from porespy.tools.__cache__ import cached
+from porespy.tools.__numba__ import parallel_kernel
 
 
 def distance_transform_lin(im, axis=0, mode='both'):
@@ -75,7 +76,7 @@ def distance_transform_lin(im, axis=0, mode='both'):
 
 
 def snow_partitioning(im, dt=None, r_max=4, sigma=0.4, return_all=False,
-                      mask=True, randomize=True):
+                      mask=True, randomize=True, roi=None):
     r"""
     Partitions the void space into pore regions using a marker-based watershed
     algorithm, with specially filtered peaks as markers.
@@ -112,6 +113,12 @@ def snow_partitioning(im, dt=None, r_max=4, sigma=0.4, return_all=False,
         If ``True`` (default), then the region colors will be randomized before
         returning.  This is helpful for visualizing otherwise neighboring
         regions have simlar coloring are are hard to distinguish.
+    roi : ND-array, optional
+        A boolean mask the same shape as ``im`` that is ``True`` inside the
+        region of interest, such as that returned by
+        ``porespy.tools.cylindrical_roi``.  The boundary of the region is
+        treated like the edge of the image, and no pores are placed outside
+        it.
 
     Returns
     -------
@@ -148,12 +155,14 @@ def snow_partitioning(im, dt=None, r_max=4, sigma=0.4, return_all=False,
         im = im > 0
     if dt is None:
         print('Peforming Distance Transform')
+        # Voxels outside the roi are treated as lying beyond the image edge
+        im_dt = im if roi is None else im + ~roi
         if sp.any(im_shape == 1):
             ax = sp.where(im_shape == 1)[0][0]
-            dt = spim.distance_transform_edt(input=im.squeeze())
+            dt = edt(im_dt.squeeze())
             dt = sp.expand_dims(dt, ax)
         else:
-            dt = spim.distance_transform_edt(input=im)
+            dt = edt(im_dt)
 
     tup.im = im
     tup.dt = dt
@@ -161,6 +170,8 @@ def snow_partitioning(im, dt=None, r_max=4, sigma=0.4, return_all=False,
     if sigma > 0:
         print('Applying Gaussian blur with sigma =', str(sigma))
         dt = spim.gaussian_filter(input=dt, sigma=sigma)
+    if roi is not None:
+        dt = dt*roi
 
     peaks = find_peaks(dt=dt, r_max=r_max)
     print('Initial number of peaks: ', spim.label(peaks)[1])
@@ -174,6 +185,8 @@ def snow_partitioning(im, dt=None, r_max=4, sigma=0.4, return_all=False,
         mask_solid = im > 0
     else:
         mask_solid = None
+    if roi is not None:
+        mask_solid = roi if mask_solid is None else mask_solid*roi
     regions = watershed(image=-dt, markers=peaks, mask=mask_solid)
     if randomize:
         regions = randomize_colors(regions)
@@ -222,13 +235,12 @@ def find_peaks(dt, r_max=4, footprint=None):
     """
     im = dt > 0
     if footprint is None:
-        if im.ndim == 2:
-            footprint = disk
-        elif im.ndim == 3:
-            footprint = ball
-        else:
+        if im.ndim not in [2, 3]:
             raise Exception("only 2-d and 3-d images are supported")
-    mx = spim.maximum_filter(dt + 2*(~im), footprint=footprint(r_max))
+        footprint = get_strel(r_max, ndim=im.ndim, shape='ball')
+    else:
+        footprint = footprint(r_max)
+    mx = spim.maximum_filter(dt + 2*(~im), footprint=footprint)
     peaks = (dt == mx)*im
     return peaks
 
@@ -256,11 +268,8 @@ def reduce_peaks(peaks):
     if the group has an odd shape (like a horse shoe), the new voxel may *not*
     lie on top of the original set.
     """
-    if peaks.ndim == 2:
-        strel = square
-    else:
-        strel = cube
-    markers, N = spim.label(input=peaks, structure=strel(3))
+    strel = get_strel(1, ndim=peaks.ndim, shape='cube')
+    markers, N = spim.label(input=peaks, structure=strel)
     inds = spim.measurements.center_of_mass(input=peaks,
                                             labels=markers,
                                             index=sp.arange(1, N+1))
@@ -299,10 +308,7 @@ def trim_saddle_points(peaks, dt, max_iters=10):
         An image with fewer peaks than the input image
     """
     peaks = sp.copy(peaks)
-    if dt.ndim == 2:
-        from skimage.morphology import square as cube
-    else:
-        from skimage.morphology import cube
+    strel = get_strel(1, ndim=dt.ndim, shape='cube')
     labels, N = spim.label(peaks)
     slices = spim.find_objects(labels)
     for i in range(N):
@@ -315,7 +321,7 @@ def trim_saddle_points(peaks, dt, max_iters=10):
         while iters < max_iters:
             iters += 1
             peaks_dil = spim.binary_dilation(input=peaks_dil,
-                                             structure=cube(3))
+                                             structure=strel)
             peaks_max = peaks_dil*sp.amax(dt_i*peaks_dil)
             peaks_extended = (peaks_max == dt_i)*im_i
             if sp.all(peaks_extended == peaks_i):
@@ -358,11 +364,8 @@ def trim_nearby_peaks(peaks, dt):
     furthest from the solid is kept.  No iteration is required.
     """
     peaks = sp.copy(peaks)
-    if dt.ndim == 2:
-        from skimage.morphology import square as cube
-    else:
-        from skimage.morphology import cube
-    peaks, N = spim.label(peaks, structure=cube(3))
+    strel = get_strel(1, ndim=dt.ndim, shape='cube')
+    peaks, N = spim.label(peaks, structure=strel)
     crds = spim.measurements.center_of_mass(peaks, labels=peaks,
                                             index=sp.arange(1, N+1))
     crds = sp.vstack(crds).astype(int)  # Convert to numpy array of ints
@@ -420,16 +423,10 @@ def find_disconnected_voxels(im, conn=None):
         ``im`` using: ``im[holes] = False``
 
     """
-    if im.ndim == 2:
-        if conn == 4:
-            strel = disk(1)
-        elif conn in [None, 8]:
-            strel = square(3)
-    elif im.ndim == 3:
-        if conn == 6:
-            strel = ball(1)
-        elif conn in [None, 26]:
-            strel = cube(3)
+    if conn in [4, 6]:
+        strel = get_strel(1, ndim=im.ndim, shape='ball')
+    elif conn in [None, 8, 26]:
+        strel = get_strel(1, ndim=im.ndim, shape='cube')
     labels, N = spim.label(input=im, structure=strel)
     holes = clear_border(labels=labels) > 0
     return holes
@@ -592,8 +589,7 @@ def trim_extrema(im, h, mode='maxima'):
     return result
 
 
-@jit(forceobj=True)
-def flood(im, regions=None, mode='max'):
+def flood(im, regions=None, mode='max', index=None):
     r"""
     Floods/fills each region in an image with a single value based on the
     specific values in that region.  The ``mode`` argument is used to
@@ -619,6 +615,10 @@ def flood(im, regions=None, mode='max'):
 
         'size' - Floods each region with the size of that region
 
+    index : RegionIndex
+        A ``RegionIndex`` of ``regions``, which can be supplied to avoid
+        rebuilding it if it is already available.
+
     Returns
     -------
     image : ND-array
@@ -634,25 +634,16 @@ def flood(im, regions=None, mode='max'):
     if regions is None:
         labels, N = spim.label(mask)
     else:
-        labels = sp.copy(regions)
-        N = labels.max()
-    I = im.flatten()
-    L = labels.flatten()
+        labels = regions
+    if index is None:
+        index = RegionIndex(labels)
     if mode.startswith('max'):
-        V = sp.zeros(shape=N+1, dtype=float)
-        for i in range(len(L)):
-            if V[L[i]] < I[i]:
-                V[L[i]] = I[i]
+        V = index.reduce(im.astype(float), np.maximum)
     elif mode.startswith('min'):
-        V = sp.ones(shape=N+1, dtype=float)*sp.inf
-        for i in range(len(L)):
-            if V[L[i]] > I[i]:
-                V[L[i]] = I[i]
+        V = index.reduce(im.astype(float), np.minimum)
     elif mode.startswith('size'):
-        V = sp.zeros(shape=N+1, dtype=int)
-        for i in range(len(L)):
-            V[L[i]] += 1
-    im_flooded = sp.reshape(V[labels], newshape=im.shape)
+        V = sp.concatenate(([0], index.counts))
+    im_flooded = V[labels]
     im_flooded = im_flooded*mask
     return im_flooded
 
@@ -830,6 +821,7 @@ def apply_chords_3D(im, spacing=0, trim_edges=True):
     return chords
 
 
+@cached()
 def local_thickness(im, sizes=25, mode='hybrid'):
     r"""
     For each voxel, this functions calculates the radius of the largest sphere
@@ -852,8 +844,9 @@ def local_thickness(im, sizes=25, mode='hybrid'):
 
         'hybrid' - (default) Performs a distance tranform of the void space,
         thresholds to find voxels larger than ``sizes[i]``, trims the resulting
-        mask if ``access_limitations`` is ``True``, then dilates it using the
-        efficient fft-method to obtain the non-wetting fluid configuration.
+        mask if ``access_limitations`` is ``True``, then dilates it using
+        whichever of the methods in ``porespy.tools.morphology`` is fastest
+        to obtain the non-wetting fluid configuration.
 
         'dt' - Same as 'hybrid', except uses a second distance transform,
         relative to the thresholded mask, to find the invading fluid
@@ -883,8 +876,9 @@ def local_thickness(im, sizes=25, mode='hybrid'):
     return im_new
 
 
+@cached()
 def porosimetry(im, sizes=25, inlets=None, access_limited=True,
-                mode='hybrid'):
+                mode='hybrid', roi=None):
     r"""
     Performs a porosimetry simulution on the image
 
@@ -920,8 +914,9 @@ def porosimetry(im, sizes=25, inlets=None, access_limited=True,
 
         'hybrid' - (default) Performs a distance tranform of the void space,
         thresholds to find voxels larger than ``sizes[i]``, trims the resulting
-        mask if ``access_limitations`` is ``True``, then dilates it using the
-        efficient fft-method to obtain the non-wetting fluid configuration.
+        mask if ``access_limitations`` is ``True``, then dilates it using
+        whichever of the methods in ``porespy.tools.morphology`` is fastest
+        to obtain the non-wetting fluid configuration.
 
         'dt' - Same as 'hybrid', except uses a second distance transform,
         relative to the thresholded mask, to find the invading fluid
@@ -932,7 +927,15 @@ def porosimetry(im, sizes=25, inlets=None, access_limited=True,
         invading fluid confirguration directly, *then* trims if
         ``access_limitations`` is ``True``.  This method is not ideal and is
         included mostly for comparison purposes.  The morphological operations
-        are done using fft-based method implementations.
+        are done using ``porespy.tools.morphology``, which selects the fastest
+        method automatically.
+
+    roi : ND-array, optional
+        A boolean mask the same shape as ``im`` that is ``True`` inside the
+        region of interest, such as that returned by
+        ``porespy.tools.cylindrical_roi``.  The space outside it is treated as
+        open space filled with the invading fluid, as for a core immersed in
+        mercury, and is given a value of 0 in the result.
 
     Returns
     -------
@@ -948,6 +951,7 @@ def porosimetry(im, sizes=25, inlets=None, access_limited=True,
     See Also
     --------
     fftmorphology
+    porespy.tools.morphology
 
     """
     def trim_blobs(im, inlets):
@@ -957,29 +961,28 @@ def porosimetry(im, sizes=25, inlets=None, access_limited=True,
         im = im ^ (clear_border(labels=labels) > 0)
         return im
 
-    dt = spim.distance_transform_edt(im > 0)
+    if roi is not None:
+        im = (im > 0) + ~roi
+    dt = edt(im > 0)
+    dt_max = sp.amax(dt) if roi is None else sp.amax(dt[roi])
 
     if inlets is None:
         inlets = get_border(im.shape, mode='faces')
     inlets = sp.where(inlets)
 
     if isinstance(sizes, int):
-        sizes = sp.logspace(start=sp.log10(sp.amax(dt)), stop=0, num=sizes)
+        sizes = sp.logspace(start=sp.log10(dt_max), stop=0, num=sizes)
     else:
         sizes = sp.sort(a=sizes)[-1::-1]
 
-    if im.ndim == 2:
-        strel = ps_disk
-    else:
-        strel = ps_ball
-
     imresults = sp.zeros(sp.shape(im))
     if mode == 'mio':
-        pw = int(sp.floor(dt.max()))
+        pw = int(sp.floor(dt_max))
         impad = sp.pad(im, mode='symmetric', pad_width=pw)
         imresults = sp.zeros(sp.shape(impad))
         for r in tqdm(sizes):
-            imtemp = fftmorphology(impad, strel(r), mode='opening')
+            imtemp = morphology(impad, radius=r, shape='ps_ball',
+                                mode='opening')
             if access_limited:
                 imtemp = trim_blobs(imtemp, inlets)
             if sp.any(imtemp):
@@ -994,7 +997,7 @@ def porosimetry(im, sizes=25, inlets=None, access_limited=True,
             if access_limited:
                 imtemp = trim_blobs(imtemp, inlets)
             if sp.any(imtemp):
-                imtemp = spim.distance_transform_edt(~imtemp) < r
+                imtemp = edt(~imtemp) < r
                 imresults[(imresults == 0)*imtemp] = r
     elif mode == 'hybrid':
         for r in tqdm(sizes):
@@ -1002,10 +1005,13 @@ def porosimetry(im, sizes=25, inlets=None, access_limited=True,
             if access_limited:
                 imtemp = trim_blobs(imtemp, inlets)
             if sp.any(imtemp):
-                imtemp = fftconvolve(imtemp, strel(r), mode='same') > 0.0001
+                imtemp = morphology(imtemp, radius=r, shape='ps_ball',
+                                    mode='dilation')
                 imresults[(imresults == 0)*imtemp] = r
     else:
         raise Exception('Unreckognized mode ' + mode)
+    if roi is not None:
+        imresults[~roi] = 0
     return imresults
 
 
@@ -1016,9 +1022,9 @@ def _get_axial_shifts(ndim=2, include_diagonals=False):
     '''
     if ndim == 2:
         if include_diagonals:
-            neighbors = square(3)
+            neighbors = get_strel(1, ndim=2, shape='cube').copy()
         else:
-            neighbors = diamond(1)
+            neighbors = get_strel(1, ndim=2, shape='diamond').copy()
         neighbors[1, 1] = 0
         x, y = np.where(neighbors)
         x -= 1
@@ -1026,9 +1032,9 @@ def _get_axial_shifts(ndim=2, include_diagonals=False):
         return np.vstack((x, y)).T
     else:
         if include_diagonals:
-            neighbors = cube(3)
+            neighbors = get_strel(1, ndim=3, shape='cube').copy()
         else:
-            neighbors = octahedron(1)
+            neighbors = get_strel(1, ndim=3, shape='diamond').copy()
         neighbors[1, 1, 1] = 0
         x, y, z = np.where(neighbors)
         x -= 1
@@ -1037,39 +1043,6 @@ def _get_axial_shifts(ndim=2, include_diagonals=False):
         return np.vstack((x, y, z)).T
 
 
-def _make_stack(im, include_diagonals=False):
-    r'''
-    Creates a stack of images with one extra dimension to the input image
-    with length equal to the number of borders to search + 1.
-    Image is rolled along the axial shifts so that the border pixel is
-    overlapping the original pixel. First image in stack is the original.
-    Stacking makes direct vectorized array comparisons possible.
-    '''
-    ndim = len(np.shape(im))
-    axial_shift = _get_axial_shifts(ndim, include_diagonals)
-    if ndim == 2:
-        stack = np.zeros([np.shape(im)[0],
-                          np.shape(im)[1],
-                          len(axial_shift)+1])
-        stack[:, :, 0] = im
-        for i in range(len(axial_shift)):
-            ax0, ax1 = axial_shift[i]
-            temp = np.roll(np.roll(im, ax0, 0), ax1, 1)
-            stack[:, :, i+1] = temp
-        return stack
-    elif ndim == 3:
-        stack = np.zeros([np.shape(im)[0],
-                          np.shape(im)[1],
-                          np.shape(im)[2],
-                          len(axial_shift)+1])
-        stack[:, :, :, 0] = im
-        for i in range(len(axial_shift)):
-            ax0, ax1, ax2 = axial_shift[i]
-            temp = np.roll(np.roll(np.roll(im, ax0, 0), ax1, 1), ax2, 2)
-            stack[:, :, :, i+1] = temp
-        return stack
-
-
 def nphase_border(im, include_diagonals=False):
     r'''
     Identifies the voxels in regions that border *N* other regions.
@@ -1090,30 +1063,60 @@ def nphase_border(im, include_diagonals=False):
     Returns
     -------
     image : ND-array
-        A copy of ``im`` with voxel values equal to the number of uniquely
-        different bordering values
+        A ``uint8`` array the same shape as ``im`` with voxel values equal to
+        the number of uniquely different bordering values
+
+    Notes
+    -----
+    The neighborhood of each voxel is scanned directly and the distinct values
+    are counted in a small per-voxel buffer, so the memory required is
+    essentially the size of the input image plus the ``uint8`` result.
     '''
     # Get dimension of image
     ndim = len(np.shape(im))
     if ndim not in [2, 3]:
         raise NotImplementedError("Function only works for 2d and 3d images")
-    # Pad image to handle edges
-    im = np.pad(im, pad_width=1, mode='edge')
-    # Stack rolled images for each neighbor to be inspected
-    stack = _make_stack(im, include_diagonals)
-    # Sort the stack along the last axis
-    stack.sort()
-    out = np.ones_like(im)
-    # Run through stack recording when neighbor id changes
-    # Number of changes is number of unique bordering regions
-    for k in range(np.shape(stack)[ndim])[1:]:
-        if ndim == 2:
-            mask = stack[:, :, k] != stack[:, :, k-1]
-        elif ndim == 3:
-            mask = stack[:, :, :, k] != stack[:, :, :, k-1]
-        out += mask
-    # Un-pad
+    shifts = _get_axial_shifts(ndim, include_diagonals)
+    im = np.asarray(im)
     if ndim == 2:
-        return out[1:-1, 1:-1].copy()
-    else:
-        return out[1:-1, 1:-1, 1:-1].copy()
+        # Treat 2D images as 3D images that are one voxel thick
+        im = im[..., np.newaxis]
+        shifts = np.hstack((shifts, np.zeros((len(shifts), 1), dtype=int)))
+    out = np.empty(im.shape, dtype=np.uint8)
+    _nphase_border_kernel(im, shifts.astype(np.int64), out)
+    if ndim == 2:
+        out = out[..., 0]
+    return out
+
+
+@parallel_kernel
+def _nphase_border_kernel(im, shifts, out):
+    r'''
+    Counts the number of distinct values found in the neighborhood of each
+    voxel (including the voxel itself), treating out-of-bounds neighbors as
+    copies of the nearest edge voxel.  Each slab along the first axis is
+    processed independently, using a small buffer to hold the values seen so
+    far.
+    '''
+    nx, ny, nz = im.shape
+    ns = shifts.shape[0]
+    for i in prange(nx):
+        buf = np.empty(ns + 1, dtype=im.dtype)
+        for j in range(ny):
+            for k in range(nz):
+                buf[0] = im[i, j, k]
+                n = 1
+                for s in range(ns):
+                    ii = min(max(i + shifts[s, 0], 0), nx - 1)
+                    jj = min(max(j + shifts[s, 1], 0), ny - 1)
+                    kk = min(max(k + shifts[s, 2], 0), nz - 1)
+                    val = im[ii, jj, kk]
+                    found = False
+                    for m in range(n):
+                        if buf[m] == val:
+                            found = True
+                            break
+                    if not found:
+                        buf[n] = val
+                        n += 1
+                out[i, j, k] = n
@@ -55,7 +55,7 @@ altered values.
 from .__funcs__ import apply_chords
 from .__funcs__ import apply_chords_3D
 from .__funcs__ import distance_transform_lin
-from .__funcs__ import fftmorphology
+from porespy.tools import fftmorphology
 from .__funcs__ import fill_blind_pores
 from .__funcs__ import find_disconnected_voxels
 from .__funcs__ import find_dt_artifacts
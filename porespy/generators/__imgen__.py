@@ -2,8 +2,7 @@ import porespy as ps
 import scipy as sp
 import scipy.spatial as sptl
 import scipy.ndimage as spim
-from skimage.morphology import ball, disk
-from porespy.tools import norm_to_uniform
+from porespy.tools import norm_to_uniform, edt, get_strel
 from typing import List
 from numpy import array
 
@@ -88,14 +87,11 @@ def RSA(im: array, radius: int, volume_fraction: int = 1,
     print('RSA: Adding spheres of size ' + str(radius))
     d2 = len(im.shape) == 2
     mrad = 2*radius + 1
-    if d2:
-        im_strel = disk(radius)
-        mask_strel = disk(mrad)
-    else:
-        im_strel = ball(radius)
-        mask_strel = ball(mrad)
+    im_strel = get_strel(radius, ndim=im.ndim, shape='ball')
+    mask_strel = get_strel(mrad, ndim=im.ndim, shape='ball')
     if sp.any(im > 0):
-        mask = ps.tools.fftmorphology(im > 0, im_strel > 0, mode='dilate')
+        mask = ps.tools.morphology(im > 0, radius=radius, shape='ball',
+                                   mode='dilation')
         mask = mask.astype(int)
     else:
         mask = sp.zeros_like(im)
@@ -174,10 +170,11 @@ def bundle_of_tubes(shape: List[int], spacing: int):
         try:
             s1 = slice(inds[0][i]-r, inds[0][i]+r+1)
             s2 = slice(inds[1][i]-r, inds[1][i]+r+1)
-            temp[s1, s2] = disk(r)
+            temp[s1, s2] = get_strel(r, ndim=2, shape='ball')
         except ValueError:
             odd_shape = sp.shape(temp[s1, s2])
-            temp[s1, s2] = disk(r)[:odd_shape[0], :odd_shape[1]]
+            strel = get_strel(r, ndim=2, shape='ball')
+            temp[s1, s2] = strel[:odd_shape[0], :odd_shape[1]]
     im = sp.broadcast_to(array=sp.atleast_3d(temp), shape=shape)
     return im
 
@@ -289,7 +286,7 @@ def voronoi_edges(shape: List[int], radius: int, ncells: int,
         if sp.all(pts >= 0) and sp.all(pts < im.shape):
             line_pts = line_segment(pts[0], pts[1])
             im[line_pts] = True
-    im = spim.distance_transform_edt(~im) > radius
+    im = edt(~im) > radius
     return im
 
 
@@ -430,7 +427,7 @@ def lattice_spheres(shape: List[int], radius: int, offset: int = 0,
                           s+r:im.shape[1]-r:2*s,
                           s:im.shape[2]-r:2*s]
         im[coords[0], coords[1], coords[2]] = 1
-    im = ~(spim.distance_transform_edt(~im) < r)
+    im = ~(edt(~im) < r)
     return im
 
 
@@ -466,14 +463,11 @@ def overlapping_spheres(shape: List[int], radius: int, porosity: float):
     shape = sp.array(shape)
     if sp.size(shape) == 1:
         shape = sp.full((3, ), int(shape))
-    if sp.size(shape) == 2:
-        s_vol = sp.sum(disk(radius))
-    if sp.size(shape) == 3:
-        s_vol = sp.sum(ball(radius))
+    s_vol = sp.sum(get_strel(radius, ndim=sp.size(shape), shape='ball'))
     bulk_vol = sp.prod(shape)
     N = int(sp.ceil((1 - porosity)*bulk_vol/s_vol))
     im = sp.random.random(size=shape) > (N/bulk_vol)
-    im = spim.distance_transform_edt(im) < radius
+    im = edt(im) < radius
     return ~im
 
 
@@ -654,7 +648,7 @@ def cylinders(shape: List[int], radius: int, nfibers: int, phi_max: float = 0,
             im[crds[0][valid], crds[1][valid], crds[2][valid]] = 1
             n += 1
     im = sp.array(im, dtype=bool)
-    dt = spim.distance_transform_edt(~im) < radius
+    dt = edt(~im) < radius
     return ~dt
 
 
@@ -1,7 +1,7 @@
 import pickle
 import numpy as np
 from scipy import ndimage as spim
-import scipy.ndimage as nd
+from porespy.tools import edt
 from pathlib import Path
 from porespy.networks import generate_voxel_image
 try:
@@ -155,7 +155,7 @@ def to_palabos(im, filename, solid=0):
     bin_im = bin_im.astype(int)
     # Distance Transform computes Euclidean distance in lattice units to
     # Nearest fluid for every solid voxel
-    dt = nd.distance_transform_edt(bin_im)
+    dt = edt(bin_im)
     dt[dt > np.sqrt(2)] = 2
     dt[(dt > 0)*(dt <= np.sqrt(2))] = 1
     dt = dt.astype(int)
@@ -0,0 +1,175 @@
+import numpy as np
+from functools import lru_cache
+from collections import namedtuple
+from numba import njit, prange, config
+from skimage.measure import marching_cubes_lewiner, mesh_surface_area
+from porespy.tools.__numba__ import parallel_kernel
+
+
+def region_areas(regions, voxel_size=1):
+    r"""
+    Finds the surface area of every region and the interfacial area between
+    every pair of adjacent regions in a single sweep over the image
+
+    Parameters
+    ----------
+    regions : ND-array
+        An image of the pore space partitioned into individual pore regions.
+        Note that zeros in the image will not be considered for area
+        calculation.
+    voxel_size : scalar
+        The resolution of the image, expressed as the length of one side of a
+        voxel, so the volume of a voxel would be **voxel_size**-cubed.  The
+        default is 1.
+
+    Returns
+    -------
+    result : named_tuple
+        A named-tuple containing ``surface_area``, which holds the area of
+        each region offset by 1 such that the area of region 1 is stored in
+        element 0, ``conns``, which holds the zero-based region numbers of
+        each pair of regions that share a face, sorted by the first and then
+        the second, and ``area``, which holds the interfacial area of each
+        pair.  Pairs whose area is not positive, which can happen for small
+        or thin regions, are given the area of one voxel face,
+        ``voxel_size**2``, as done by ``region_interface_areas``.
+
+    Notes
+    -----
+    Each 2x2x2 cell of voxels, including those overhanging the edges of the
+    image, is visited once.  For each region with a voxel in the cell the
+    area of the marching cubes surface of that region within the cell is
+    looked up from the pattern of its voxels, and the interfacial area of
+    each pair of regions in the cell is found from the areas of the two
+    regions and of their union.  These are the same quantities found by
+    meshing each region and each merged pair in turn, as done by
+    ``region_surface_areas`` and ``region_interface_areas``, except that the
+    regions are not blurred before meshing.
+
+    A 2D image is treated as a 3D image one voxel thick.
+
+    See Also
+    --------
+    region_surface_areas
+    region_interface_areas
+
+    """
+    if regions.ndim not in [2, 3]:
+        raise Exception('Only 2D and 3D images are supported')
+    im = regions.reshape((1, )*(3 - regions.ndim) + regions.shape)
+    N = int(im.max(initial=0))
+    keys = _adjacent_pairs(im, N)
+    # There are im.shape[0] + 1 layers of cells along the first axis, which
+    # are split into at most one chunk per thread.  Each chunk adds into its
+    # own row of sa and ia, so threads never write to the same element, and
+    # the rows are summed afterwards.
+    nchunks = min(im.shape[0] + 1, config.NUMBA_NUM_THREADS)
+    bounds = np.linspace(0, im.shape[0] + 1, nchunks + 1).astype(np.int64)
+    sa = np.zeros((nchunks, N + 1), dtype=float)
+    ia = np.zeros((nchunks, keys.size), dtype=float)
+    _sweep(im, _cell_areas(), keys, N, bounds, sa, ia)
+    ia = ia.sum(axis=0)
+    result = namedtuple('areas', ('surface_area', 'conns', 'area'))
+    result.surface_area = sa.sum(axis=0)[1:]*voxel_size**2
+    result.conns = np.vstack((keys // max(N, 1), keys % max(N, 1))).T
+    # A pair whose merged surface is no smaller than the surfaces of its two
+    # regions gets a non-positive area, so is given that of one voxel face
+    result.area = ia*voxel_size**2
+    result.area[ia <= 0] = voxel_size**2
+    return result
+
+
+def _adjacent_pairs(im, N):
+    r"""
+    Finds the sorted keys ``(a - 1)*N + b - 1`` of each pair of regions
+    ``a < b`` that share a face
+    """
+    keys = [np.zeros(0, dtype=np.int64)]
+    for ax in range(im.ndim):
+        lo = tuple([slice(0, -1) if i == ax else slice(None)
+                    for i in range(im.ndim)])
+        hi = tuple([slice(1, None) if i == ax else slice(None)
+                    for i in range(im.ndim)])
+        a = im[lo]
+        b = im[hi]
+        mask = (a != b)*(a > 0)*(b > 0)
+        a = a[mask].astype(np.int64)
+        b = b[mask].astype(np.int64)
+        keys.append(np.unique((np.minimum(a, b) - 1)*N + np.maximum(a, b) - 1))
+    return np.unique(np.concatenate(keys))
+
+
+@lru_cache(maxsize=1)
+def _cell_areas():
+    r"""
+    Finds the area of the marching cubes surface within a single cell for
+    each of the 256 patterns of its corners, where bit ``4*i + 2*j + k`` of
+    the pattern is set if corner ``(i, j, k)`` is inside the region
+    """
+    table = np.zeros(256, dtype=float)
+    for c in range(1, 255):
+        cell = np.array([(c >> m) & 1 for m in range(8)], dtype=float)
+        verts, faces = marching_cubes_lewiner(cell.reshape(2, 2, 2),
+                                              level=0.5)[:2]
+        table[c] = mesh_surface_area(verts, faces)
+    table.flags.writeable = False
+    return table
+
+
+@parallel_kernel
+def _sweep(im, table, keys, N, bounds, sa, ia):
+    nx, ny, nz = im.shape
+    for c in prange(bounds.size - 1):
+        corners = np.zeros(8, dtype=np.int64)
+        for i in range(bounds[c] - 1, bounds[c + 1] - 1):
+            for j in range(-1, ny):
+                for k in range(-1, nz):
+                    for m in range(8):
+                        ii = i + (m >> 2)
+                        jj = j + ((m >> 1) & 1)
+                        kk = k + (m & 1)
+                        if (0 <= ii < nx) and (0 <= jj < ny) and \
+                                (0 <= kk < nz):
+                            corners[m] = im[ii, jj, kk]
+                        else:
+                            corners[m] = 0
+                    uniform = True
+                    for m in range(1, 8):
+                        if corners[m] != corners[0]:
+                            uniform = False
+                            break
+                    if uniform:
+                        continue
+                    for m in range(8):
+                        a = corners[m]
+                        if (a == 0) or _seen(corners, m):
+                            continue
+                        ca = _pattern(corners, a)
+                        sa[c, a] += table[ca]
+                        for n in range(m + 1, 8):
+                            b = corners[n]
+                            if (b == 0) or (b == a) or _seen(corners, n):
+                                continue
+                            cb = _pattern(corners, b)
+                            key = (min(a, b) - 1)*N + max(a, b) - 1
+                            pos = np.searchsorted(keys, key)
+                            if (pos < keys.size) and (keys[pos] == key):
+                                ia[c, pos] += 0.5*(table[ca] + table[cb] -
+                                                   table[ca | cb])
+
+
+@njit
+def _seen(corners, m):
+    for p in range(m):
+        if corners[p] == corners[m]:
+            return True
+    return False
+
+
+@njit
+def _pattern(corners, a):
+    c = 0
+    for m in range(8):
+        if corners[m] == a:
+            c |= 1 << m
+    return c
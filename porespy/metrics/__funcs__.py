@@ -1,14 +1,15 @@
 import scipy as sp
 import numpy as np
-from skimage.measure import regionprops
 import scipy.ndimage as spim
 import scipy.spatial as sptl
-from porespy.tools import extend_slice, mesh_region
+from porespy.tools import extend_slice, mesh_region, edt, RegionIndex
+from porespy.tools import get_strel
 from porespy.filters import find_dt_artifacts
 from collections import namedtuple
 from tqdm import tqdm
 from scipy import fftpack as sp_ft
 from skimage import measure
+from numba import njit
 
 
 def representative_elementary_volume(im, npoints=1000):
@@ -74,7 +75,7 @@ def representative_elementary_volume(im, npoints=1000):
     return profile
 
 
-def porosity_profile(im, axis):
+def porosity_profile(im, axis, roi=None):
     r"""
     Returns a porosity profile along the specified axis
 
@@ -86,22 +87,34 @@ def porosity_profile(im, axis):
         The axis (0, 1, or 2) along which to calculate the profile.  For
         instance, if `axis` is 0, then the porosity in each YZ plane is
         calculated and returned as 1D array with 1 value for each X position.
+    roi : ND-array, optional
+        A boolean mask the same shape as ``im`` that is ``True`` inside the
+        region of interest, such as that returned by ``cylindrical_roi``.
+        Voxels outside it are ignored.
 
     Returns
     -------
     result : 1D-array
-        A 1D-array of porosity along the specified axis
+        A 1D-array of porosity along the specified axis.  If ``roi`` is given
+        then planes that do not intersect it are assigned ``nan``.
     """
     if axis >= im.ndim:
         raise Exception('axis out of range')
     im = np.atleast_3d(im)
     a = set(range(im.ndim)).difference(set([axis]))
     a1, a2 = a
-    prof = np.sum(np.sum(im, axis=a2), axis=a1)/(im.shape[a2]*im.shape[a1])
+    if roi is None:
+        prof = np.sum(np.sum(im, axis=a2), axis=a1)
+        return prof/(im.shape[a2]*im.shape[a1])*100
+    roi = np.atleast_3d(roi)
+    Vp = np.sum(np.sum((im > 0)*roi, axis=a2), axis=a1)
+    Vt = np.sum(np.sum(roi, axis=a2), axis=a1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        prof = np.where(Vt > 0, Vp/Vt, np.nan)
     return prof*100
 
 
-def radial_density(im, bins=10, voxel_size=1):
+def radial_density(im, bins=10, voxel_size=1, roi=None):
     r"""
     Computes radial density function by analyzing the histogram of voxel
     values in the distance transform.  This function is defined by
@@ -138,6 +151,12 @@ def radial_density(im, bins=10, voxel_size=1):
     voxel_size : scalar
         The size of a voxel side in preferred units.  The default is 1, so the
         user can apply the scaling to the returned results after the fact.
+    roi : ND-array, optional
+        A boolean mask the same shape as ``im`` that is ``True`` inside the
+        region of interest, such as that returned by ``cylindrical_roi``.
+        Voxels outside it are ignored.  If ``im`` is boolean its distance
+        transform is only found in the bounding box of ``roi``, extended
+        just far enough to give the same values as the whole image.
 
     Returns
     -------
@@ -176,11 +195,24 @@ def radial_density(im, bins=10, voxel_size=1):
     [1] Torquato, S. Random Heterogeneous Materials: Mircostructure and
     Macroscopic Properties. Springer, New York (2002) - See page 48 & 292
     """
-    if im.dtype == bool:
-        im = spim.distance_transform_edt(im)
-    mask = find_dt_artifacts(im) == 0
-    im[mask] = 0
-    x = im[im > 0].flatten()
+    if roi is None:
+        if im.dtype == bool:
+            im = edt(im)
+        mask = find_dt_artifacts(im) == 0
+        im[mask] = 0
+        x = im[im > 0].flatten()
+    elif not sp.any(roi):
+        x = sp.zeros(0)
+    else:
+        # Only the box around the roi is transformed
+        roi = roi > 0
+        if im.dtype == bool:
+            dt, s = _roi_edt(im, roi)
+        else:
+            s = tuple(spim.find_objects(roi.astype(int))[0])
+            dt = sp.array(im[s], dtype=float)
+        dt[dt <= _border_distance(s, im.shape)] = 0
+        x = dt[roi[s]*(dt > 0)]
     h = sp.histogram(x, bins=bins, density=True)
     h = _parse_histogram(h=h, voxel_size=voxel_size)
     rdf = namedtuple('radial_density_function',
@@ -190,7 +222,55 @@ def radial_density(im, bins=10, voxel_size=1):
                h.bin_widths)
 
 
-def porosity(im):
+def _roi_edt(im, roi):
+    r"""
+    Finds the distance transform of ``im`` in the bounding box of ``roi``,
+    extended until the values at every voxel of ``roi`` are the same as those
+    of the whole image, returning it and the slices of the box
+    """
+    bbox = spim.find_objects(roi.astype(int))[0]
+    pad = 10
+    while True:
+        s = tuple(extend_slice(bbox, im.shape, pad=pad))
+        dt = edt(im[s])
+        # Solid beyond a side of the box that is not the edge of the image is
+        # at least as far as that side, so closer solid was found
+        cut = [(a.start > 0, a.stop < n) for a, n in zip(s, im.shape)]
+        if not sp.any(cut):
+            return dt, s
+        near = _border_distance(s, im.shape, cut)
+        if sp.all(dt[roi[s]] <= near[roi[s]]):
+            return dt, s
+        pad *= 2
+
+
+def _border_distance(s, shape, sides=None):
+    r"""
+    Finds the distance from each voxel in the box ``s`` of an image of the
+    given ``shape`` to the nearest voxel beyond its edges, as in
+    ``find_dt_artifacts``.  By default the edges of the image are used,
+    otherwise ``sides`` gives the ``(low, high)`` edges of the box to use
+    along each axis.
+    """
+    ndim = len(shape)
+    result = sp.full([a.stop - a.start for a in s], sp.inf)
+    for ax, (a, n) in enumerate(zip(s, shape)):
+        i = sp.arange(a.stop - a.start, dtype=float)
+        if sides is None:
+            d = sp.minimum(i + a.start + 1, n - a.start - i)
+        else:
+            lo, hi = sides[ax]
+            d = sp.full(i.shape, sp.inf)
+            if lo:
+                d = sp.minimum(d, i + 1)
+            if hi:
+                d = sp.minimum(d, i.size - i)
+        d = d.reshape([-1 if k == ax else 1 for k in range(ndim)])
+        result = sp.minimum(result, d)
+    return result
+
+
+def porosity(im, roi=None):
     r"""
     Calculates the porosity of an image assuming 1's are void space and 0's are
     solid phase.
@@ -203,6 +283,10 @@ def porosity(im):
     im : ND-array
         Image of the void space with 1's indicating void space (or True) and
         0's indicating the solid phase (or False).
+    roi : ND-array, optional
+        A boolean mask the same shape as ``im`` that is ``True`` inside the
+        region of interest, such as that returned by ``cylindrical_roi``.
+        Voxels outside it are ignored.
 
     Returns
     -------
@@ -224,7 +308,12 @@ def porosity(im):
     image such that blind pores have a value of 2, thus allowing the
     calculation of accessible porosity, rather than overall porosity.
 
+    Cylindrical cores can also be handled without relabelling by passing the
+    mask of the core as ``roi``.
+
     """
+    if roi is not None:
+        im = im[roi]
     im = sp.array(im, dtype=int)
     Vp = sp.sum(im == 1)
     Vs = sp.sum(im == 0)
@@ -366,7 +455,7 @@ def two_point_correlation_fft(im):
     return tpcf
 
 
-def pore_size_distribution(im, bins=10, log=True, voxel_size=1):
+def pore_size_distribution(im, bins=10, log=True, voxel_size=1, roi=None):
     r"""
     Calculate a pore-size distribution based on the image produced by the
     ``porosimetry`` or ``local_thickness`` functions.
@@ -386,6 +475,10 @@ def pore_size_distribution(im, bins=10, log=True, voxel_size=1):
     voxel_size : scalar
         The size of a voxel side in preferred units.  The default is 1, so the
         user can apply the scaling to the returned results after the fact.
+    roi : ND-array, optional
+        A boolean mask the same shape as ``im`` that is ``True`` inside the
+        region of interest, such as that returned by ``cylindrical_roi``.
+        Voxels outside it are ignored.
 
     Returns
     -------
@@ -417,7 +510,7 @@ def pore_size_distribution(im, bins=10, log=True, voxel_size=1):
     plt.bar(psd.R, psd.satn, width=psd.bin_widths, edgecolor='k')
 
     """
-    im = im.flatten()
+    im = im.flatten() if roi is None else im[roi]
     vals = im[im > 0]*voxel_size
     if log:
         vals = sp.log10(vals)
@@ -464,14 +557,119 @@ def chord_counts(im):
     or to ``sp.histogram`` to get the histogram data directly. Another useful
     function is ``sp.bincount`` which gives the number of chords of each
     length in a format suitable for ``plt.plot``.
+
+    If the chords have not been drawn yet, ``chord_lengths`` finds the same
+    lengths directly from the binary image without labeling each chord.
+
+    See Also
+    --------
+    chord_lengths
+
     """
     labels, N = spim.label(im > 0)
-    props = regionprops(labels, coordinates='xy')
-    chord_lens = sp.array([i.filled_area for i in props])
+    chord_lens = sp.bincount(labels.flatten())[1:]
     return chord_lens
 
 
-def linear_density(im, bins=25, voxel_size=1, log=False):
+def chord_lengths(im, axis=0, spacing=1, trim_edges=True):
+    r"""
+    Finds the length of the chords that would be drawn in the void space by
+    ``apply_chords`` using a run-length scan of the image rows
+
+    Parameters
+    ----------
+    im : ND-array
+        An image of the porous material with void marked as ``True``.
+
+    axis : int or ``None``
+        The axis along which the chords are measured.  If ``None`` then the
+        chords along all axes are measured and returned together.  The
+        default is 0.
+
+    spacing : int
+        Separation between chords, with the same meaning as in
+        ``apply_chords``.  The default is 1 voxel, meaning that every second
+        row is scanned.
+
+    trim_edges : bool (default = ``True``)
+        Whether or not to skip chords that touch the edges of the image.
+        These chords are artifically shortened, so skew the chord length
+        distribution.
+
+    Returns
+    -------
+    result : 1D-array
+        A 1D array with one element for each chord, containing its length in
+        voxels.  This can be passed directly to ``chord_length_distribution``.
+
+    Notes
+    -----
+    The result contains the same chords as
+    ``chord_counts(apply_chords(im, spacing, axis, trim_edges))``, but no
+    labelled image of the chords is created, so it is much faster and uses
+    far less memory on large 3D images.
+
+    See Also
+    --------
+    apply_chords
+    chord_counts
+    chord_length_distribution
+
+    """
+    if spacing < 0:
+        raise Exception('Spacing cannot be less than 0')
+    im = sp.asarray(im)
+    if axis is None:
+        lens = [chord_lengths(im, axis=ax, spacing=spacing,
+                              trim_edges=trim_edges) for ax in range(im.ndim)]
+        return sp.concatenate(lens)
+    # Move the scanning axis last and subsample the other axes
+    rows = sp.moveaxis(im > 0, axis, -1)
+    step = [slice(None, None, spacing + 1)]*(im.ndim - 1)
+    rows = rows[tuple(step)]
+    if trim_edges:
+        # Rows on the border of the sub-sampled image are touching the edges
+        keep = sp.ones(rows.shape[:-1], dtype=bool)
+        for ax in range(keep.ndim):
+            keep = sp.swapaxes(keep, 0, ax)
+            keep[0] = False
+            keep[-1] = False
+            keep = sp.swapaxes(keep, 0, ax)
+        rows = rows[keep]
+    else:
+        rows = rows.reshape(-1, rows.shape[-1])
+    return _run_lengths(sp.ascontiguousarray(rows), trim_edges)
+
+
+@njit
+def _run_lengths(rows, trim_edges):
+    r"""
+    Finds the length of each run of ``True`` values in the rows of a 2D
+    boolean array, optionally skipping runs touching the ends of a row
+    """
+    n = rows.shape[1]
+    N = 0
+    for i in range(rows.shape[0]):
+        for j in range(n):
+            if rows[i, j] and (j == 0 or not rows[i, j - 1]):
+                N += 1
+    lens = np.empty(N, dtype=np.int64)
+    N = 0
+    for i in range(rows.shape[0]):
+        start = -1
+        for j in range(n + 1):
+            if j < n and rows[i, j]:
+                if start < 0:
+                    start = j
+            elif start >= 0:
+                if not (trim_edges and (start == 0 or j == n)):
+                    lens[N] = j - start
+                    N += 1
+                start = -1
+    return lens[:N]
+
+
+def linear_density(im, bins=25, voxel_size=1, log=False, roi=None):
     r"""
     Determines the probability that a point lies within a certain distance
     of the opposite phase *along a specified direction*
@@ -494,6 +692,10 @@ def linear_density(im, bins=25, voxel_size=1, log=False):
         The side length of a voxel.  This is used to scale the chord lengths
         into real units.  Note this is applied *after* the binning, so
         ``bins``, if supplied, should be in terms of voxels, not length units.
+    roi : ND-array, optional
+        A boolean mask the same shape as ``im`` that is ``True`` inside the
+        region of interest, such as that returned by ``cylindrical_roi``.
+        Voxels outside it are ignored.
 
     Returns
     -------
@@ -505,6 +707,8 @@ def linear_density(im, bins=25, voxel_size=1, log=False):
     Macroscopic Properties. Springer, New York (2002)
 
     """
+    if roi is not None:
+        im = im[roi]
     x = im[im > 0]
     h = list(sp.histogram(x, bins=bins, density=True))
     h = _parse_histogram(h=h, voxel_size=voxel_size)
@@ -522,7 +726,7 @@ def chord_length_distribution(im, bins=None, log=False, voxel_size=1,
 
     Parameters
     ----------
-    im : ND-image
+    im : ND-image or 1D-array
         An image with chords drawn in the pore space, as produced by
         ``apply_chords`` or ``apply_chords_3d``.
 
@@ -532,6 +736,10 @@ def chord_length_distribution(im, bins=None, log=False, voxel_size=1,
         In both cases, the size of each chord will be computed as the number
         of voxels belonging to each labelled region.
 
+        Alternatively, a 1D array of chord lengths as returned by
+        ``chord_lengths`` can be given, which avoids drawing the chords
+        entirely.
+
     bins : scalar or array_like
         If a scalar is given it is interpreted as the number of bins to use,
         and if an array is given they are used as the bins directly.
@@ -585,7 +793,10 @@ def chord_length_distribution(im, bins=None, log=False, voxel_size=1,
     [1] Torquato, S. Random Heterogeneous Materials: Mircostructure and
     Macroscopic Properties. Springer, New York (2002) - See page 45 & 292
     """
-    x = chord_counts(im)
+    if im.ndim == 1:
+        x = im
+    else:
+        x = chord_counts(im)
     if bins is None:
         bins = sp.array(range(0, x.max()+2))*voxel_size
     x = x*voxel_size
@@ -607,7 +818,8 @@ def chord_length_distribution(im, bins=None, log=False, voxel_size=1,
                h.bin_centers, h.bin_edges, h.bin_widths)
 
 
-def region_interface_areas(regions, areas, voxel_size=1, strel=None):
+def region_interface_areas(regions, areas, voxel_size=1, strel=None,
+                           index=None):
     r"""
     Calculates the interfacial area between all pairs of adjecent regions
 
@@ -631,6 +843,9 @@ def region_interface_areas(regions, areas, voxel_size=1, strel=None):
         then a spherical element (or disk) with radius 1 is used.  See the
         docstring for ``mesh_region`` for more details, as this argument is
         passed to there.
+    index : RegionIndex
+        A ``RegionIndex`` of ``regions``.  If not given it will be built, but
+        it can save time to provide one if available.
 
     Returns
     -------
@@ -645,41 +860,36 @@ def region_interface_areas(regions, areas, voxel_size=1, strel=None):
     """
     print('_'*60)
     print('Finding interfacial areas between each region')
-    from skimage.morphology import disk, square, ball, cube
-    im = regions.copy()
-    if im.ndim == 2:
-        cube = square
-        ball = disk
-    # Get 'slices' into im for each region
-    slices = spim.find_objects(im)
+    im = regions
+    strel_dil = get_strel(1, ndim=im.ndim, shape='ball')
+    # Index the voxels of each region
+    if index is None:
+        index = RegionIndex(im)
     # Initialize arrays
-    Ps = sp.arange(1, sp.amax(im)+1)
+    Ps = sp.arange(1, index.num_regions+1)
     sa = sp.zeros_like(Ps, dtype=float)
     sa_combined = []  # Difficult to preallocate since number of conns unknown
     cn = []
     # Start extracting area from im
     for i in tqdm(Ps):
         reg = i - 1
-        s = extend_slice(slices[reg], im.shape)
+        if index.counts[reg] == 0:
+            continue
+        s = extend_slice(index.slices(i), im.shape)
         sub_im = im[s]
-        mask_im = sub_im == i
+        mask_im = index.mask(i, slices=s)
         sa[reg] = areas[reg]
-        im_w_throats = spim.binary_dilation(input=mask_im, structure=ball(1))
+        im_w_throats = spim.binary_dilation(input=mask_im, structure=strel_dil)
         im_w_throats = im_w_throats*sub_im
         Pn = sp.unique(im_w_throats)[1:] - 1
         for j in Pn:
             if j > reg:
                 cn.append([reg, j])
-                merged_region = im[(min(slices[reg][0].start,
-                                        slices[j][0].start)):
-                                   max(slices[reg][0].stop,
-                                       slices[j][0].stop),
-                                   (min(slices[reg][1].start,
-                                        slices[j][1].start)):
-                                   max(slices[reg][1].stop,
-                                       slices[j][1].stop)]
-                merged_region = ((merged_region == reg + 1) +
-                                 (merged_region == j + 1))
+                s_merged = tuple([slice(min(a.start, b.start),
+                                        max(a.stop, b.stop)) for a, b in
+                                  zip(index.slices(i), index.slices(j + 1))])
+                merged_region = (index.mask(i, slices=s_merged) +
+                                 index.mask(j + 1, slices=s_merged))
                 mesh = mesh_region(region=merged_region, strel=strel)
                 sa_combined.append(mesh_surface_area(mesh))
     # Interfacial area calculation
@@ -692,7 +902,7 @@ def region_interface_areas(regions, areas, voxel_size=1, strel=None):
     return result
 
 
-def region_surface_areas(regions, voxel_size=1, strel=None):
+def region_surface_areas(regions, voxel_size=1, strel=None, index=None):
     r"""
     Extracts the surface area of each region in a labeled image.
 
@@ -714,6 +924,9 @@ def region_surface_areas(regions, voxel_size=1, strel=None):
         then a spherical element (or disk) with radius 1 is used.  See the
         docstring for ``mesh_region`` for more details, as this argument is
         passed to there.
+    index : RegionIndex
+        A ``RegionIndex`` of ``regions``.  If not given it will be built, but
+        it can save time to provide one if available.
 
     Returns
     -------
@@ -724,18 +937,20 @@ def region_surface_areas(regions, voxel_size=1, strel=None):
     """
     print('_'*60)
     print('Finding surface area of each region')
-    im = regions.copy()
-    # Get 'slices' into im for each pore region
-    slices = spim.find_objects(im)
+    im = regions
+    # Index the voxels of each pore region
+    if index is None:
+        index = RegionIndex(im)
     # Initialize arrays
-    Ps = sp.arange(1, sp.amax(im)+1)
+    Ps = sp.arange(1, index.num_regions+1)
     sa = sp.zeros_like(Ps, dtype=float)
     # Start extracting marching cube area from im
     for i in tqdm(Ps):
         reg = i - 1
-        s = extend_slice(slices[reg], im.shape)
-        sub_im = im[s]
-        mask_im = sub_im == i
+        if index.counts[reg] == 0:
+            continue
+        s = extend_slice(index.slices(i), im.shape)
+        mask_im = index.mask(i, slices=s)
         mesh = mesh_region(region=mask_im, strel=strel)
         sa[reg] = mesh_surface_area(mesh)
     result = sa * voxel_size**2
@@ -778,7 +993,7 @@ def mesh_surface_area(mesh=None, verts=None, faces=None):
     return surface_area
 
 
-def phase_fraction(im, normed=True):
+def phase_fraction(im, normed=True, roi=None):
     r"""
     Calculates the number (or fraction) of each phase in an image
 
@@ -790,6 +1005,11 @@ def phase_fraction(im, normed=True):
         If ``True`` (default) the returned values are normalized by the total
         number of voxels in image, otherwise the voxel count of each phase is
         returned.
+    roi : ND-array, optional
+        A boolean mask the same shape as ``im`` that is ``True`` inside the
+        region of interest, such as that returned by ``cylindrical_roi``.
+        Voxels outside it are ignored, and ``normed`` values are relative to
+        the number of voxels inside it.
 
     Returns
     -------
@@ -806,6 +1026,8 @@ def phase_fraction(im, normed=True):
         im = im.astype(int)
     elif im.dtype != int:
         raise Exception('Image must contain integer values for each phase')
+    if roi is not None:
+        im = im[roi]
     labels = sp.arange(0, sp.amax(im)+1)
     results = sp.zeros_like(labels)
     for i in labels:
@@ -14,6 +14,7 @@ functions can be applied directly to the binary image.
 
     porespy.metrics.chord_counts
     porespy.metrics.chord_length_distribution
+    porespy.metrics.chord_lengths
     porespy.metrics.linear_density
     porespy.metrics.mesh_surface_area
     porespy.metrics.phase_fraction
@@ -23,6 +24,7 @@ functions can be applied directly to the binary image.
     porespy.metrics.props_to_image
     porespy.metrics.props_to_DataFrame
     porespy.metrics.radial_density
+    porespy.metrics.region_areas
     porespy.metrics.region_interface_areas
     porespy.metrics.region_surface_areas
     porespy.metrics.regionprops_3D
@@ -32,6 +34,7 @@ functions can be applied directly to the binary image.
 
 .. autofunction:: chord_counts
 .. autofunction:: chord_length_distribution
+.. autofunction:: chord_lengths
 .. autofunction:: linear_density
 .. autofunction:: mesh_surface_area
 .. autofunction:: phase_fraction
@@ -41,6 +44,7 @@ functions can be applied directly to the binary image.
 .. autofunction:: props_to_image
 .. autofunction:: props_to_DataFrame
 .. autofunction:: radial_density
+.. autofunction:: region_areas
 .. autofunction:: region_interface_areas
 .. autofunction:: region_surface_areas
 .. autofunction:: regionprops_3D
@@ -55,6 +59,7 @@ from .__regionprops__ import props_to_DataFrame
 from .__regionprops__ import props_to_image
 from .__funcs__ import chord_counts
 from .__funcs__ import chord_length_distribution
+from .__funcs__ import chord_lengths
 from .__funcs__ import linear_density
 from .__funcs__ import pore_size_distribution
 from .__funcs__ import radial_density
@@ -65,5 +70,6 @@ from .__funcs__ import two_point_correlation_bf
 from .__funcs__ import two_point_correlation_fft
 from .__funcs__ import region_surface_areas
 from .__funcs__ import region_interface_areas
+from .__areas__ import region_areas
 from .__funcs__ import mesh_surface_area
 from .__funcs__ import phase_fraction
@@ -1,10 +1,12 @@
 import scipy as sp
 import scipy.ndimage as spim
 from tqdm import tqdm
-from porespy.tools import extract_subsection, bbox_to_slices
+from porespy.tools import extract_subsection, bbox_to_slices, edt
+from porespy.tools import RegionIndex, get_strel
+from porespy.tools.__cache__ import cached
 from skimage.measure import regionprops
 from skimage.measure import mesh_surface_area, marching_cubes_lewiner
-from skimage.morphology import skeletonize_3d, ball
+from skimage.morphology import skeletonize_3d
 from pandas import DataFrame
 
 
@@ -97,7 +99,8 @@ def props_to_image(regionprops, shape, prop):
     return im
 
 
-def regionprops_3D(im):
+@cached(ignore=['index'])
+def regionprops_3D(im, index=None):
     r"""
     Calculates various metrics for each labeled region in a 3D image.
 
@@ -112,6 +115,10 @@ def regionprops_3D(im):
         is received than the ``True`` voxels are treated as a single region
         labeled ``1``.  Regions labeled 0 are ignored in all cases.
 
+    index : RegionIndex
+        A ``RegionIndex`` of ``im``.  If not given it will be built, but it
+        can save time to provide one if available.
+
     Returns
     -------
     An augmented version of the list returned by skimage's ``regionprops``.
@@ -134,10 +141,12 @@ def regionprops_3D(im):
     print('Calculating regionprops')
 
     results = regionprops(im, coordinates='xy')
+    if index is None:
+        index = RegionIndex(im)
     for i in tqdm(range(len(results))):
-        mask = results[i].image
+        mask = index.mask(results[i].label)
         mask_padded = sp.pad(mask, pad_width=1, mode='constant')
-        temp = spim.distance_transform_edt(mask_padded)
+        temp = edt(mask_padded)
         dt = extract_subsection(temp, shape=mask.shape)
         # ---------------------------------------------------------------------
         # Slice indices
@@ -154,12 +163,12 @@ def regionprops_3D(im):
         # ---------------------------------------------------------------------
         # Create an image of the maximal inscribed sphere
         r = dt.max()
-        inv_dt = spim.distance_transform_edt(dt < r)
+        inv_dt = edt(dt < r)
         results[i].inscribed_sphere = inv_dt < r
         # ---------------------------------------------------------------------
         # Find surface area using marching cubes and analyze the mesh
         tmp = sp.pad(sp.atleast_3d(mask), pad_width=1, mode='constant')
-        tmp = spim.convolve(tmp, weights=ball(1))/5
+        tmp = spim.convolve(tmp, weights=get_strel(1, ndim=3))/5
         verts, faces, norms, vals = marching_cubes_lewiner(volume=tmp, level=0)
         results[i].surface_mesh_vertices = verts
         results[i].surface_mesh_simplices = faces
@@ -0,0 +1,170 @@
+import numpy as np
+import scipy.sparse as sprs
+import scipy.sparse.linalg as spla
+from scipy.sparse.csgraph import connected_components
+from collections import namedtuple
+
+# The boundary labels added by ``snow`` at the inlet and outlet of each axis
+_faces = {2: [[('left', 'right')], [('front', 'back'), ('bottom', 'top')]],
+          3: [[('left', 'right')], [('front', 'back')], [('bottom', 'top')]]}
+
+
+def flow_properties(net, domain_size=None, mu=1.0, solver='direct'):
+    r"""
+    Finds the absolute permeability and formation factor of an extracted
+    network along each axis by solving for the flow through it directly
+
+    Parameters
+    ----------
+    net : dict
+        A network as returned by ``snow``, containing ``'throat.conns'``,
+        ``'pore.inscribed_diameter'``, ``'throat.inscribed_diameter'`` and
+        the ``'throat.conduit_lengths.*'`` arrays.
+    domain_size : array_like
+        The length of the domain along each axis, such as
+        ``np.array(im.shape)*voxel_size``.  Its length sets the number of
+        axes analyzed.  If not given it is estimated from the extent of the
+        pore coordinates, with a 2D domain assumed if all pores lie in the
+        plane ``z = 0``, in which case areas are per unit depth.
+    mu : scalar
+        The viscosity of the fluid.  The default is 1.
+    solver : string
+        The method used to solve the linear system, either ``'direct'``
+        (default), which uses a sparse direct solver, or ``'cg'``, which uses
+        the conjugate gradient method with a diagonal preconditioner and
+        needs less memory for large networks.
+
+    Returns
+    -------
+    result : named_tuple
+        A named-tuple containing ``permeability`` and ``formation_factor``,
+        each an array with one value per axis.  Axes across which the network
+        does not percolate receive ``nan``.
+
+    Notes
+    -----
+    Each throat is treated as three cylinders in series, one in each pore
+    and one in the throat, with lengths given by the conduit lengths and
+    diameters given by the inscribed diameters.  The hydraulic conductance
+    of a cylinder of diameter :math:`D` and length :math:`L` is
+    :math:`\pi D^4 / (128 \mu L)` (Hagen-Poiseuille) and its electrical
+    conductance, for a unit conductivity, is :math:`\pi D^2 / (4 L)`.
+
+    A unit pressure (or voltage) difference is applied between the inlet and
+    outlet pores of each axis, which are those labelled by ``snow`` as being
+    on the corresponding faces, such as ``'pore.left'`` and ``'pore.right'``
+    for the first axis.  If these labels are absent, the pores whose
+    inscribed spheres reach the lowest and highest pore coordinates along the
+    axis are used.  Pores not connected to either are excluded.  The
+    permeability is then :math:`K = Q \mu L / A` and the formation factor is
+    :math:`F = A / (I L)`, where :math:`Q` and :math:`I` are the total flow
+    and current, and :math:`L` and :math:`A` are the length and
+    cross-sectional area of the domain.
+
+    """
+    if solver not in ['direct', 'cg']:
+        raise Exception('Unrecognized solver: ' + solver)
+    conns = np.asarray(net['throat.conns'])
+    coords = np.asarray(net['pore.coords'])
+    Np = coords.shape[0]
+    if domain_size is None:
+        ndim = 2 if np.all(coords[:, 2] == 0) else 3
+        domain_size = np.ptp(coords[:, :ndim], axis=0)
+    domain_size = np.array(domain_size, dtype=float)
+    ndim = domain_size.size
+    g_hyd, g_elec = _conductances(net, mu)
+    perm = np.full(ndim, np.nan)
+    ff = np.full(ndim, np.nan)
+    for ax in range(ndim):
+        inlet, outlet = _boundary_pores(net, ax, ndim)
+        if not (np.any(inlet) and np.any(outlet)):
+            continue
+        L = domain_size[ax]
+        A = np.prod(np.delete(domain_size, ax))
+        Q = _solve_flow(conns, g_hyd, Np, inlet, outlet, solver)
+        current = _solve_flow(conns, g_elec, Np, inlet, outlet, solver)
+        if Q > 0:
+            perm[ax] = Q*mu*L/A
+        if current > 0:
+            ff[ax] = A/(current*L)
+    result = namedtuple('flow_properties', ('permeability',
+                                            'formation_factor'))
+    result.permeability = perm
+    result.formation_factor = ff
+    return result
+
+
+def _conductances(net, mu):
+    r"""
+    Finds the hydraulic and electrical conductance of each throat's conduit
+    of three cylinders in series
+    """
+    cn = np.asarray(net['throat.conns'])
+    Dp = np.asarray(net['pore.inscribed_diameter'])
+    D = [Dp[cn[:, 0]], np.asarray(net['throat.inscribed_diameter']),
+         Dp[cn[:, 1]]]
+    L = [np.asarray(net['throat.conduit_lengths.' + k])
+         for k in ['pore1', 'throat', 'pore2']]
+    r_hyd = np.zeros(cn.shape[0])
+    r_elec = np.zeros(cn.shape[0])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for d, length in zip(D, L):
+            # Segments of zero length add no resistance, even if also of zero
+            # diameter
+            length = np.clip(length, 0, None)
+            r_hyd += np.where(length > 0, 128*mu*length/(np.pi*d**4), 0)
+            r_elec += np.where(length > 0, 4*length/(np.pi*d**2), 0)
+        g_hyd = np.where(r_hyd > 0, 1/r_hyd, np.inf)
+        g_elec = np.where(r_elec > 0, 1/r_elec, np.inf)
+    # Conduits with no resistance at all are given a large finite conductance
+    for g in [g_hyd, g_elec]:
+        finite = np.isfinite(g)
+        big = 1e6*g[finite].max() if np.any(finite) else 1.0
+        g[~finite] = big
+    return g_hyd, g_elec
+
+
+def _boundary_pores(net, ax, ndim):
+    r"""
+    Finds the inlet and outlet pores along axis ``ax``
+    """
+    for a, b in _faces[ndim][ax]:
+        if ('pore.' + a in net) and ('pore.' + b in net):
+            return (np.asarray(net['pore.' + a], dtype=bool),
+                    np.asarray(net['pore.' + b], dtype=bool))
+    x = np.asarray(net['pore.coords'])[:, ax]
+    r = np.asarray(net['pore.inscribed_diameter'])/2
+    return (x - r) <= x.min(), (x + r) >= x.max()
+
+
+def _solve_flow(conns, g, Np, inlet, outlet, solver):
+    r"""
+    Solves for the total flow from ``inlet`` to ``outlet`` under a unit
+    potential difference, given the conductance ``g`` of each throat
+    """
+    outlet = outlet*~inlet
+    W = sprs.coo_matrix((g, (conns[:, 0], conns[:, 1])), shape=(Np, Np))
+    W = (W + W.T).tocsr()
+    # Only pores connected to a boundary take part, otherwise the system is
+    # singular
+    n, labels = connected_components(W, directed=False)
+    keep = np.isin(labels, np.unique(labels[inlet + outlet]))
+    A = (sprs.diags(np.asarray(W.sum(axis=1)).ravel()) - W).tocsr()
+    fixed = inlet + outlet
+    free = keep*~fixed
+    p = np.zeros(Np)
+    p[inlet] = 1.0
+    if np.any(free):
+        A_ff = A[free][:, free]
+        b = -A[free][:, fixed] @ p[fixed]
+        if solver == 'direct':
+            p[free] = spla.spsolve(A_ff.tocsc(), b)
+        else:
+            M = sprs.diags(1/A_ff.diagonal())
+            x, info = spla.cg(A_ff, b, M=M)
+            if info != 0:
+                raise Exception('The conjugate gradient solver did not '
+                                + 'converge')
+            p[free] = x
+    # Total flow out of the inlet pores
+    return (A[inlet] @ p).sum()
@@ -1,12 +1,16 @@
+import os
 import scipy as sp
-import openpnm as op
+import numpy as np
 from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import scipy.ndimage as spim
-from porespy.tools import extend_slice
-import openpnm.models.geometry as op_gm
+from numba import prange
+from porespy.tools import edt, RegionIndex
+from porespy.tools.__numba__ import parallel_kernel
+from porespy.tools.__edt__ import _lower_envelope
 
 
-def regions_to_network(im, dt=None, voxel_size=1):
+def regions_to_network(im, dt=None, voxel_size=1, index=None, executor=None):
     r"""
     Analyzes an image that has been partitioned into pore regions and extracts
     the pore and throat geometry as well as network connectivity.
@@ -27,6 +31,16 @@ def regions_to_network(im, dt=None, voxel_size=1):
         default is 1, which is useful when overlaying the PNM on the original
         image since the scale of the image is alway 1 unit lenth per voxel.
 
+    index : RegionIndex
+        A ``RegionIndex`` of ``im``.  If not given it will be built, but it
+        can save time to provide one if available.
+
+    executor : ThreadPoolExecutor
+        An executor to which chunks of the pore label range are submitted.
+        Each chunk reads the whole of the distance transforms and the index,
+        so only threads, which share them, are accepted.  If not given the
+        pores are processed sequentially.
+
     Returns
     -------
     A dictionary containing all the pore and throat size data, as well as the
@@ -37,129 +51,536 @@ def regions_to_network(im, dt=None, voxel_size=1):
     """
     print('_'*60)
     print('Extracting pore and throat information from image')
-    from skimage.morphology import disk, ball
-    struc_elem = disk if im.ndim == 2 else ball
 
     # if ~sp.any(im == 0):
     #     raise Exception('The received image has no solid phase (0\'s)')
 
+    # Every chunk of pores reads the whole of the maps and the index, which
+    # would have to be copied to worker processes for little gain
+    if (executor is not None) and \
+            not isinstance(executor, ThreadPoolExecutor):
+        raise Exception('executor must be a ThreadPoolExecutor')
+
+    maps, index = _prepare(im, dt, index)
+    dt = maps[0]
+
+    # Extract size information for pores, in chunks if an executor is given
+    Np = index.num_regions
+    if executor is None:
+        chunks = [_pore_props(maps, index, 1, Np + 1)]
+    else:
+        chunks = _pore_props_parallel(maps, index, executor)
+    p_label, p_coords, p_volume, p_dia_local, p_dia_global, p_area_surf = \
+        [sp.concatenate(i) for i in zip(*chunks)]
+
+    # Extract the throat information for the whole image at once
+    t_conns, t_area, t_dia_inscribed, t_perimeter, t_coords = \
+        _throat_props(im, dt, Np)
+
+    # Clean up values
+    net = _pore_dict(p_label, p_coords, p_volume, p_dia_local, p_dia_global,
+                     p_area_surf, voxel_size)
+    net.update(_throat_dict(net, t_conns, t_area, t_dia_inscribed,
+                            t_perimeter, t_coords, voxel_size))
+
+    return net
+
+
+def regions_to_batches(im, dt=None, voxel_size=1, index=None,
+                       batch_size=65536):
+    r"""
+    Extracts the same pore and throat information as ``regions_to_network``
+    but yields it in batches of records rather than returning it all at once
+
+    Parameters
+    ----------
+    im : ND-array
+        An image of the pore space partitioned into individual pore regions.
+        Note that this image must have zeros indicating the solid phase.
+    dt : ND-array
+        The distance transform of the pore space.  If not given it will be
+        calculated, but it can save time to provide one if available.
+    voxel_size : scalar
+        The resolution of the image, expressed as the length of one side of a
+        voxel.  The default is 1.
+    index : RegionIndex
+        A ``RegionIndex`` of ``im``.  If not given it will be built, but it
+        can save time to provide one if available.
+    batch_size : int
+        The number of records in each batch.  The last batch of pores and of
+        throats may be shorter.  The default is 65536.
+
+    Yields
+    ------
+    element, records : tuple
+        ``element`` is either ``'pore'`` or ``'throat'`` and ``records`` is a
+        structured array with one record per pore or throat.  Its fields are
+        the keys of the dictionary returned by ``regions_to_network`` without
+        the ``'pore.'`` or ``'throat.'`` prefix, such as ``'coords'`` or
+        ``'conns'``, and hold the same values.  All pores are yielded first,
+        in order, followed by all throats, in order.
+
+    Notes
+    -----
+    Each batch of pores is analyzed from the voxels of those pores alone,
+    and the throats are found from the voxels of the pores with the smaller
+    label of each pair, so memory use is set by ``batch_size`` rather than by
+    the size of the network.  Only the coordinates and inscribed diameters
+    of the pores, needed for the lengths of the throats, are kept between
+    batches.  This allows the network of a very large image to be written to
+    disk or summarized as it is extracted.
+
+    Examples
+    --------
+    >>> import scipy.ndimage as spim
+    >>> import porespy as ps
+    >>> im = ps.generators.blobs(shape=[50, 50])
+    >>> regions = spim.label(im)[0]
+    >>> volume = 0
+    >>> for element, records in ps.networks.regions_to_batches(regions):
+    ...     if element == 'pore':
+    ...         volume += records['volume'].sum()
+    >>> print(volume == (regions > 0).sum())
+    True
+
+    """
+    batch_size = max(int(batch_size), 1)
+    maps, index = _prepare(im, dt, index)
+    dt = maps[0]
+    Np = index.num_regions
+    bounds = list(range(1, Np + 1, batch_size)) + [Np + 1]
+    pores = {'pore.coords': np.zeros((Np, 3)),
+             'pore.inscribed_diameter': np.zeros(Np)}
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        net = _pore_dict(*_pore_props(maps, index, start, stop),
+                         voxel_size=voxel_size)
+        for k in pores.keys():
+            pores[k][start - 1:stop - 1] = net[k]
+        yield 'pore', _to_records(net, 'pore.')
+    # Throat batches are filled to their full size before being yielded
+    records = None
+    n = 0
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        props = _block_throats(im, dt, index, start, stop)
+        if props[0].shape[0] == 0:
+            continue
+        net = _throat_dict(pores, *props, voxel_size=voxel_size)
+        block = _to_records(net, 'throat.')
+        i = 0
+        while i < block.size:
+            if records is None:
+                records = np.empty(batch_size, dtype=block.dtype)
+                n = 0
+            m = min(block.size - i, batch_size - n)
+            records[n:n + m] = block[i:i + m]
+            n += m
+            i += m
+            if n == batch_size:
+                yield 'throat', records
+                records = None
+    if records is not None:
+        yield 'throat', records[:n]
+
+
+def _prepare(im, dt, index):
+    r"""
+    Finds the distance transform, if not given, the region-wise distance
+    transform and the surface voxels of ``im``, returning them along with
+    its index
+    """
     if dt is None:
-        dt = spim.distance_transform_edt(im > 0)
+        dt = edt(im > 0)
         dt = spim.gaussian_filter(input=dt, sigma=0.5)
 
-    # Get 'slices' into im for each pore region
-    slices = spim.find_objects(im)
-
-    # Initialize arrays
-    Ps = sp.arange(1, sp.amax(im)+1)
-    Np = sp.size(Ps)
-    p_coords = sp.zeros((Np, im.ndim), dtype=float)
-    p_volume = sp.zeros((Np, ), dtype=float)
-    p_dia_local = sp.zeros((Np, ), dtype=float)
-    p_dia_global = sp.zeros((Np, ), dtype=float)
-    p_label = sp.zeros((Np, ), dtype=int)
-    p_area_surf = sp.zeros((Np, ), dtype=int)
-    t_conns = []
-    t_dia_inscribed = []
-    t_area = []
-    t_perimeter = []
-    t_coords = []
-    # dt_shape = sp.array(dt.shape)
-
-    # Start extracting size information for pores and throats
-    for i in tqdm(Ps):
-        pore = i - 1
-        if slices[pore] is None:
-            continue
-        s = extend_slice(slices[pore], im.shape)
-        sub_im = im[s]
-        sub_dt = dt[s]
-        pore_im = sub_im == i
-        padded_mask = sp.pad(pore_im, pad_width=1, mode='constant')
-        pore_dt = spim.distance_transform_edt(padded_mask)
-        s_offset = sp.array([i.start for i in s])
-        p_label[pore] = i
-        # p_coords[pore, :] = spim.center_of_mass(pore_im) + s_offset
-        peaks = sp.vstack(sp.where(pore_dt == pore_dt.max())).T
-        p_coords[pore, :] = peaks[0] + s_offset
-        p_volume[pore] = sp.sum(pore_im)
-        p_dia_local[pore] = 2*sp.amax(pore_dt)
-        p_dia_global[pore] = 2*sp.amax(sub_dt)
-        p_area_surf[pore] = sp.sum(pore_dt == 1)
-        im_w_throats = spim.binary_dilation(input=pore_im, structure=struc_elem(1))
-        im_w_throats = im_w_throats*sub_im
-        Pn = sp.unique(im_w_throats)[1:] - 1
-        for j in Pn:
-            if j > pore:
-                t_conns.append([pore, j])
-                vx = sp.where(im_w_throats == (j + 1))
-                t_dia_inscribed.append(2*sp.amax(sub_dt[vx]))
-                t_perimeter.append(sp.sum(sub_dt[vx] < 2))
-                t_area.append(sp.size(vx[0]))
-                t_inds = tuple([i+j for i, j in zip(vx, s_offset)])
-                temp = sp.where(dt[t_inds] == sp.amax(dt[t_inds]))[0][0]
-                if im.ndim == 2:
-                    t_coords.append(tuple((t_inds[0][temp],
-                                           t_inds[1][temp])))
-                else:
-                    t_coords.append(tuple((t_inds[0][temp],
-                                           t_inds[1][temp],
-                                           t_inds[2][temp])))
-    # Clean up values
-    Nt = len(t_dia_inscribed)  # Get number of throats
-    if im.ndim == 2:  # If 2D, add 0's in 3rd dimension
-        p_coords = sp.vstack((p_coords.T, sp.zeros((Np, )))).T
-        t_coords = sp.vstack((sp.array(t_coords).T, sp.zeros((Nt, )))).T
+    # Index the voxels of each pore region
+    if index is None:
+        index = RegionIndex(im)
+
+    # Find the distance of each voxel from the nearest voxel outside its own
+    # region, with the voxels on each region's surface lying 1 voxel away
+    dt_local = _region_edt(im)
+    surface = dt_local == 1
+    return [dt, dt_local, surface], index
+
 
+def _to_records(net, prefix):
+    r"""
+    Packs the arrays of a network dictionary whose keys start with
+    ``prefix`` into a structured array, leaving out the ``'all'`` label
+    """
+    keys = [k for k in net.keys() if k.startswith(prefix)
+            and k != prefix + 'all']
+    arrays = [np.asarray(net[k]) for k in keys]
+    dtype = [(k[len(prefix):], a.dtype, a.shape[1:])
+             for k, a in zip(keys, arrays)]
+    N = arrays[0].shape[0] if arrays else 0
+    records = np.empty(N, dtype=dtype)
+    for k, a in zip(keys, arrays):
+        records[k[len(prefix):]] = a
+    return records
+
+
+def _pore_dict(p_label, p_coords, p_volume, p_dia_local, p_dia_global,
+               p_area_surf, voxel_size=1):
+    r"""
+    Converts the pore properties found by ``_pore_props``, in voxels, into
+    the ``pore.*`` entries of the network dictionary
+    """
+    Np = len(p_label)
+    if p_coords.shape[1] == 2:  # If 2D, add 0's in 3rd dimension
+        p_coords = sp.vstack((p_coords.T, sp.zeros((Np, )))).T
     net = {}
     net['pore.all'] = sp.ones((Np, ), dtype=bool)
-    net['throat.all'] = sp.ones((Nt, ), dtype=bool)
     net['pore.coords'] = sp.copy(p_coords)*voxel_size
     net['pore.centroid'] = sp.copy(p_coords)*voxel_size
-    net['throat.centroid'] = sp.array(t_coords)*voxel_size
-    net['throat.conns'] = sp.array(t_conns)
     net['pore.label'] = sp.array(p_label)
     net['pore.volume'] = sp.copy(p_volume)*(voxel_size**3)
-    net['throat.volume'] = sp.zeros((Nt, ), dtype=float)
     net['pore.diameter'] = sp.copy(p_dia_local)*voxel_size
     net['pore.inscribed_diameter'] = sp.copy(p_dia_local)*voxel_size
     net['pore.equivalent_diameter'] = 2*((3/4*net['pore.volume']/sp.pi)**(1/3))
     net['pore.extended_diameter'] = sp.copy(p_dia_global)*voxel_size
     net['pore.surface_area'] = sp.copy(p_area_surf)*(voxel_size)**2
+    net['pore.area'] = sp.pi/4*net['pore.diameter']**2
+    return net
+
+
+def _throat_dict(pores, t_conns, t_area, t_dia_inscribed, t_perimeter,
+                 t_coords, voxel_size=1):
+    r"""
+    Converts the throat properties found by ``_throat_props``, in voxels,
+    into the ``throat.*`` entries of the network dictionary, using the
+    ``pore.coords`` and ``pore.inscribed_diameter`` of the pores in ``pores``
+    """
+    Nt = len(t_dia_inscribed)  # Get number of throats
+    t_coords = sp.array(t_coords).reshape(Nt, -1)
+    if t_coords.shape[1] == 2:  # If 2D, add 0's in 3rd dimension
+        t_coords = sp.vstack((t_coords.T, sp.zeros((Nt, )))).T
+    net = {}
+    net['throat.all'] = sp.ones((Nt, ), dtype=bool)
+    net['throat.centroid'] = sp.array(t_coords)*voxel_size
+    net['throat.conns'] = sp.array(t_conns).reshape(Nt, 2)
+    net['throat.volume'] = sp.zeros((Nt, ), dtype=float)
     net['throat.diameter'] = sp.array(t_dia_inscribed)*voxel_size
     net['throat.inscribed_diameter'] = sp.array(t_dia_inscribed)*voxel_size
     net['throat.area'] = sp.array(t_area)*(voxel_size**2)
     net['throat.perimeter'] = sp.array(t_perimeter)*voxel_size
     net['throat.equivalent_diameter'] = (sp.array(t_area) * (voxel_size**2))**0.5
     P12 = net['throat.conns']
-    PT1 = sp.sqrt(sp.sum(((p_coords[P12[:, 0]]-t_coords) * voxel_size)**2, axis=1))
-    PT2 = sp.sqrt(sp.sum(((p_coords[P12[:, 1]]-t_coords) * voxel_size)**2, axis=1))
+    xyz = pores['pore.coords']
+    dia = pores['pore.inscribed_diameter']
+    TC = net['throat.centroid']
+    PT1 = sp.sqrt(sp.sum((xyz[P12[:, 0]] - TC)**2, axis=1))
+    PT2 = sp.sqrt(sp.sum((xyz[P12[:, 1]] - TC)**2, axis=1))
     net['throat.total_length'] = PT1 + PT2
-    PT1 = PT1-p_dia_local[P12[:, 0]]/2*voxel_size
-    PT2 = PT2-p_dia_local[P12[:, 1]]/2*voxel_size
+    PT1 = PT1 - dia[P12[:, 0]]/2
+    PT2 = PT2 - dia[P12[:, 1]]/2
     net['throat.length'] = PT1 + PT2
-    dist = (p_coords[P12[:, 0]]-p_coords[P12[:, 1]])*voxel_size
+    dist = xyz[P12[:, 0]] - xyz[P12[:, 1]]
     net['throat.direct_length'] = sp.sqrt(sp.sum(dist**2, axis=1))
-    # Make a dummy openpnm network to get the conduit lengths
-    pn = op.network.GenericNetwork()
-    pn.update(net)
-    pn.add_model(propname='throat.endpoints',
-                 model=op_gm.throat_endpoints.spherical_pores,
-                 pore_diameter='pore.inscribed_diameter',
-                 throat_diameter='throat.inscribed_diameter')
-    pn.add_model(propname='throat.conduit_lengths',
-                 model=op_gm.throat_length.conduit_lengths)
-    pn.add_model(propname='pore.area',
-                 model=op_gm.pore_area.sphere)
-    net['throat.endpoints.head'] = pn['throat.endpoints.head']
-    net['throat.endpoints.tail'] = pn['throat.endpoints.tail']
-    net['throat.conduit_lengths.pore1'] = pn['throat.conduit_lengths.pore1']
-    net['throat.conduit_lengths.pore2'] = pn['throat.conduit_lengths.pore2']
-    net['throat.conduit_lengths.throat'] = pn['throat.conduit_lengths.throat']
-    net['pore.area'] = pn['pore.area']
-    prj = pn.project
-    prj.clear()
-    wrk = op.Workspace()
-    wrk.close_project(prj)
-
+    # Find the conduit lengths as done by the equivalent OpenPNM models
+    temp = dict(net)
+    temp['pore.coords'] = xyz
+    temp['pore.inscribed_diameter'] = dia
+    EP1, EP2 = _spherical_pore_endpoints(temp)
+    net['throat.endpoints.head'] = EP1
+    net['throat.endpoints.tail'] = EP2
+    C1 = xyz[P12[:, 0]]
+    C2 = xyz[P12[:, 1]]
+    net['throat.conduit_lengths.pore1'] = np.sqrt(((C1 - EP1)**2).sum(axis=1))
+    net['throat.conduit_lengths.pore2'] = np.sqrt(((C2 - EP2)**2).sum(axis=1))
+    net['throat.conduit_lengths.throat'] = sp.copy(net['throat.length'])
     return net
+
+
+def _spherical_pore_endpoints(net):
+    r"""
+    Finds the points where each throat meets the spherical pores at either
+    end, matching OpenPNM's ``throat_endpoints.spherical_pores`` model with
+    the inscribed pore and throat diameters
+    """
+    xyz = net['pore.coords']
+    cn = net['throat.conns']
+    D1 = net['pore.inscribed_diameter'][cn[:, 0]]
+    D2 = net['pore.inscribed_diameter'][cn[:, 1]]
+    Dt = net['throat.inscribed_diameter']
+    L = np.sqrt(((xyz[cn[:, 0]] - xyz[cn[:, 1]])**2).sum(axis=1)) + 1e-15
+    # Distance from each pore center to where the throat enters it.  The
+    # arguments of the square roots are clipped since both branches of the
+    # where are evaluated.
+    L1 = np.where(Dt > D1, D1/2, np.sqrt(np.clip(D1**2 - Dt**2, 0, None))/2)
+    L2 = np.where(Dt > D2, D2/2, np.sqrt(np.clip(D2**2 - Dt**2, 0, None))/2)
+    # The throats need not lie on the line joining the pore centers
+    TC = net['throat.centroid']
+    P1T = TC - xyz[cn[:, 0]]
+    P2T = TC - xyz[cn[:, 1]]
+    P1T = P1T/(np.sqrt((P1T**2).sum(axis=1)) + 1e-15)[:, None]
+    P2T = P2T/(np.sqrt((P2T**2).sum(axis=1)) + 1e-15)[:, None]
+    EP1 = xyz[cn[:, 0]] + L1[:, None]*P1T
+    EP2 = xyz[cn[:, 1]] + L2[:, None]*P2T
+    # Throats between overlapping pores end where the spheres intersect.  For
+    # spheres that do not intersect h is 0, so the mask below excludes them.
+    L1 = (4*L**2 + D1**2 - D2**2)/(8*L)
+    L2 = (4*L**2 + D2**2 - D1**2)/(8*L)
+    h = 2*np.sqrt(np.clip(D1**2/4 - L1**2, 0, None))
+    mask = (L - 0.5*(D1 + D2) < 0)*(Dt < h)
+    EP1[mask] = (xyz[cn[:, 0]] + L1[:, None]*P1T)[mask]
+    EP2[mask] = (xyz[cn[:, 1]] + L2[:, None]*P2T)[mask]
+    return EP1, EP2
+
+
+def _region_edt(im):
+    r"""
+    Finds the exact distance from each voxel of each region to the nearest
+    voxel outside it, whether in another region, the solid or beyond the
+    edge of the image, as a padded transform of each region alone would
+
+    Notes
+    -----
+    The passes are those of ``edt``, except that the parabolas along each
+    line are only taken over the run of voxels sharing a label, bounded by
+    the voxels on either side of the run.  The voxel outside a region that
+    is nearest to one inside it always shares a face with the region, so
+    the run ends hold the nearest outside voxel along every line.
+    """
+    ndim = im.ndim
+    shape3 = (1, )*(3 - ndim) + im.shape
+    labels = np.ascontiguousarray(im).reshape(shape3)
+    dt = np.empty(shape3, dtype=float)
+    _region_first_pass(labels, dt)
+    if ndim > 1:
+        _region_pass(labels, dt)
+    if ndim > 2:
+        _region_pass(labels.transpose(1, 0, 2), dt.transpose(1, 0, 2))
+    return np.sqrt(dt).reshape(im.shape)
+
+
+@parallel_kernel
+def _region_first_pass(labels, dt):
+    nx, ny, nz = labels.shape
+    for i in prange(nx):
+        for j in range(ny):
+            a = 0
+            while a < nz:
+                label = labels[i, j, a]
+                b = a + 1
+                while (b < nz) and (labels[i, j, b] == label):
+                    b += 1
+                for k in range(a, b):
+                    if label == 0:
+                        dt[i, j, k] = 0
+                    else:
+                        dt[i, j, k] = min(k - a + 1, b - k)**2
+                a = b
+
+
+@parallel_kernel
+def _region_pass(labels, dt):
+    nx, ny, nz = dt.shape
+    for i in prange(nx):
+        f = np.empty(ny + 2, dtype=np.float64)
+        g = np.empty(ny + 2, dtype=np.float64)
+        v = np.empty(ny + 2, dtype=np.int64)
+        z = np.empty(ny + 3, dtype=np.float64)
+        for k in range(nz):
+            a = 0
+            while a < ny:
+                label = labels[i, a, k]
+                b = a + 1
+                while (b < ny) and (labels[i, b, k] == label):
+                    b += 1
+                if label != 0:
+                    # The voxels either side of the run are roots at 0
+                    n = b - a + 2
+                    f[0] = 0
+                    f[n - 1] = 0
+                    for q in range(a, b):
+                        f[q - a + 1] = dt[i, q, k]
+                    _lower_envelope(f[:n], g[:n], v, z)
+                    for q in range(a, b):
+                        dt[i, q, k] = g[q - a + 1]
+                a = b
+
+
+def _pore_props(maps, index, start, stop):
+    r"""
+    Computes the size information of the pores labelled ``start`` to
+    ``stop - 1`` from the global ``dt``, region-wise distance transform and
+    surface images in ``maps``, returning a tuple of arrays with one entry
+    per pore
+    """
+    dt, dt_local, surface = maps
+    N = stop - start
+    ndim = len(index.shape)
+    p_coords = np.zeros((N, ndim), dtype=float)
+    p_dia_local = np.zeros((N, ), dtype=float)
+    p_dia_global = np.zeros((N, ), dtype=float)
+    p_area_surf = np.zeros((N, ), dtype=int)
+    counts = index.counts[start - 1:stop - 1]
+    full = counts > 0
+    p_label = np.where(full, np.arange(start, stop), 0)
+    p_volume = counts.astype(float)
+    if not np.any(full):
+        return (p_label, p_coords, p_volume, p_dia_local, p_dia_global,
+                p_area_surf)
+    lo, hi = index.offsets[start - 1], index.offsets[stop - 1]
+    voxels = index.voxels[lo:hi]
+    starts = index.offsets[start - 1:stop - 1][full] - lo
+    vals = dt_local.reshape(-1)[voxels]
+    dt_max = np.zeros((N, ), dtype=float)
+    dt_max[full] = np.maximum.reduceat(vals, starts)
+    p_dia_local[full] = 2*dt_max[full]
+    # The center is the first voxel of each region at which it is widest
+    group = np.repeat(np.arange(N), counts)
+    hits = np.flatnonzero(vals == dt_max[group])
+    first = hits[np.unique(group[hits], return_index=True)[1]]
+    p_coords[group[first]] = np.vstack(np.unravel_index(voxels[first],
+                                                        index.shape)).T
+    p_area_surf[full] = np.add.reduceat(
+        surface.reshape(-1)[voxels].astype(int), starts)
+    p_dia_global[full] = 2*_bbox_max(dt, index.bbox[start - 1:stop - 1][full])
+    return p_label, p_coords, p_volume, p_dia_local, p_dia_global, p_area_surf
+
+
+def _bbox_max(dt, bbox):
+    r"""
+    Finds the largest value of ``dt`` in each bounding box, after extending
+    the boxes by 1 voxel on all sides
+    """
+    ndim = dt.ndim
+    shape3 = (1, )*(3 - ndim) + dt.shape
+    bbox3 = np.zeros((bbox.shape[0], 6), dtype=np.int64)
+    bbox3[:, 3:6] = 1
+    bbox3[:, 3 - ndim:3] = np.maximum(bbox[:, :ndim] - 1, 0)
+    bbox3[:, 6 - ndim:] = np.minimum(bbox[:, ndim:] + 1, dt.shape)
+    out = np.zeros((bbox.shape[0], ), dtype=float)
+    _bbox_max_kernel(dt.reshape(shape3), bbox3, out)
+    return out
+
+
+@parallel_kernel
+def _bbox_max_kernel(dt, bbox, out):
+    for n in prange(bbox.shape[0]):
+        m = -np.inf
+        for i in range(bbox[n, 0], bbox[n, 3]):
+            for j in range(bbox[n, 1], bbox[n, 4]):
+                for k in range(bbox[n, 2], bbox[n, 5]):
+                    m = max(m, dt[i, j, k])
+        out[n] = m
+
+
+def _pore_props_parallel(maps, index, executor):
+    r"""
+    Splits the pore labels into chunks and submits each to ``executor``,
+    returning the results of ``_pore_props`` in label order
+    """
+    Np = index.num_regions
+    nchunks = max(min(Np, 4*(os.cpu_count() or 1)), 1)
+    bounds = sp.linspace(1, Np + 1, nchunks + 1).astype(int)
+    futures = {executor.submit(_pore_props, maps, index, a, b): n
+               for n, (a, b) in enumerate(zip(bounds[:-1], bounds[1:]))}
+    chunks = [None]*nchunks
+    for f in tqdm(as_completed(futures), total=nchunks):
+        chunks[futures[f]] = f.result()
+    return chunks
+
+
+def _throat_props(im, dt, Np):
+    r"""
+    Finds the throats between all pairs of face-adjacent regions in ``im``
+    and their properties, using shifted comparisons of the whole image.
+
+    The throat between regions ``a < b`` consists of the voxels of ``b`` that
+    share a face with ``a``.  Throats are returned sorted by ``(a, b)``.
+
+    Returns
+    -------
+    conns, area, inscribed_diameter, perimeter, coords : tuple of ND-arrays
+        The zero-based pore indices of each throat, its area in voxels, twice
+        the largest value of ``dt`` in it, the number of its voxels where
+        ``dt`` is less than 2, and the coordinates of the first voxel where
+        ``dt`` is largest.
+    """
+    keys = []
+    voxels = []
+    for ax in range(im.ndim):
+        lo = tuple([slice(0, -1) if i == ax else slice(None)
+                    for i in range(im.ndim)])
+        hi = tuple([slice(1, None) if i == ax else slice(None)
+                    for i in range(im.ndim)])
+        a = im[lo]
+        b = im[hi]
+        mask = (a != b)*(a > 0)*(b > 0)
+        coords = np.nonzero(mask)
+        a = a[mask].astype(np.int64)
+        b = b[mask].astype(np.int64)
+        # The throat voxel is the one belonging to the larger label
+        shift = np.zeros((im.ndim, 1), dtype=np.int64)
+        shift[ax] = 1
+        coords = np.array(coords, dtype=np.int64) + shift*(b > a)
+        voxels.append(np.ravel_multi_index(coords, im.shape))
+        keys.append((np.minimum(a, b) - 1)*Np + np.maximum(a, b) - 1)
+    return _group_throats(np.concatenate(keys), np.concatenate(voxels), dt,
+                          Np)
+
+
+def _block_throats(im, dt, index, start, stop):
+    r"""
+    Finds the throats whose smaller pore label is between ``start`` and
+    ``stop - 1`` and their properties, from the voxels of those pores alone,
+    returning the same values as ``_throat_props`` does for these throats
+    """
+    Np = index.num_regions
+    lo, hi = index.offsets[start - 1], index.offsets[stop - 1]
+    voxels = index.voxels[lo:hi].astype(np.int64)
+    labels = np.repeat(np.arange(start, stop, dtype=np.int64),
+                       index.counts[start - 1:stop - 1])
+    coords = np.unravel_index(voxels, im.shape)
+    flat = im.reshape(-1)
+    keys = []
+    nbrs = []
+    for ax in range(im.ndim):
+        stride = int(np.prod(im.shape[ax + 1:]))
+        for step in [-1, 1]:
+            c = coords[ax] + step
+            ok = (c >= 0)*(c < im.shape[ax])
+            nb = voxels[ok] + step*stride
+            a = labels[ok]
+            b = flat[nb].astype(np.int64)
+            # The throat voxel is the neighbor belonging to the larger label
+            mask = b > a
+            keys.append((a[mask] - 1)*Np + b[mask] - 1)
+            nbrs.append(nb[mask])
+    return _group_throats(np.concatenate(keys), np.concatenate(nbrs), dt,
+                          Np)
+
+
+def _group_throats(keys, voxels, dt, Np):
+    r"""
+    Reduces the throat voxels, given as the key ``(a - 1)*Np + b - 1`` of
+    their throat and their flat index in ``dt``, to the properties returned
+    by ``_throat_props``
+    """
+    if keys.size == 0:
+        return (np.zeros((0, 2), dtype=int), np.zeros(0, dtype=int),
+                np.zeros(0), np.zeros(0, dtype=int),
+                np.zeros((0, dt.ndim), dtype=int))
+    # Sort by throat then voxel, and remove voxels counted via several faces
+    order = np.lexsort((voxels, keys))
+    keys = keys[order]
+    voxels = voxels[order]
+    keep = np.ones(keys.size, dtype=bool)
+    keep[1:] = (keys[1:] != keys[:-1]) + (voxels[1:] != voxels[:-1])
+    keys = keys[keep]
+    voxels = voxels[keep]
+    # Group the voxels of each throat
+    keys, starts = np.unique(keys, return_index=True)
+    area = np.diff(np.append(starts, voxels.size))
+    vals = dt.reshape(-1)[voxels]
+    dt_max = np.maximum.reduceat(vals, starts)
+    perimeter = np.add.reduceat((vals < 2).astype(int), starts)
+    group = np.repeat(np.arange(keys.size), area)
+    hits = np.flatnonzero(vals == dt_max[group])
+    first = hits[np.unique(group[hits], return_index=True)[1]]
+    coords = np.vstack(np.unravel_index(voxels[first], dt.shape)).T
+    conns = np.vstack((keys // Np, keys % Np)).T
+    return conns, area, 2*dt_max, perimeter, coords
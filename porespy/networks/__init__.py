@@ -10,25 +10,42 @@ Contains functions for analysing images as pore networks
 
 .. autosummary::
 
+    porespy.networks.Network
     porespy.networks.add_boundary_regions
     porespy.networks.snow
     porespy.networks.snow_dual
+    porespy.networks.snow_update
     porespy.networks.regions_to_network
+    porespy.networks.regions_to_batches
     porespy.networks.map_to_regions
+    porespy.networks.map_to_regions_batch
+    porespy.networks.flow_properties
     porespy.networks.generate_voxel_image
 
+.. autoclass:: Network
+   :members:
+
 .. autofunction:: snow
 .. autofunction:: snow_dual
+.. autofunction:: snow_update
 .. autofunction:: regions_to_network
+.. autofunction:: regions_to_batches
 .. autofunction:: add_boundary_regions
 .. autofunction:: map_to_regions
+.. autofunction:: map_to_regions_batch
+.. autofunction:: flow_properties
 .. autofunction:: generate_voxel_image
 
 """
 
+from .__network__ import Network
 from .__funcs__ import add_boundary_regions
 from .__funcs__ import map_to_regions
+from .__funcs__ import map_to_regions_batch
 from .__funcs__ import generate_voxel_image
 from .__getnet__ import regions_to_network
+from .__getnet__ import regions_to_batches
 from .__snow__ import snow
 from .__snow_dual__ import snow_dual
+from .__snow_update__ import snow_update
+from .__flow__ import flow_properties
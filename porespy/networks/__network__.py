@@ -0,0 +1,272 @@
+import os
+import json
+import weakref
+import numpy as np
+
+_magic = b'\x93PSNET\x01\n'
+_align = 64
+
+
+class Network(dict):
+    r"""
+    A dictionary of pore and throat arrays, as returned by ``snow`` and
+    related functions, which also refers to the images it was extracted from
+
+    Each key holds a single array, such as ``'pore.coords'`` or
+    ``'throat.conns'``, so a ``Network`` can be passed anywhere a ``dict``
+    of arrays is expected, such as to the ``update`` method of an OpenPNM
+    network.  The images are available as attributes, such as ``net.regions``,
+    but are held separately from the arrays so that they need not be kept in
+    memory for as long as the network is.
+
+    Parameters
+    ----------
+    *args, **kwargs
+        Passed to ``dict`` to initialize the arrays.
+
+    Notes
+    -----
+    Images can be attached in one of three ways using ``set_image``:
+
+    **Strong** - The image is held in memory for as long as the network is.
+    This is what assigning an array to an attribute does, as in
+    ``net.regions = regions``.
+
+    **Weak** - The network refers to the image only while it is in use
+    elsewhere, after which the attribute is removed.
+
+    **File** - The network records the path of a ``.npy`` file, which is
+    memory-mapped each time the attribute is accessed so only the parts of
+    the image that are used are read from disk.
+
+    A network and its images can be written to a single columnar file with
+    ``save``, and read back with ``Network.load``, which maps each array from
+    the file rather than reading it.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> import porespy as ps
+    >>> net = ps.networks.Network({'pore.volume': np.ones(3)})
+    >>> net.dt = np.zeros([5, 5])
+    >>> print(net.images)
+    ['dt']
+    >>> net = net.compact()
+    >>> print(net['pore.volume'].dtype)
+    float32
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.__dict__['_images'] = {}
+
+    def __getattr__(self, name):
+        images = self.__dict__.get('_images', {})
+        if name in images:
+            im = _resolve(images[name])
+            if im is not None:
+                return im
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        if isinstance(value, np.ndarray):
+            self.set_image(name, value)
+        else:
+            super().__setattr__(name, value)
+
+    def __delattr__(self, name):
+        if name in self._images:
+            del self._images[name]
+        else:
+            super().__delattr__(name)
+
+    def __getstate__(self):
+        # Weak references cannot be pickled so are dropped
+        state = dict(self.__dict__)
+        state['_images'] = {k: v for k, v in self._images.items()
+                            if v[0] != 'weak'}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    @property
+    def images(self):
+        r"""
+        The names of the images that can currently be accessed as attributes
+        """
+        return [k for k, v in self._images.items()
+                if _resolve(v) is not None]
+
+    def set_image(self, name, image, weak=False):
+        r"""
+        Attaches an image to the network as an attribute
+
+        Parameters
+        ----------
+        name : string
+            The name of the attribute, such as ``'regions'``.
+        image : ND-array or string
+            The image, or the path to a ``.npy`` file containing it.  If
+            ``None`` the image is removed.
+        weak : boolean
+            If ``True`` only a weak reference to the image is kept, so it is
+            removed from the network once it is no longer in use elsewhere.
+            The default is ``False``.  This is ignored if ``image`` is a path.
+
+        """
+        if image is None:
+            self._images.pop(name, None)
+        elif isinstance(image, (str, os.PathLike)):
+            self._images[name] = ('file', os.fspath(image))
+        elif weak:
+            self._images[name] = ('weak', weakref.ref(image))
+        else:
+            self._images[name] = ('array', image)
+
+    def compact(self, float_dtype=np.float32, int_dtype=np.int32):
+        r"""
+        Returns a copy of the network with its arrays stored in smaller types
+
+        Parameters
+        ----------
+        float_dtype : data-type
+            The type to which floating point arrays are converted.  The
+            default is ``float32``.
+        int_dtype : data-type
+            The type to which integer arrays are converted.  Arrays whose
+            values do not fit in this type are left unchanged.  The default is
+            ``int32``.
+
+        Returns
+        -------
+        network : Network
+            A new network sharing the images of this one.
+
+        """
+        info = np.iinfo(int_dtype)
+        net = Network()
+        for k, v in self.items():
+            v = np.asarray(v)
+            if v.dtype.kind == 'f':
+                v = v.astype(float_dtype, copy=False)
+            elif (v.dtype.kind in 'iu') and (v.size > 0):
+                if (v.min() >= info.min) and (v.max() <= info.max):
+                    v = v.astype(int_dtype, copy=False)
+            net[k] = v
+        net._images.update(self._images)
+        return net
+
+    def save(self, filename, images=False):
+        r"""
+        Writes the network to a single file from which each array can be
+        memory-mapped by ``Network.load``
+
+        Parameters
+        ----------
+        filename : string or path object
+            The name and location of the file.
+        images : boolean
+            If ``True`` the images held in memory are written to the file as
+            well.  The default is ``False``, in which case only images that
+            refer to files are kept, by recording their paths.
+
+        """
+        columns = []
+        arrays = []
+        offset = 0
+        for kind, items in [('key', self.items()),
+                            ('image', self._images.items())]:
+            for k, v in items:
+                if kind == 'image':
+                    if v[0] == 'file':
+                        columns.append({'kind': 'file', 'name': k,
+                                        'path': v[1]})
+                        continue
+                    v = _resolve(v)
+                    if (v is None) or not images:
+                        continue
+                v = np.ascontiguousarray(v)
+                if v.dtype.hasobject:
+                    raise Exception(k + ' is not an array of numbers')
+                offset = -(-offset // _align)*_align
+                columns.append({'kind': kind, 'name': k,
+                                'dtype': v.dtype.str, 'shape': v.shape,
+                                'offset': offset})
+                arrays.append(v)
+                offset += v.nbytes
+        header = json.dumps({'columns': columns}).encode()
+        start = -(-(len(_magic) + 8 + len(header)) // _align)*_align
+        with open(filename, 'wb') as f:
+            f.write(_magic)
+            f.write(np.uint64(len(header)).tobytes())
+            f.write(header)
+            for col, arr in zip([c for c in columns if c['kind'] != 'file'],
+                                arrays):
+                f.seek(start + col['offset'])
+                f.write(arr.tobytes())
+            f.truncate(start + offset)
+
+    @classmethod
+    def load(cls, filename, mmap_mode='c'):
+        r"""
+        Reads a network written by ``save``
+
+        Parameters
+        ----------
+        filename : string or path object
+            The name and location of the file.
+        mmap_mode : string
+            The mode with which the arrays are mapped, as used by
+            ``numpy.memmap``.  The default is ``'c'`` (copy-on-write), so the
+            arrays can be modified without changing the file.  If ``None`` the
+            arrays are read into memory.
+
+        Returns
+        -------
+        network : Network
+            The network, with its images attached.
+
+        """
+        with open(filename, 'rb') as f:
+            if f.read(len(_magic)) != _magic:
+                raise Exception(str(filename) + ' is not a saved network')
+            n = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+            header = json.loads(f.read(n).decode())
+        start = -(-(len(_magic) + 8 + n) // _align)*_align
+        net = cls()
+        for col in header['columns']:
+            if col['kind'] == 'file':
+                net.set_image(col['name'], col['path'])
+                continue
+            dtype = np.dtype(col['dtype'])
+            shape = tuple(col['shape'])
+            if (mmap_mode is None) or (np.prod(shape) == 0):
+                # Empty arrays cannot be mapped, so are read as usual
+                arr = np.fromfile(filename, dtype=dtype,
+                                  count=int(np.prod(shape)),
+                                  offset=start + col['offset']).reshape(shape)
+            else:
+                arr = np.memmap(filename, dtype=dtype, mode=mmap_mode,
+                                offset=start + col['offset'], shape=shape)
+            if col['kind'] == 'key':
+                net[col['name']] = arr
+            else:
+                net.set_image(col['name'], arr)
+        return net
+
+
+def _resolve(ref):
+    r"""
+    Returns the image an entry of ``Network._images`` refers to, or ``None``
+    if it has been discarded
+    """
+    kind, val = ref
+    if kind == 'array':
+        return val
+    if kind == 'weak':
+        return val()
+    if os.path.exists(val):
+        return np.load(val, mmap_mode='r')
+    return None
@@ -1,13 +1,19 @@
 from porespy.networks import regions_to_network, add_boundary_regions
+from porespy.networks import Network
 from porespy.filters import snow_partitioning
-from porespy.tools import make_contiguous
-from porespy.metrics import region_surface_areas, region_interface_areas
+from porespy.tools import make_contiguous, RegionIndex, edt
+from porespy.tools import subdivide, extend_slice
+from porespy.tools.__cache__ import cached
+from porespy.metrics import region_areas
+from collections import namedtuple
+import numpy as np
 import scipy as sp
 
 
+@cached(ignore=['executor'])
 def snow(im, voxel_size=1,
          boundary_faces=['top', 'bottom', 'left', 'right', 'front', 'back'],
-         marching_cubes_area=False):
+         marching_cubes_area=False, divs=None, overlap=None, executor=None):
     r"""
     Analyzes an image that has been partitioned into void and solid regions
     and extracts the void and solid phase geometry as well as network
@@ -33,9 +39,25 @@ def snow(im, voxel_size=1,
     marching_cubes_area : bool
         If ``True`` then the surface area and interfacial area between regions
         will be using the marching cube algorithm. This is a more accurate
-        representation of area in extracted network, but is quite slow, so
-        it is ``False`` by default.  The default method simply counts voxels
-        so does not correctly account for the voxelated nature of the images.
+        representation of area in extracted network.  All areas are found in
+        a single sweep over the image by ``porespy.metrics.region_areas``.
+        It is ``False`` by default, in which case the areas are found by
+        simply counting voxels so do not correctly account for the voxelated
+        nature of the images.
+    divs : scalar or array_like
+        If given, the image is partitioned into pores tile-by-tile rather than
+        all at once, using the number of tiles in each axis given, as used by
+        ``porespy.tools.subdivide``.  See Notes.
+    overlap : int
+        The number of voxels by which each tile is extended on all sides when
+        ``divs`` is given.  It should be larger than the largest pore radius.
+        The default is twice the maximum of the distance transform of ``im``.
+    executor : concurrent.futures.Executor
+        An executor, such as a ``ProcessPoolExecutor``, to which the tiles are
+        submitted when ``divs`` is given.  If not given the tiles are
+        processed sequentially.  Process pools must use the spawn or
+        forkserver start method, since the numba kernels raise an exception
+        in workers forked from a process that has already launched them.
 
     Returns
     -------
@@ -43,11 +65,33 @@ def snow(im, voxel_size=1,
     topological information.  The dictionary names use the OpenPNM
     convention (i.e. 'pore.coords', 'throat.conns') so it may be converted
     directly to an OpenPNM network object using the ``update`` command.
+    It is a ``Network``, so the images used in the extraction are available
+    as the attributes ``im``, ``dt``, ``regions`` and ``peaks``, and can be
+    released with ``set_image`` or saved alongside the network with
+    ``save``.
+
+    Notes
+    -----
+    When ``divs`` is given each tile, extended by ``overlap``, is partitioned
+    separately and keeps only the pores whose peaks lie in the tile itself.
+    Each voxel is then labelled as its own tile partitioned it, with pores
+    that spill into the tile from a neighbor identified by the location of
+    their peak, which stitches the tiles into one image of pore regions with
+    globally unique labels.  The network is then extracted
+    from the stitched image as usual, so throats crossing the seams are
+    found exactly once.  With a sufficient ``overlap`` the result matches
+    that of partitioning the whole image at once, apart from the order of the
+    pores.
+
     """
 
     # -------------------------------------------------------------------------
     # SNOW void phase
-    tup = snow_partitioning(im=im, return_all=True)
+    if divs is None:
+        tup = snow_partitioning(im=im, return_all=True)
+    else:
+        tup = _snow_partitioning_tiled(im=im, divs=divs, overlap=overlap,
+                                       executor=executor)
     im = tup.im
     dt = tup.dt
     regions = tup.regions
@@ -60,32 +104,24 @@ def snow(im, voxel_size=1,
     # Padding distance transform to extract geometrical properties
     f = boundary_faces
     if f is not None:
-        if im.ndim == 2:
-            faces = [(int('left' in f)*3, int('right' in f)*3),
-                     (int(('front') in f)*3 or int(('bottom') in f)*3,
-                      int(('back') in f)*3 or int(('top') in f)*3)]
-
-        if im.ndim == 3:
-            faces = [(int('left' in f)*3, int('right' in f)*3),
-                     (int('front' in f)*3, int('back' in f)*3),
-                     (int('top' in f)*3, int('bottom' in f)*3)]
+        faces = _face_pads(im.ndim, f)
         dt = sp.pad(dt, pad_width=faces, mode='edge')
         im = sp.pad(im, pad_width=faces, mode='edge')
     else:
         dt = dt
     regions = regions*im
-    regions = make_contiguous(regions)
+    regions = make_contiguous(regions, inplace=True)
     # -------------------------------------------------------------------------
     # Extract void and throat information from image
-    net = regions_to_network(im=regions, dt=dt, voxel_size=voxel_size)
+    index = RegionIndex(regions)
+    net = regions_to_network(im=regions, dt=dt, voxel_size=voxel_size,
+                             index=index)
     # -------------------------------------------------------------------------
     # Extract marching cube surface area and interfacial area of regions
     if marching_cubes_area:
-        areas = region_surface_areas(regions=regions)
-        interface_area = region_interface_areas(regions=regions, areas=areas,
-                                                voxel_size=voxel_size)
-        net['pore.surface_area'] = areas * voxel_size**2
-        net['throat.area'] = interface_area.area
+        areas = region_areas(regions=regions, voxel_size=voxel_size)
+        net['pore.surface_area'] = areas.surface_area
+        net['throat.area'] = areas.area
     # -------------------------------------------------------------------------
     # Find void to void connections of boundary and internal voids
     boundary_labels = net['pore.label'] > b_num
@@ -116,11 +152,105 @@ def snow(im, voxel_size=1,
                 net['pore.{}'.format(i)] = (coords[:, dic[i]] >
                                             max(condition[:, dic[i]]))
 
-    class network_dict(dict):
-        pass
-    net = network_dict(net)
+    net = Network(net)
     net.im = im
     net.dt = dt
     net.regions = regions
     net.peaks = peaks
     return net
+
+
+def _face_pads(ndim, f):
+    r"""
+    Returns the widths by which the images are padded for the boundary
+    regions added on the faces listed in ``f``
+    """
+    if ndim == 2:
+        faces = [(int('left' in f)*3, int('right' in f)*3),
+                 (int(('front') in f)*3 or int(('bottom') in f)*3,
+                  int(('back') in f)*3 or int(('top') in f)*3)]
+    if ndim == 3:
+        faces = [(int('left' in f)*3, int('right' in f)*3),
+                 (int('front' in f)*3, int('back' in f)*3),
+                 (int('top' in f)*3, int('bottom' in f)*3)]
+    return faces
+
+
+def _snow_partitioning_tiled(im, divs, overlap=None, executor=None):
+    r"""
+    Applies ``snow_partitioning`` to overlapping tiles of ``im`` and stitches
+    the results into a single image of pore regions, returning a named-tuple
+    with the same fields as ``snow_partitioning`` with ``return_all``
+    """
+    im = im > 0
+    if overlap is None:
+        overlap = 2*int(np.ceil(np.amax(edt(im))))
+    tiles = []
+    for s in subdivide(im, divs=divs).flatten():
+        s = tuple(s)
+        ext = tuple(extend_slice(s, im.shape, pad=overlap))
+        inner = tuple([slice(a.start - b.start, a.stop - b.start)
+                       for a, b in zip(s, ext)])
+        tiles.append((s, ext, inner))
+    args = [(np.ascontiguousarray(im[ext]), inner) for s, ext, inner in tiles]
+    if executor is None:
+        results = [_snow_tile(*a) for a in args]
+    else:
+        results = list(executor.map(_snow_tile, *zip(*args)))
+    regions = np.zeros(im.shape, dtype=np.int64)
+    dt = np.zeros(im.shape, dtype=float)
+    peaks = np.zeros(im.shape, dtype=np.int64)
+    # Give the pores kept by each tile globally unique labels, and write each
+    # tile's own peaks into the stitched image
+    N = 0
+    luts = []
+    for (s, ext, inner), res in zip(tiles, results):
+        labels, owned, anchors, tile_dt, tile_peaks = res
+        lut = np.zeros(owned.size, dtype=np.int64)
+        lut[owned] = np.arange(N + 1, N + 1 + owned.sum())
+        N += owned.sum()
+        luts.append(lut)
+        dt[s] = tile_dt
+        peaks[s] = lut[tile_peaks]
+    # Each tile's voxels are labelled as that tile partitioned them, with the
+    # pores kept by neighboring tiles identified by the label of their peak
+    for (s, ext, inner), res, lut in zip(tiles, results, luts):
+        labels, owned, anchors = res[:3]
+        found = (anchors >= 0)*~owned
+        crds = np.unravel_index(anchors[found], labels.shape)
+        lut[found] = peaks[tuple([c + e.start for c, e in zip(crds, ext)])]
+        regions[s] = lut[labels[inner]]
+    # Voxels cut off from every peak within their own tile are taken from a
+    # neighboring tile that reached them.  Void voxels that no pore reaches,
+    # such as isolated blobs without a peak, are left as 0 just as
+    # snow_partitioning leaves them.
+    for (s, ext, inner), res, lut in zip(tiles, results, luts):
+        target = regions[ext]
+        labels = lut[res[0]]
+        fill = (target == 0)*(labels > 0)
+        target[fill] = labels[fill]
+    tup = namedtuple('results', field_names=['im', 'dt', 'peaks', 'regions'])
+    return tup(im, dt, peaks, regions)
+
+
+def _snow_tile(im, inner):
+    r"""
+    Partitions a single tile and finds which of its pores have their peak
+    within ``inner``, returning the unrandomized regions, a boolean lookup of
+    the kept labels, the flat index of a peak voxel of each label (or -1),
+    and the distance transform and peaks within ``inner``
+    """
+    tup = snow_partitioning(im=im, return_all=True, randomize=False)
+    peaks = tup.peaks
+    index = RegionIndex(peaks)
+    full = np.where(index.counts > 0)[0]
+    first = index.voxels[index.offsets[full]]
+    keep = np.ones(full.size, dtype=bool)
+    for c, s in zip(np.unravel_index(first, peaks.shape), inner):
+        keep *= (c >= s.start)*(c < s.stop)
+    owned = np.zeros(index.num_regions + 1, dtype=bool)
+    owned[full[keep] + 1] = True
+    anchors = np.full(index.num_regions + 1, -1, dtype=np.int64)
+    anchors[full + 1] = first
+    regions = np.asarray(tup.regions, dtype=np.int64)
+    return regions, owned, anchors, tup.dt[inner], peaks[inner]
@@ -1,13 +1,17 @@
 import scipy as sp
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from porespy.networks import regions_to_network, add_boundary_regions
+from porespy.networks import Network
 from porespy.filters import snow_partitioning
-from porespy.metrics import region_surface_areas, region_interface_areas
+from porespy.tools import RegionIndex, edt
+from porespy.metrics import region_areas
 # pass
 
 
 def snow_dual(im, voxel_size=1,
               boundary_faces=['top', 'bottom', 'left', 'right', 'front', 'back'],
-              marching_cubes_area=False):
+              marching_cubes_area=False, return_images=True):
 
     r"""
     Extracts a dual pore and solid network from a binary image using a modified
@@ -36,9 +40,17 @@ def snow_dual(im, voxel_size=1,
     marching_cubes_area : bool
         If ``True`` then the surface area and interfacial area between regions
         will be using the marching cube algorithm. This is a more accurate
-        representation of area in extracted network, but is quite slow, so
-        it is ``False`` by default.  The default method simply counts voxels
-        so does not correctly account for the voxelated nature of the images.
+        representation of area in extracted network.  All areas are found in
+        a single sweep over the image by ``porespy.metrics.region_areas``.
+        It is ``False`` by default, in which case the areas are found by
+        simply counting voxels so do not correctly account for the voxelated
+        nature of the images.
+    return_images : bool
+        If ``True`` (default) the images produced along the way, such as the
+        distance transforms, peaks and regions of each phase, are attached to
+        the returned dictionary as attributes.  Setting this to ``False``
+        allows them to be freed as soon as the network has been extracted,
+        which is helpful for large images.
 
     Returns
     -------
@@ -46,6 +58,18 @@ def snow_dual(im, voxel_size=1,
     the network topological information.  The dictionary names use the OpenPNM
     convention (i.e. 'pore.coords', 'throat.conns') so it may be converted
     directly to an OpenPNM network object using the ``update`` command.
+    It is a ``Network``, with the images attached as attributes if
+    ``return_images`` is ``True``.
+
+    Notes
+    -----
+    The distance transforms of both phases are found in a single signed pass
+    and the two phases are then partitioned concurrently in separate threads.
+    The numba kernels they share are launched through ``parallel_kernel``, so
+    this is safe under any threading layer.
+
+    Solid voxels that lie in no solid region are left as 0 in the combined
+    regions, so they belong to no pore of the network.
 
     References
     ----------
@@ -59,28 +83,41 @@ def snow_dual(im, voxel_size=1,
 
     """
     # -------------------------------------------------------------------------
-    # SNOW void phase
-    pore_regions = snow_partitioning(im, return_all=True)
-    # SNOW solid phase
-    solid_regions = snow_partitioning(~im, return_all=True)
+    # Distance transform of both phases, positive in the void and negative in
+    # the solid, so that its magnitude is the combined distance transform
+    im = im > 0
+    dt = edt(im, signed=True)
+    pore_dt = np.maximum(dt, 0)
+    solid_dt = np.negative(dt)
+    np.maximum(solid_dt, 0, out=solid_dt)
+    np.abs(dt, out=dt)
     # -------------------------------------------------------------------------
-    # Combined Distance transform of two phases.
-    pore_dt = pore_regions.dt
-    solid_dt = solid_regions.dt
-    dt = pore_dt + solid_dt
-    pore_peaks = pore_regions.peaks
-    solid_peaks = solid_regions.peaks
-    peaks = pore_peaks + solid_peaks
-    # Calculates combined void and solid regions for dual network extraction
-    pore_regions = pore_regions.regions
-    solid_regions = solid_regions.regions
-    pore_region = pore_regions*im
-    solid_region = solid_regions*~im
-    solid_num = sp.amax(pore_regions)
-    solid_region = solid_region + solid_num
-    solid_region = solid_region * ~im
-    regions = pore_region + solid_region
+    # SNOW void and solid phases, partitioned concurrently
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        pore = executor.submit(snow_partitioning, im, dt=pore_dt,
+                               return_all=True)
+        solid = executor.submit(snow_partitioning, ~im, dt=solid_dt,
+                                return_all=True)
+        pore, solid = pore.result(), solid.result()
+    # -------------------------------------------------------------------------
+    # Combines void and solid regions in place for dual network extraction,
+    # with solid labels following on from the void labels.  Solid voxels in no
+    # region are left as 0 rather than joining the void region with the
+    # largest label.
+    regions = pore.regions.astype(sp.int64)
+    solid_num = sp.amax(regions)
+    np.add(solid.regions, solid_num, out=regions,
+           where=~im*(solid.regions > 0), casting='unsafe')
     b_num = sp.amax(regions)
+    if return_images:
+        pore_peaks = pore.peaks
+        solid_peaks = solid.peaks
+        peaks = pore_peaks + solid_peaks
+        pore_region = np.where(im, regions, 0)
+        solid_region = np.where(im, 0, regions)
+    else:
+        del pore_dt, solid_dt
+    del pore, solid
     # -------------------------------------------------------------------------
     # Boundary Conditions
     regions = add_boundary_regions(regions=regions, faces=boundary_faces)
@@ -101,16 +138,16 @@ def snow_dual(im, voxel_size=1,
         dt = dt
     # -------------------------------------------------------------------------
     # Extract void,solid and throat information from image
-    net = regions_to_network(im=regions, dt=dt, voxel_size=voxel_size)
+    index = RegionIndex(regions)
+    net = regions_to_network(im=regions, dt=dt, voxel_size=voxel_size,
+                             index=index)
     # -------------------------------------------------------------------------
     # -------------------------------------------------------------------------
     # Extract marching cube surface area and interfacial area of regions
     if marching_cubes_area:
-        areas = region_surface_areas(regions=regions)
-        interface_area = region_interface_areas(regions=regions, areas=areas,
-                                                voxel_size=voxel_size)
-        net['pore.surface_area'] = areas * voxel_size**2
-        net['throat.area'] = interface_area.area
+        areas = region_areas(regions=regions, voxel_size=voxel_size)
+        net['pore.surface_area'] = areas.surface_area
+        net['throat.area'] = areas.area
     # -------------------------------------------------------------------------
     # Find void to void, void to solid and solid to solid throat conns
     loc1 = net['throat.conns'][:, 0] < solid_num
@@ -160,18 +197,17 @@ def snow_dual(im, voxel_size=1,
     net['pore.solid'] = solid_labels
     net['pore.boundary'] = boundary_labels
 
-    class network_dict(dict):
-        pass
-    net = network_dict(net)
-    net.im = im
-    net.dt = dt
-    net.regions = regions
-    net.peaks = peaks
-    net.pore_dt = pore_dt
-    net.pore_regions = pore_region
-    net.pore_peaks = pore_peaks
-    net.solid_dt = solid_dt
-    net.solid_regions = solid_region
-    net.solid_peaks = solid_peaks
+    net = Network(net)
+    if return_images:
+        net.im = im
+        net.dt = dt
+        net.regions = regions
+        net.peaks = peaks
+        net.pore_dt = pore_dt
+        net.pore_regions = pore_region
+        net.pore_peaks = pore_peaks
+        net.solid_dt = solid_dt
+        net.solid_regions = solid_region
+        net.solid_peaks = solid_peaks
 
     return net
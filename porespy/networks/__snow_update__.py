@@ -0,0 +1,302 @@
+import numpy as np
+from porespy.filters import snow_partitioning
+from porespy.tools import RegionIndex, extend_slice
+from porespy.tools.__relabel__ import _apply_lut, _min_uint
+from porespy.networks.__getnet__ import _region_edt, _pore_props
+from porespy.networks.__getnet__ import _throat_props, _pore_dict
+from porespy.networks.__getnet__ import _throat_dict
+from porespy.networks.__snow__ import snow, _face_pads
+from porespy.networks.__network__ import Network
+
+
+def snow_update(net, im, slices, halo=None, voxel_size=1,
+                boundary_faces=['top', 'bottom', 'left', 'right', 'front',
+                                'back']):
+    r"""
+    Updates a network extracted by ``snow`` after local edits to the image,
+    analyzing again only the pores near the edited voxels
+
+    Parameters
+    ----------
+    net : dict
+        The result of a previous call to ``snow``, with the images attached
+        to it.
+    im : ND-array
+        The edited binary image, the same shape as the one given to ``snow``.
+    slices : tuple of slices, or list of tuples of slices
+        The bounding box of each edited sub-volume in the coordinates of
+        ``im``, such as those returned by ``scipy.ndimage.find_objects``.
+    halo : int
+        The number of voxels by which each bounding box is extended to find
+        the pores that are partitioned again.  It should be larger than the
+        diameter of the largest pore near the edits.  The default is twice
+        the maximum of the distance transform attached to ``net``.
+    voxel_size : scalar
+        The resolution of the image, which must match that given to ``snow``.
+    boundary_faces : list of strings
+        The faces on which boundary regions were added, which must match
+        those given to ``snow``.
+
+    Returns
+    -------
+    A dictionary in the same form as returned by ``snow``, with the pores
+    and throats away from the edits carried over from ``net``.
+
+    Notes
+    -----
+    For each bounding box the image is partitioned again within the box
+    extended by twice ``halo``.  The pores whose peaks lie within ``halo`` of
+    the box are replaced by the new pores whose peaks lie there, and all
+    other pores keep their voxels apart from any that were edited.  The
+    region is grown if any of the replaced pores extend beyond it.  Only the
+    pores with voxels in this region are then analyzed again, while the
+    ``pore.*`` and ``throat.*`` values of all other pores and the throats
+    between them are carried over with their indices remapped.  Internal
+    pores keep their order, with new pores placed after them and before the
+    boundary pores.
+
+    The ``im``, ``dt`` and ``peaks`` images attached to ``net`` are updated
+    in place, and ``regions`` is relabelled into a new image.  If an edit
+    comes within reach of a face with boundary regions the whole image is
+    extracted again using ``snow``.
+
+    The areas of the pores and throats that are analyzed again are found by
+    counting voxels, even if ``marching_cubes_area`` was used originally.
+
+    """
+    if not hasattr(net, 'regions'):
+        raise Exception('net must be returned by snow with images attached')
+    im = im > 0
+    if isinstance(slices[0], slice):
+        slices = [slices]
+    if halo is None:
+        halo = 2*int(np.ceil(np.amax(net.dt)))
+    f = boundary_faces
+    pads = _face_pads(im.ndim, f) if f is not None else [(0, 0)]*im.ndim
+    for s in slices:
+        s = tuple([slice(*i.indices(n)[:2]) for i, n in zip(s, im.shape)])
+        new = _update_box(net, im, s, halo, voxel_size, pads)
+        if new is None:
+            print('Edits reach a boundary face, extracting the whole image')
+            return snow(im, voxel_size=voxel_size, boundary_faces=f)
+        net = new
+    return net
+
+
+def _update_box(net, im, s, halo, voxel_size, pads):
+    r"""
+    Applies the edits to ``im`` within and around ``s`` to ``net``, returning
+    the updated network or ``None`` if the edits reach a boundary face
+    """
+    shape = im.shape
+    lo = [p[0] for p in pads]
+    Np = net['pore.all'].size
+    old_im = net.im
+    peaks = net.peaks
+    win = extend_slice(s, shape, pad=halo)
+    ext = extend_slice(s, shape, pad=2*halo)
+    # -------------------------------------------------------------------------
+    # Partition the region again, growing it until it contains all of the
+    # pores being replaced
+    while True:
+        if _reaches_face(ext, shape, pads):
+            return None
+        win_rel = _relative(win, ext)
+        old = np.asarray(net.regions[_shift(ext, lo)], dtype=np.int64)
+        replaced = np.unique(old[win_rel][peaks[win] > 0])
+        replaced = replaced[replaced > 0]
+        if np.any(np.isin(_border_values(old, ext, shape), replaced)):
+            ext = extend_slice(ext, shape, pad=halo)
+            continue
+        tup = snow_partitioning(im[ext], return_all=True, randomize=False)
+        result, new_labels = _assign(im[ext], old, old_im[_shift(ext, lo)],
+                                     replaced, tup, win_rel, Np)
+        if np.any(_border_values(result, ext, shape) > Np):
+            ext = extend_slice(ext, shape, pad=halo)
+            continue
+        break
+    # -------------------------------------------------------------------------
+    # Find the new label of every pore, with the internal pores first, then
+    # the new pores, then the boundary pores
+    present = np.unique(result)
+    touched = np.unique(old)
+    removed = np.union1d(replaced, np.setdiff1d(touched, present))
+    touched = np.setdiff1d(np.union1d(touched, present[present <= Np]),
+                           np.append(removed, 0))
+    boundary = np.append(False, net.get('pore.boundary',
+                                        np.zeros(Np, dtype=bool)))
+    keep = np.ones(Np + 1, dtype=bool)
+    keep[0] = False
+    keep[removed] = False
+    internal = np.where(keep*~boundary)[0]
+    outer = np.where(keep*boundary)[0]
+    Nn = new_labels.size
+    Nnew = internal.size + Nn + outer.size
+    lut = np.zeros(Np + 1 + new_labels.max(initial=0), dtype=np.int64)
+    lut[internal] = np.arange(1, internal.size + 1)
+    lut[new_labels] = np.arange(internal.size + 1, internal.size + Nn + 1)
+    lut[outer] = np.arange(internal.size + Nn + 1, Nnew + 1)
+    # -------------------------------------------------------------------------
+    # Update the images
+    ext_pad = _shift(ext, lo)
+    regions = _apply_lut(net.regions, lut[:Np + 1].astype(_min_uint(Nnew)),
+                         0)
+    regions[ext_pad] = lut[result]
+    old_im[ext_pad] = im[ext]
+    net.dt[_shift(win, lo)] = tup.dt[win_rel]
+    tile_peaks = np.asarray(tup.peaks[win_rel], dtype=np.int64)
+    mark = np.isin(tile_peaks + Np, new_labels)
+    peaks[win] = np.where(mark, lut[np.where(mark, tile_peaks + Np, 0)], 0)
+    # -------------------------------------------------------------------------
+    # Analyze the pores with voxels in the region again, within a crop that
+    # contains all of them
+    changed = np.concatenate((lut[touched], lut[new_labels]))
+    crop = extend_slice(ext_pad, regions.shape, pad=halo)
+    while np.any(np.isin(_border_values(regions[crop], crop, regions.shape),
+                         changed)):
+        crop = extend_slice(crop, regions.shape, pad=halo)
+    p_new, t_raw = _analyze_crop(regions, net.dt, crop, changed, Nnew,
+                                 voxel_size)
+    # -------------------------------------------------------------------------
+    # Carry over the other pores and the throats between them
+    is_changed = np.zeros(Nnew + 1, dtype=bool)
+    is_changed[changed] = True
+    old_idx = np.where(keep[1:]*~is_changed[lut[1:Np + 1]])[0]
+    new_idx = lut[old_idx + 1] - 1
+    new = {}
+    for key in [k for k in net.keys() if k.startswith('pore.')]:
+        arr = np.asarray(net[key])
+        out = np.zeros((Nnew, ) + arr.shape[1:], dtype=arr.dtype)
+        out[new_idx] = arr[old_idx]
+        if key in p_new:
+            out[changed - 1] = p_new[key]
+        elif key == 'pore.internal':
+            out[changed - 1] = True
+        new[key] = out
+    new['pore.label'] = np.arange(1, Nnew + 1)
+    b_new = new.get('pore.boundary', np.zeros(Nnew, dtype=bool))
+    t_new = _throat_dict(new, *t_raw, voxel_size=voxel_size)
+    cn = t_new['throat.conns']
+    t_new['throat.boundary'] = ~b_new[cn[:, 0]]*b_new[cn[:, 1]]
+    t_new['throat.internal'] = ~b_new[cn[:, 0]]*~b_new[cn[:, 1]]
+    conns = net['throat.conns']
+    t_keep = np.all(keep[conns + 1], axis=1)
+    t_keep *= ~np.any(is_changed[lut[conns + 1]], axis=1)
+    t_conns = np.vstack((lut[conns[t_keep] + 1] - 1, cn))
+    order = np.lexsort((t_conns[:, 1], t_conns[:, 0]))
+    for key in [k for k in net.keys() if k.startswith('throat.')]:
+        arr = np.asarray(net[key])
+        if key in t_new:
+            add = t_new[key]
+        else:
+            add = np.zeros((cn.shape[0], ) + arr.shape[1:], dtype=arr.dtype)
+        new[key] = np.concatenate((arr[t_keep],
+                                   add.astype(arr.dtype)))[order]
+    new['throat.conns'] = t_conns[order]
+    for key in net.keys():
+        if key not in new:
+            new[key] = net[key]
+
+    new = Network(new)
+    new.im = old_im
+    new.dt = net.dt
+    new.regions = regions
+    new.peaks = peaks
+    return new
+
+
+def _assign(im, old, old_im, replaced, tup, win, Np):
+    r"""
+    Finds the labels of the voxels in the re-partitioned region, returning
+    them along with the temporary labels, all greater than ``Np``, that were
+    given to new pores
+    """
+    labels = np.asarray(tup.regions, dtype=np.int64)
+    index = RegionIndex(tup.peaks)
+    N = max(index.num_regions, labels.max(initial=0))
+    full = np.where(index.counts > 0)[0]
+    first = np.unravel_index(index.voxels[index.offsets[full]], im.shape)
+    # New pores whose peaks are in the window replace the old pores there
+    kept = np.zeros(N + 1, dtype=bool)
+    inside = np.ones(full.size, dtype=bool)
+    for c, w in zip(first, win):
+        inside *= (c >= w.start)*(c < w.stop)
+    kept[full[inside] + 1] = True
+    # Other new pores are identified with the old pore at their peak
+    at_peak = np.zeros(N + 1, dtype=np.int64)
+    at_peak[full + 1] = old[first]
+    redo = np.isin(old, replaced) + (im != old_im) + (old == 0)
+    redo *= im*(labels > 0)
+    t = labels[redo]
+    q = at_peak[t]
+    reuse = ~kept[t]*(q > 0)*~np.isin(q, replaced)
+    kept[np.unique(t[~reuse])] = True
+    result = old*im
+    result[redo] = np.where(reuse, q, t + Np)
+    return result, np.unique(t[~reuse]) + Np
+
+
+def _analyze_crop(regions, dt, crop, labels, N, voxel_size):
+    r"""
+    Finds the properties of the given pores, which must lie within ``crop``
+    of ``regions``, and those of the throats connected to them in voxels
+    """
+    rc = np.ascontiguousarray(regions[crop])
+    dc = np.ascontiguousarray(dt[crop])
+    start = np.array([c.start for c in crop])
+    dt_local = _region_edt(rc)
+    surface = dt_local == 1
+    index = RegionIndex(rc)
+    props = _pore_props([dc, dt_local, surface], index, 1,
+                        index.num_regions + 1)
+    p_label, p_coords, p_volume, p_dia_local, p_dia_global, p_area_surf = \
+        [p[labels - 1] for p in props]
+    pores = _pore_dict(p_label, p_coords + start, p_volume, p_dia_local,
+                       p_dia_global, p_area_surf, voxel_size)
+    t_conns, t_area, t_dia, t_perimeter, t_coords = _throat_props(rc, dc, N)
+    mine = np.zeros(N, dtype=bool)
+    mine[labels - 1] = True
+    hit = np.any(mine[t_conns], axis=1)
+    throats = (t_conns[hit], t_area[hit], t_dia[hit], t_perimeter[hit],
+               t_coords[hit] + start)
+    return pores, throats
+
+
+def _shift(s, lo):
+    r"""
+    Converts a tuple of slices into the coordinates of the padded images
+    """
+    return tuple([slice(i.start + n, i.stop + n) for i, n in zip(s, lo)])
+
+
+def _relative(s, ext):
+    r"""
+    Expresses the slices ``s`` relative to the start of ``ext``
+    """
+    return tuple([slice(a.start - b.start, a.stop - b.start)
+                  for a, b in zip(s, ext)])
+
+
+def _reaches_face(s, shape, pads):
+    r"""
+    Checks whether the slices touch a face of the image on which boundary
+    regions were added
+    """
+    for i, n, p in zip(s, shape, pads):
+        if (i.start == 0 and p[0] > 0) or (i.stop == n and p[1] > 0):
+            return True
+    return False
+
+
+def _border_values(arr, s, shape):
+    r"""
+    Returns the values on the faces of ``arr``, which is the portion of an
+    image of ``shape`` given by ``s``, that do not lie on the edge of the image
+    """
+    vals = [np.zeros(0, dtype=arr.dtype)]
+    for ax, (i, n) in enumerate(zip(s, shape)):
+        if i.start > 0:
+            vals.append(np.take(arr, 0, axis=ax).ravel())
+        if i.stop < n:
+            vals.append(np.take(arr, -1, axis=ax).ravel())
+    return np.unique(np.concatenate(vals))
@@ -0,0 +1,290 @@
+import os
+import json
+import shutil
+import pickle
+import hashlib
+import inspect
+import tempfile
+import functools
+import threading
+import numpy as np
+
+_settings = {'enabled': False,
+             'cache_dir': os.path.join(os.path.expanduser('~'), '.cache',
+                                       'porespy'),
+             'max_size': 2**32}
+# Calls made from within a cached function are not cached themselves
+_active = threading.local()
+
+
+def set_cache(enabled=True, cache_dir=None, max_size=None):
+    r"""
+    Turns on or off the on-disk cache of the results of expensive functions
+    such as ``snow``, ``porosimetry``, ``local_thickness`` and
+    ``regionprops_3D``
+
+    Parameters
+    ----------
+    enabled : boolean
+        Whether results are looked up in and stored to the cache.  The cache
+        is off by default.
+    cache_dir : string
+        The directory in which the results are stored.  The default is
+        ``.cache/porespy`` in the user's home directory.
+    max_size : int
+        The largest total size, in bytes, of the stored results.  When it is
+        exceeded the least recently used results are removed.  The default
+        is 4 GB.
+
+    Returns
+    -------
+    settings : dict
+        A copy of the cache settings now in effect.
+
+    Notes
+    -----
+    Results are keyed by a hash of the bytes, shape and type of each array
+    argument, the other arguments, the function's name and the version of
+    PoreSpy, so a result is only reused for identical inputs.  Arrays in
+    results are stored as ``.npy`` files and are returned as copy-on-write
+    memory maps of them, so they are only read from disk as they are used.
+    Other results, such as the list of region properties returned by
+    ``regionprops_3D``, are pickled instead, so they are read from disk in
+    full each time they are reused.
+
+    Examples
+    --------
+    >>> import porespy as ps
+    >>> import tempfile
+    >>> settings = ps.tools.set_cache(cache_dir=tempfile.mkdtemp())
+    >>> print(settings['enabled'])
+    True
+    >>> settings = ps.tools.set_cache(enabled=False)
+
+    """
+    _settings['enabled'] = bool(enabled)
+    if cache_dir is not None:
+        _settings['cache_dir'] = str(cache_dir)
+    if max_size is not None:
+        _settings['max_size'] = int(max_size)
+    return dict(_settings)
+
+
+def clear_cache():
+    r"""
+    Removes all results stored in the cache directory
+    """
+    path = _settings['cache_dir']
+    for name in _entries(path):
+        shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+
+def cached(ignore=()):
+    r"""
+    Decorates a function so that its results are reused from the on-disk
+    cache when it is enabled with ``set_cache``
+
+    Parameters
+    ----------
+    ignore : sequence of strings
+        The names of arguments that do not affect the result, such as an
+        executor, and so are left out of the key.
+
+    Notes
+    -----
+    Calls with arguments that cannot be hashed reliably, such as arbitrary
+    objects, are passed straight to the function, as are calls made from
+    within another cached function.
+
+    """
+    def decorator(func):
+        sig = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if (not _settings['enabled']) or getattr(_active, 'on', False):
+                return func(*args, **kwargs)
+            key = _key(func, sig, args, kwargs, ignore)
+            if key is None:
+                return func(*args, **kwargs)
+            path = os.path.join(_settings['cache_dir'], key)
+            if os.path.isdir(path):
+                try:
+                    result = _load(path)
+                    os.utime(path)
+                    return result
+                except Exception:
+                    shutil.rmtree(path, ignore_errors=True)
+            _active.on = True
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                _active.on = False
+            _store(result, path)
+            _evict(_settings['cache_dir'], _settings['max_size'], keep=path)
+            return result
+        return wrapper
+    return decorator
+
+
+def _hash_array(h, arr):
+    r"""
+    Adds the type, shape and bytes of ``arr`` to the hash ``h``
+    """
+    arr = np.ascontiguousarray(arr)
+    h.update(str((arr.dtype.str, arr.shape)).encode())
+    h.update(arr.reshape(-1).view(np.uint8))
+
+
+def _hash_value(h, val):
+    r"""
+    Adds an argument to the hash, returning ``False`` if it is not of a type
+    whose contents can be hashed
+    """
+    if isinstance(val, np.ndarray):
+        if val.dtype.hasobject:
+            return False
+        _hash_array(h, val)
+    elif isinstance(val, (list, tuple)):
+        h.update(('(%d' % len(val)).encode())
+        for v in val:
+            if not _hash_value(h, v):
+                return False
+        h.update(b')')
+    elif isinstance(val, dict):
+        h.update(('{%d' % len(val)).encode())
+        for k in sorted(val, key=str):
+            h.update(repr(k).encode())
+            if not _hash_value(h, val[k]):
+                return False
+        h.update(b'}')
+    elif (val is None) or isinstance(val, (bool, int, float, complex, str,
+                                           bytes, np.generic)):
+        h.update(repr(val).encode())
+    else:
+        return False
+    return True
+
+
+def _key(func, sig, args, kwargs, ignore):
+    r"""
+    Finds the key of a call, or ``None`` if it cannot be cached
+    """
+    import porespy
+    h = hashlib.blake2b(digest_size=20)
+    h.update((func.__module__ + '.' + func.__qualname__).encode())
+    h.update(porespy.__version__.encode())
+    bound = sig.bind(*args, **kwargs)
+    bound.apply_defaults()
+    for name, val in bound.arguments.items():
+        if name in ignore:
+            continue
+        h.update(name.encode())
+        if not _hash_value(h, val):
+            return None
+    return h.hexdigest()
+
+
+def _store(result, path):
+    r"""
+    Writes a result into a new entry of the cache, via a temporary directory
+    so that partially written entries are never read
+    """
+    parent = os.path.dirname(path)
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=parent, prefix='.tmp')
+    from porespy.networks import Network
+    try:
+        manifest = {}
+        if isinstance(result, Network):
+            manifest['type'] = 'network'
+            result.save(os.path.join(tmp, 'result.net'), images=True)
+        elif isinstance(result, np.ndarray) and not result.dtype.hasobject:
+            manifest['type'] = 'array'
+            np.save(os.path.join(tmp, 'result.npy'), result)
+        elif isinstance(result, dict) and _all_arrays(result) and \
+                _all_arrays(getattr(result, '__dict__', {})):
+            manifest['type'] = 'dict'
+            manifest['keys'] = _save_arrays(result, tmp, 'key')
+            manifest['attrs'] = _save_arrays(getattr(result, '__dict__', {}),
+                                             tmp, 'attr')
+        else:
+            manifest['type'] = 'pickle'
+            with open(os.path.join(tmp, 'result.pkl'), 'wb') as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        with open(os.path.join(tmp, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+        os.rename(tmp, path)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _all_arrays(d):
+    return all([isinstance(v, np.ndarray) and not v.dtype.hasobject
+                for v in d.values()])
+
+
+def _save_arrays(d, path, prefix):
+    names = []
+    for i, (k, v) in enumerate(d.items()):
+        np.save(os.path.join(path, '%s%d.npy' % (prefix, i)), v)
+        names.append(k)
+    return names
+
+
+def _load(path):
+    r"""
+    Reads a result from the cache, with arrays mapped copy-on-write
+    """
+    with open(os.path.join(path, 'manifest.json')) as f:
+        manifest = json.load(f)
+    if manifest['type'] == 'array':
+        return _load_array(os.path.join(path, 'result.npy'))
+    from porespy.networks import Network
+    if manifest['type'] == 'network':
+        return Network.load(os.path.join(path, 'result.net'))
+    if manifest['type'] == 'dict':
+        # Arrays held as attributes are restored as the images of a Network
+        result = Network() if manifest['attrs'] else {}
+        for i, k in enumerate(manifest['keys']):
+            result[k] = _load_array(os.path.join(path, 'key%d.npy' % i))
+        for i, k in enumerate(manifest['attrs']):
+            setattr(result, k,
+                    _load_array(os.path.join(path, 'attr%d.npy' % i)))
+        return result
+    with open(os.path.join(path, 'result.pkl'), 'rb') as f:
+        return pickle.load(f)
+
+
+def _load_array(fname):
+    arr = np.load(fname, mmap_mode='c')
+    # Empty arrays cannot be mapped, so are read as usual
+    return arr if arr.size else np.load(fname)
+
+
+def _entries(path):
+    if not os.path.isdir(path):
+        return []
+    return [n for n in os.listdir(path) if not n.startswith('.tmp')
+            and os.path.isdir(os.path.join(path, n))]
+
+
+def _evict(path, max_size, keep=None):
+    r"""
+    Removes the least recently used entries, other than ``keep``, until the
+    total size of the cache is no more than ``max_size`` bytes
+    """
+    entries = []
+    for name in _entries(path):
+        full = os.path.join(path, name)
+        size = sum([os.path.getsize(os.path.join(full, f))
+                    for f in os.listdir(full)])
+        entries.append((os.path.getmtime(full), size, full))
+    total = sum([e[1] for e in entries])
+    for mtime, size, full in sorted(entries):
+        if total <= max_size:
+            break
+        if full == keep:
+            continue
+        shutil.rmtree(full, ignore_errors=True)
+        total -= size
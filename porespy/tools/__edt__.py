@@ -0,0 +1,339 @@
+import numpy as np
+from numba import njit, prange
+from porespy.tools.__numba__ import parallel_kernel
+
+
+def edt(im, squared=False, dtype=None, out=None, slab_size=None,
+        signed=False):
+    r"""
+    Computes the exact Euclidean distance transform of a binary image using
+    multithreaded separable passes.
+
+    Parameters
+    ----------
+    im : ND-array
+        A 1D, 2D or 3D image.  The distance from each ``True`` (nonzero) voxel
+        to the nearest ``False`` (zero) voxel is computed.  The image may be a
+        ``numpy.memmap`` in which case it is only ever read in slabs.
+    squared : boolean
+        If ``True`` the squared distances are returned.  These are integers so
+        can be stored exactly in an integer array.  The default is ``False``.
+    dtype : data-type
+        The data type of the returned array.  The default is ``float64`` for
+        distances and the smallest of ``int32`` or ``int64`` that can hold the
+        largest possible value for squared distances.  Integer types are only
+        permitted when ``squared`` is ``True``; ``float32`` halves the memory
+        footprint at the cost of precision.
+    out : ND-array
+        An optional array of the same shape as ``im`` into which the result is
+        written.  If given, ``dtype`` is taken from this array.  It can be a
+        ``numpy.memmap``, which allows volumes larger than the available
+        memory to be processed.
+    slab_size : int
+        The number of slices along each pass's outer axis that are loaded into
+        memory at once.  The default is to process the entire array in one go
+        unless ``im`` or ``out`` is a ``numpy.memmap``, in which case slabs of
+        roughly 64 MB are used.
+    signed : boolean
+        If ``True`` the distance transforms of both phases are found in the
+        same passes, giving the distance from each ``True`` voxel to the
+        nearest ``False`` voxel as a positive value and the distance from each
+        ``False`` voxel to the nearest ``True`` voxel as a negative value.
+        The default is ``False``.  Integer types must be signed in this case.
+
+    Returns
+    -------
+    dt : ND-array
+        The distance transform of ``im``, or ``out`` if it was given.
+
+    Notes
+    -----
+    The first pass finds the 1D distance along the last axis with a forward
+    and backward sweep, and each following pass computes the lower envelope
+    of parabolas along the next axis as described by Felzenszwalb and
+    Huttenlocher.  The lines within each pass are independent so are
+    distributed across all available threads by ``numba``.
+
+    The values are identical to those of scipy's
+    ``distance_transform_edt`` with the exception of images containing no
+    ``False`` voxels, which receive the length of the diagonal of the image
+    (or its square) rather than scipy's arbitrary finite values.
+
+    When ``signed`` is ``True`` the sign of each value records its phase
+    throughout the passes, so ``abs(edt(im, signed=True))`` equals
+    ``edt(im) + edt(~im)`` while needing only one output array.
+
+    """
+    ndim = im.ndim
+    if ndim not in [1, 2, 3]:
+        raise Exception('Only 1D, 2D and 3D images are supported')
+    if out is not None:
+        if out.shape != im.shape:
+            raise Exception('out must be the same shape as im')
+        dtype = out.dtype
+    # Larger than any squared distance within the image, so it marks voxels
+    # whose distance is not yet known
+    largest = sum([s**2 for s in im.shape])
+    if dtype is None:
+        if squared:
+            dtype = np.int32 if largest < np.iinfo(np.int32).max else np.int64
+        else:
+            dtype = np.float64
+    dtype = np.dtype(dtype)
+    if dtype.kind == 'f':
+        inf = largest
+    elif (dtype.kind in 'iu') and squared:
+        inf = min(largest, np.iinfo(dtype).max)
+    else:
+        raise Exception('dtype must be a float, or an integer if squared')
+    if signed and (dtype.kind == 'u'):
+        raise Exception('dtype must be signed when signed is True')
+    first_pass = _signed_first_pass if signed else _edt_first_pass
+    next_pass = _signed_pass if signed else _edt_pass
+    if out is None:
+        out = np.empty(im.shape, dtype=dtype)
+    # Views as 3D arrays so the kernels need only handle one case
+    shape3 = (1, )*(3 - ndim) + im.shape
+    im3 = im.reshape(shape3)
+    dt3 = out.reshape(shape3)
+    inf = dtype.type(inf)
+    if slab_size is None:
+        if isinstance(im, np.memmap) or isinstance(out, np.memmap):
+            per_slice = max(np.prod(shape3[1:]), 1)*dtype.itemsize
+            slab_size = max(int(2**26 // per_slice), 1)
+        else:
+            slab_size = max(shape3)
+    slab_size = int(slab_size)
+    # Passes along the last two axes only couple voxels within each slice of
+    # the first axis, so are carried out slab-wise along it
+    for i in range(0, shape3[0], slab_size):
+        s = slice(i, i + slab_size)
+        slab_im = np.ascontiguousarray(im3[s], dtype=bool)
+        slab_dt = _load(dt3, s)
+        first_pass(slab_im, slab_dt, inf)
+        if shape3[1] > 1:
+            next_pass(slab_dt, inf)
+        if shape3[0] == 1:
+            _finish(slab_dt, squared, signed)
+        _store(dt3, s, slab_dt)
+    # The final pass couples slices along the first axis, so is carried out
+    # slab-wise along the second axis instead
+    if shape3[0] > 1:
+        for j in range(0, shape3[1], slab_size):
+            s = (slice(None), slice(j, j + slab_size))
+            slab_dt = _load(dt3, s)
+            next_pass(slab_dt.transpose(1, 0, 2), inf)
+            _finish(slab_dt, squared, signed)
+            _store(dt3, s, slab_dt)
+    return out
+
+
+def _load(arr, s):
+    r"""
+    Returns the requested slab of ``arr``, copied into memory only if ``arr``
+    is a memmap
+    """
+    if isinstance(arr, np.memmap):
+        return np.array(arr[s])
+    return arr[s]
+
+
+def _store(arr, s, slab):
+    r"""
+    Writes a slab obtained from ``_load`` back into ``arr`` if it was a copy
+    """
+    if isinstance(arr, np.memmap):
+        arr[s] = slab
+
+
+def _finish(dt, squared, signed=False):
+    if squared:
+        return
+    if signed:
+        neg = dt < 0
+        np.abs(dt, out=dt)
+        np.sqrt(dt, out=dt)
+        np.negative(dt, out=dt, where=neg)
+    else:
+        np.sqrt(dt, out=dt)
+
+
+@parallel_kernel
+def _edt_first_pass(im, dt, inf):
+    r"""
+    Squared 1D distance along the last axis using a forward and backward sweep
+    """
+    nx, ny, nz = im.shape
+    for i in prange(nx):
+        for j in range(ny):
+            last = -1
+            for k in range(nz):
+                if not im[i, j, k]:
+                    last = k
+                    dt[i, j, k] = 0
+                elif last >= 0:
+                    dt[i, j, k] = (k - last)**2
+                else:
+                    dt[i, j, k] = inf
+            last = -1
+            for k in range(nz - 1, -1, -1):
+                if not im[i, j, k]:
+                    last = k
+                elif last >= 0:
+                    d = (last - k)**2
+                    if d < dt[i, j, k]:
+                        dt[i, j, k] = d
+
+
+@parallel_kernel
+def _edt_pass(dt, inf):
+    r"""
+    Lower envelope of parabolas along the middle axis, in place
+    """
+    nx, ny, nz = dt.shape
+    for i in prange(nx):
+        f = np.empty(ny, dtype=np.float64)
+        v = np.empty(ny, dtype=np.int64)
+        z = np.empty(ny + 1, dtype=np.float64)
+        for k in range(nz):
+            first = -1
+            for q in range(ny):
+                if dt[i, q, k] == inf:
+                    f[q] = np.inf
+                else:
+                    f[q] = dt[i, q, k]
+                    if first < 0:
+                        first = q
+            if first < 0:
+                continue
+            n = 0
+            v[0] = first
+            z[0] = -np.inf
+            z[1] = np.inf
+            for q in range(first + 1, ny):
+                if f[q] == np.inf:
+                    continue
+                s = ((f[q] + q*q) - (f[v[n]] + v[n]*v[n]))/(2*q - 2*v[n])
+                while s <= z[n]:
+                    n -= 1
+                    s = ((f[q] + q*q) - (f[v[n]] + v[n]*v[n]))/(2*q - 2*v[n])
+                n += 1
+                v[n] = q
+                z[n] = s
+                z[n + 1] = np.inf
+            n = 0
+            for q in range(ny):
+                while z[n + 1] < q:
+                    n += 1
+                dt[i, q, k] = (q - v[n])**2 + f[v[n]]
+
+
+@njit
+def _lower_envelope(f, g, v, z):
+    r"""
+    Writes the lower envelope of the parabolas rooted at the finite values of
+    ``f`` into ``g``, which is all ``inf`` if there are none
+    """
+    ny = f.size
+    first = -1
+    for q in range(ny):
+        if f[q] != np.inf:
+            first = q
+            break
+    if first < 0:
+        g[:] = np.inf
+        return
+    n = 0
+    v[0] = first
+    z[0] = -np.inf
+    z[1] = np.inf
+    for q in range(first + 1, ny):
+        if f[q] == np.inf:
+            continue
+        s = ((f[q] + q*q) - (f[v[n]] + v[n]*v[n]))/(2*q - 2*v[n])
+        while s <= z[n]:
+            n -= 1
+            s = ((f[q] + q*q) - (f[v[n]] + v[n]*v[n]))/(2*q - 2*v[n])
+        n += 1
+        v[n] = q
+        z[n] = s
+        z[n + 1] = np.inf
+    n = 0
+    for q in range(ny):
+        while z[n + 1] < q:
+            n += 1
+        g[q] = (q - v[n])**2 + f[v[n]]
+
+
+@parallel_kernel
+def _signed_first_pass(im, dt, inf):
+    r"""
+    Squared 1D distance along the last axis to the nearest voxel of the other
+    phase, negated for ``False`` voxels
+    """
+    nx, ny, nz = im.shape
+    for i in prange(nx):
+        for j in range(ny):
+            last_true = -1
+            last_false = -1
+            for k in range(nz):
+                if im[i, j, k]:
+                    last_true = k
+                    if last_false >= 0:
+                        dt[i, j, k] = (k - last_false)**2
+                    else:
+                        dt[i, j, k] = inf
+                else:
+                    last_false = k
+                    if last_true >= 0:
+                        dt[i, j, k] = -(k - last_true)**2
+                    else:
+                        dt[i, j, k] = -inf
+            last_true = -1
+            last_false = -1
+            for k in range(nz - 1, -1, -1):
+                if im[i, j, k]:
+                    last_true = k
+                    if last_false >= 0:
+                        d = (last_false - k)**2
+                        if d < dt[i, j, k]:
+                            dt[i, j, k] = d
+                else:
+                    last_false = k
+                    if last_true >= 0:
+                        d = (last_true - k)**2
+                        if d < -dt[i, j, k]:
+                            dt[i, j, k] = -d
+
+
+@parallel_kernel
+def _signed_pass(dt, inf):
+    r"""
+    Lower envelopes of parabolas along the middle axis for both phases at
+    once, in place
+    """
+    nx, ny, nz = dt.shape
+    for i in prange(nx):
+        fp = np.empty(ny, dtype=np.float64)
+        fn = np.empty(ny, dtype=np.float64)
+        gp = np.empty(ny, dtype=np.float64)
+        gn = np.empty(ny, dtype=np.float64)
+        v = np.empty(ny, dtype=np.int64)
+        z = np.empty(ny + 1, dtype=np.float64)
+        for k in range(nz):
+            # Voxels of the other phase are roots of the parabolas for each
+            for q in range(ny):
+                d = dt[i, q, k]
+                if d > 0:
+                    fp[q] = np.inf if d == inf else d
+                    fn[q] = 0.0
+                else:
+                    fp[q] = 0.0
+                    fn[q] = np.inf if d == -inf else -d
+            _lower_envelope(fp, gp, v, z)
+            _lower_envelope(fn, gn, v, z)
+            for q in range(ny):
+                if dt[i, q, k] > 0:
+                    dt[i, q, k] = inf if gp[q] == np.inf else gp[q]
+                else:
+                    dt[i, q, k] = -inf if gn[q] == np.inf else -gn[q]
@@ -1,9 +1,13 @@
+import os
 import scipy as sp
 import scipy.ndimage as spim
 from collections import namedtuple
-from skimage.morphology import ball, disk
+from concurrent.futures import wait, as_completed, FIRST_COMPLETED
 from skimage.measure import marching_cubes_lewiner
 from array_split import shape_split
+from porespy.tools.__edt__ import edt
+from porespy.tools.__strel__ import get_strel
+from porespy.tools.__relabel__ import _min_uint, _label_presence, _apply_lut
 from scipy.signal import fftconvolve
 
 
@@ -190,6 +194,136 @@ def subdivide(im, divs=2):
     return s
 
 
+def map_blocks(func, im, divs=2, halo=0, executor=None, out=None,
+               reduce=None, max_pending=None, **kwargs):
+    r"""
+    Applies a function to an image block-by-block, optionally in parallel,
+    using overlapping halos to prevent artifacts at the seams.
+
+    Parameters
+    ----------
+    func : callable
+        The function to apply to each block, called as
+        ``func(block, **kwargs)``.  Any of the filters or metrics in PoreSpy
+        can be used.  If ``reduce`` is not given it must return an array the
+        same shape as the block it received.
+    im : ND-array
+        The image to process.  It can be a ``numpy.memmap``, in which case
+        each block is only read from disk when it is dispatched.
+    divs : scalar or array_like
+        The number of sub-divisions to create in each axis of the image, as
+        used by ``subdivide``.
+    halo : int
+        The number of voxels by which each block is extended on all sides
+        before being passed to ``func``.  The halo is trimmed from the result
+        so should be at least as large as the distance over which ``func``
+        looks at neighboring voxels, such as the radius of a structuring
+        element.  The default is 0.  It cannot be used with ``reduce``.
+    executor : concurrent.futures.Executor
+        An executor, such as a ``ThreadPoolExecutor`` or
+        ``ProcessPoolExecutor``, to which the blocks are submitted.  If not
+        given the blocks are processed sequentially.  Note that a process pool
+        requires ``func`` and its arguments to be picklable.
+    out : ND-array
+        An array the same shape as ``im`` into which the trimmed result of
+        each block is written.  It can be a ``numpy.memmap`` so that the
+        result need not fit in memory.  If not given an array is created
+        using the data type of the first result.  Ignored if ``reduce`` is
+        given.
+    reduce : string or callable
+        If given, the results of the blocks are combined into a single value
+        rather than written into an image.  Since a result cannot be trimmed
+        to the interior of its block, ``halo`` must be 0.  Options are:
+
+        'sum' - Adds the results, such as counts or histograms
+
+        'mean' - Averages the results, weighted by the number of voxels in
+        each block, such as for porosity
+
+        callable - Called with the list of results in block order
+
+    max_pending : int
+        The maximum number of blocks submitted to ``executor`` but not yet
+        collected, which bounds the amount of memory in use.  The default is
+        twice the number of CPUs.
+    **kwargs
+        Additional keyword arguments passed on to ``func``
+
+    Returns
+    -------
+    result : ND-array or scalar
+        ``out`` containing the result of applying ``func`` to every block, or
+        the reduced value if ``reduce`` was given.
+
+    See Also
+    --------
+    subdivide
+    extend_slice
+
+    Examples
+    --------
+    >>> import porespy as ps
+    >>> from concurrent.futures import ThreadPoolExecutor
+    >>> im = ps.generators.blobs(shape=[200, 200])
+    >>> with ThreadPoolExecutor(4) as ex:
+    ...     dt = ps.tools.map_blocks(ps.tools.edt, im, divs=2, halo=40,
+    ...                              executor=ex)
+    >>> phi = ps.tools.map_blocks(ps.metrics.porosity, im, divs=4,
+    ...                           reduce='mean')
+
+    """
+    if reduce is None and out is not None and out.shape != im.shape:
+        raise Exception('out must be the same shape as im')
+    if not (reduce in [None, 'sum', 'mean'] or callable(reduce)):
+        raise Exception('Unrecognized reduce option: ' + str(reduce))
+    if (reduce is not None) and (halo > 0):
+        raise Exception('A halo cannot be used with reduce, since the '
+                        + 'results of the blocks cannot be trimmed')
+    if max_pending is None:
+        max_pending = 2*(os.cpu_count() or 1)
+    blocks = [tuple(s) for s in subdivide(im, divs=divs).flatten()]
+    results = [None]*len(blocks)
+    pending = {}
+
+    def _collect(n, result):
+        if reduce is not None:
+            results[n] = result
+            return
+        nonlocal out
+        if out is None:
+            out = sp.empty(im.shape, dtype=sp.asarray(result).dtype)
+        s, inner = blocks[n], interiors[n]
+        out[s] = sp.asarray(result)[inner]
+
+    interiors = []
+    for s in blocks:
+        ext = extend_slice(s, im.shape, pad=halo)
+        interiors.append(tuple([slice(a.start - b.start, a.stop - b.start)
+                                for a, b in zip(s, ext)]))
+    for n, s in enumerate(blocks):
+        ext = extend_slice(s, im.shape, pad=halo)
+        block = sp.asarray(im[ext])
+        if executor is None:
+            _collect(n, func(block, **kwargs))
+            continue
+        pending[executor.submit(func, block, **kwargs)] = n
+        while len(pending) >= max_pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                _collect(pending.pop(f), f.result())
+    for f in as_completed(pending):
+        _collect(pending[f], f.result())
+    if reduce is None:
+        return out
+    if reduce == 'sum':
+        return sum(results[1:], results[0])
+    if reduce == 'mean':
+        w = sp.array([sp.prod([i.stop - i.start for i in s])
+                      for s in blocks])
+        return sum([r*n for r, n in zip(results, w)])/sp.sum(w)
+    return reduce(results)
+
+
 def bbox_to_slices(bbox):
     r"""
     Given a tuple containing bounding box coordinates, return a tuple of slice
@@ -292,21 +426,70 @@ def find_outer_region(im, r=0):
 
     """
     if r == 0:
-        dt = spim.distance_transform_edt(input=im)
+        dt = edt(im)
         r = int(sp.amax(dt))*2
     im_padded = sp.pad(array=im, pad_width=r, mode='constant',
                        constant_values=True)
-    dt = spim.distance_transform_edt(input=im_padded)
+    dt = edt(im_padded)
     seeds = (dt >= r) + get_border(shape=im_padded.shape)
     # Remove seeds not connected to edges
     labels = spim.label(seeds)[0]
     mask = labels == 1  # Assume label of 1 on edges, assured by adding border
-    dt = spim.distance_transform_edt(~mask)
+    dt = edt(~mask)
     outer_region = dt < r
     outer_region = extract_subsection(im=outer_region, shape=im.shape)
     return outer_region
 
 
+def cylindrical_roi(shape, r=None, axis=0):
+    r"""
+    Returns a boolean mask of a cylindrical region of interest, such as the
+    portion of a tomogram occupied by a cylindrical core.
+
+    The mask is built by broadcasting the squared distance along each axis
+    from the center of the image, so no arrays of coordinates the size of the
+    full image are created.
+
+    Parameters
+    ----------
+    shape : array_like
+        The shape of the image for which the mask is required
+    r : scalar
+        The radius of the cylinder.  If none if given then the default is the
+        largest cylinder that can fit inside the image.
+    axis : scalar
+        The axis along with the cylinder will be oriented.
+
+    Returns
+    -------
+    roi : ND-array
+        A boolean mask of the given ``shape`` that is ``True`` inside the
+        cylinder.  This is a read-only broadcast view of a single
+        cross-section, so it uses very little memory; use ``copy`` to obtain
+        a modifiable version.  It can be passed as the ``roi`` argument of
+        functions such as ``porosity`` and ``snow_partitioning``.
+
+    Examples
+    --------
+    >>> import porespy as ps
+    >>> roi = ps.tools.cylindrical_roi(shape=[10, 5, 5], axis=0)
+    >>> print(roi.sum())
+    130
+
+    """
+    shape = [int(i) for i in shape]
+    if r is None:
+        a = list(shape)
+        a.pop(axis)
+        r = sp.floor(sp.amin(a)/2)
+    d2 = 0
+    for ax, coords in enumerate(sp.ogrid[tuple([slice(0, s) for s in shape])]):
+        if ax != axis:
+            d2 = d2 + (coords - shape[ax]//2)**2
+    roi = d2 <= r**2
+    return sp.broadcast_to(roi, shape)
+
+
 def extract_cylinder(im, r=None, axis=0):
     r"""
     Returns a cylindrical section of the image of specified radius.
@@ -333,16 +516,12 @@ def extract_cylinder(im, r=None, axis=0):
         the sample trimmed to a cylindrical section in the center of the
         image.  The region outside the cylindrical section is labeled with
         ``True`` values since it is open space.
+
+    See Also
+    --------
+    cylindrical_roi
     """
-    if r is None:
-        a = list(im.shape)
-        a.pop(axis)
-        r = sp.floor(sp.amin(a)/2)
-    dim = [range(int(-s/2), int(s/2) + s % 2) for s in im.shape]
-    inds = sp.meshgrid(*dim, indexing='ij')
-    inds[axis] = inds[axis]*0
-    d = sp.sqrt(sp.sum(sp.square(inds), axis=0))
-    mask = d <= r
+    mask = cylindrical_roi(shape=im.shape, r=r, axis=axis)
     im[~mask] = True
     return im
 
@@ -495,7 +674,7 @@ def extend_slice(s, shape, pad=1):
     return tuple(a)
 
 
-def randomize_colors(im, keep_vals=[0]):
+def randomize_colors(im, keep_vals=[0], inplace=False):
     r'''
     Takes a greyscale image and randomly shuffles the greyscale values, so that
     all voxels labeled X will be labelled Y, and all voxels labeled Y will be
@@ -516,12 +695,18 @@ def randomize_colors(im, keep_vals=[0]):
         `[0]` which is useful for leaving the background of the image
         untouched.
 
+    inplace : Boolean
+        If ``True`` the values in ``im`` are overwritten, which avoids
+        allocating a second image.  The default is ``False``.
+
     Returns
     -------
     image : ND-array
-        An image the same size and type as ``im`` but with the greyscale values
+        An image the same size as ``im`` but with the greyscale values
         reassigned.  The unique values in both the input and output images will
-        be identical.
+        be identical.  Unless ``inplace`` is ``True`` the smallest unsigned
+        integer type that can hold the values is used, or the type of ``im``
+        if it contains negative values.
 
     Notes
     -----
@@ -551,19 +736,22 @@ def randomize_colors(im, keep_vals=[0]):
     but this can be controlled using the `keep_vals` argument.
 
     '''
-    im_flat = im.flatten()
-    keep_vals = sp.array(keep_vals)
-    swap_vals = ~sp.in1d(im_flat, keep_vals)
-    im_vals = sp.unique(im_flat[swap_vals])
-    new_vals = sp.random.permutation(im_vals)
-    im_map = sp.zeros(shape=[sp.amax(im_vals) + 1, ], dtype=int)
-    im_map[im_vals] = new_vals
-    im_new = im_map[im_flat]
-    im_new = sp.reshape(im_new, newshape=sp.shape(im))
-    return im_new
-
-
-def make_contiguous(im, keep_zeros=True):
+    present, offset = _label_presence(im)
+    im_map = sp.arange(offset, offset + present.size)
+    keep_vals = sp.array(keep_vals, dtype=int)
+    keep_vals = keep_vals - offset
+    keep_vals = keep_vals[(keep_vals >= 0)*(keep_vals < present.size)]
+    present[keep_vals] = False
+    im_vals = im_map[present]
+    im_map[present] = sp.random.permutation(im_vals)
+    if offset >= 0:
+        im_map = im_map.astype(_min_uint(offset + present.size - 1))
+    else:
+        im_map = im_map.astype(im.dtype)
+    return _apply_lut(im, im_map, offset, inplace=inplace)
+
+
+def make_contiguous(im, keep_zeros=True, inplace=False):
     r"""
     Take an image with arbitrary greyscale values and adjust them to ensure
     all values fall in a contiguous range starting at 0.
@@ -583,11 +771,22 @@ def make_contiguous(im, keep_zeros=True):
         contains negative numbers, and means that -1 will become +1, while
         0 values remain 0.
 
+    inplace : Boolean
+        If ``True`` the values in ``im`` are overwritten, which avoids
+        allocating a second image.  The default is ``False``.
+
     Returns
     -------
     image : ND-array
         An ND-array the same size as ``im`` but with all values in contiguous
-        orders.
+        orders.  Unless ``inplace`` is ``True`` the smallest unsigned integer
+        type that can hold the new values is used.
+
+    Notes
+    -----
+    The values present in the image are found with a single pass over the
+    image rather than by sorting, so the time and memory required scale
+    with the image size plus the range of values it contains.
 
     Example
     -------
@@ -600,19 +799,16 @@ def make_contiguous(im, keep_zeros=True):
      [3 4 2]]
 
     """
-    im = sp.copy(im)
-    if keep_zeros:
-        mask = (im == 0)
-        im[mask] = im.min() - 1
-    im = im - im.min()
-    im_flat = im.flatten()
-    im_vals = sp.unique(im_flat)
-    im_map = sp.zeros(shape=sp.amax(im_flat)+1)
-    im_map[im_vals] = sp.arange(0, sp.size(sp.unique(im_flat)))
-    im_new = im_map[im_flat]
-    im_new = sp.reshape(im_new, newshape=sp.shape(im))
-    im_new = sp.array(im_new, dtype=im_flat.dtype)
-    return im_new
+    present, offset = _label_presence(im)
+    zero = -offset
+    if keep_zeros and (0 <= zero < present.size) and present[zero]:
+        present[zero] = False
+        im_map = sp.cumsum(present)
+        im_map[zero] = 0
+    else:
+        im_map = sp.cumsum(present) - 1
+    im_map = im_map.astype(_min_uint(max(im_map.max(initial=0), 0)))
+    return _apply_lut(im, im_map, offset, inplace=inplace)
 
 
 def get_border(shape, thickness=1, mode='edges', return_indices=False):
@@ -821,10 +1017,7 @@ def mesh_region(region: bool, strel=None):
 
     """
     if strel is None:
-        if region.ndim == 3:
-            strel = ball(1)
-        if region.ndim == 2:
-            strel = disk(1)
+        strel = get_strel(1, ndim=region.ndim, shape='ball')
     pad_width = sp.amax(strel.shape)
     im = region
     if im.ndim == 3:
@@ -857,11 +1050,7 @@ def ps_disk(radius):
     strel : 2D-array
         A 2D numpy bool array of the structring element
     """
-    rad = int(sp.ceil(radius))
-    other = sp.ones((2*rad+1, 2*rad+1), dtype=bool)
-    other[rad, rad] = False
-    disk = spim.distance_transform_edt(other) < radius
-    return disk
+    return get_strel(radius, ndim=2, shape='ps_ball').copy()
 
 
 def ps_ball(radius):
@@ -878,11 +1067,7 @@ def ps_ball(radius):
     strel : 3D-array
         A 3D numpy array of the structuring element
     """
-    rad = int(sp.ceil(radius))
-    other = sp.ones((2*rad+1, 2*rad+1, 2*rad+1), dtype=bool)
-    other[rad, rad, rad] = False
-    ball = spim.distance_transform_edt(other) < radius
-    return ball
+    return get_strel(radius, ndim=3, shape='ps_ball').copy()
 
 
 def overlay(im1, im2, c):
@@ -949,7 +1134,7 @@ def insert_sphere(im, c, r):
     temp = im[s]
     blank = sp.ones_like(temp)
     blank[tuple(c - bbox[0:im.ndim])] = 0
-    blank = spim.distance_transform_edt(blank) < r
+    blank = edt(blank) < r
     im[s] = blank
     return im
 
@@ -994,14 +1179,14 @@ def insert_cylinder(im, xyz0, xyz1, r):
     if (xyz0 == xyz1).sum() == 2:
         unique_dim = [xyz0[i] != xyz1[i] for i in range(3)].index(True)
         shape_template[unique_dim] = 1
-        template_2D = disk(radius=r).reshape(shape_template)
+        template_2D = get_strel(r, ndim=2).reshape(shape_template)
         template = sp.repeat(template_2D, repeats=L, axis=unique_dim)
         xyz_min[unique_dim] += r
         xyz_max[unique_dim] += -r
     else:
         xyz_line_in_template_coords = [xyz_line[i] - xyz_min[i] for i in range(3)]
         template[tuple(xyz_line_in_template_coords)] = 1
-        template = spim.distance_transform_edt(template == 0) <= r
+        template = edt(template == 0) <= r
 
     im[xyz_min[0]:xyz_max[0]+1,
        xyz_min[1]:xyz_max[1]+1,
@@ -12,6 +12,9 @@ that do NOT return a modified version of the original image.
 .. autosummary::
 
     porespy.tools.bbox_to_slices
+    porespy.tools.clear_cache
+    porespy.tools.cylindrical_roi
+    porespy.tools.edt
     porespy.tools.extend_slice
     porespy.tools.extract_subsection
     porespy.tools.extract_cylinder
@@ -20,19 +23,29 @@ that do NOT return a modified version of the original image.
     porespy.tools.get_border
     porespy.tools.get_planes
     porespy.tools.get_slice
+    porespy.tools.get_strel
     porespy.tools.insert_cylinder
+    porespy.tools.insert_cylinders
     porespy.tools.insert_sphere
+    porespy.tools.insert_spheres
     porespy.tools.in_hull
     porespy.tools.make_contiguous
+    porespy.tools.map_blocks
     porespy.tools.mesh_region
+    porespy.tools.morphology
     porespy.tools.norm_to_uniform
     porespy.tools.overlay
     porespy.tools.randomize_colors
+    porespy.tools.RegionIndex
+    porespy.tools.set_cache
     porespy.tools.subdivide
     porespy.tools.ps_disk
     porespy.tools.ps_ball
 
 .. autofunction:: bbox_to_slices
+.. autofunction:: clear_cache
+.. autofunction:: cylindrical_roi
+.. autofunction:: edt
 .. autofunction:: extend_slice
 .. autofunction:: extract_subsection
 .. autofunction:: extract_cylinder
@@ -41,14 +54,22 @@ that do NOT return a modified version of the original image.
 .. autofunction:: get_border
 .. autofunction:: get_planes
 .. autofunction:: get_slice
+.. autofunction:: get_strel
 .. autofunction:: insert_cylinder
+.. autofunction:: insert_cylinders
 .. autofunction:: insert_sphere
+.. autofunction:: insert_spheres
 .. autofunction:: in_hull
 .. autofunction:: make_contiguous
+.. autofunction:: map_blocks
 .. autofunction:: mesh_region
+.. autofunction:: morphology
 .. autofunction:: norm_to_uniform
 .. autofunction:: overlay
 .. autofunction:: randomize_colors
+.. autoclass:: RegionIndex
+   :members:
+.. autofunction:: set_cache
 .. autofunction:: subdivide
 .. autofunction:: ps_disk
 .. autofunction:: ps_ball
@@ -56,6 +77,10 @@ that do NOT return a modified version of the original image.
 '''
 from .__funcs__ import align_image_with_openpnm
 from .__funcs__ import bbox_to_slices
+from .__cache__ import set_cache
+from .__cache__ import clear_cache
+from .__edt__ import edt
+from .__funcs__ import cylindrical_roi
 from .__funcs__ import extend_slice
 from .__funcs__ import extract_subsection
 from .__funcs__ import extract_cylinder
@@ -64,14 +89,20 @@ from .__funcs__ import find_outer_region
 from .__funcs__ import get_border
 from .__funcs__ import get_planes
 from .__funcs__ import get_slice
+from .__strel__ import get_strel
 from .__funcs__ import insert_cylinder
+from .__raster__ import insert_cylinders
 from .__funcs__ import insert_sphere
+from .__raster__ import insert_spheres
 from .__funcs__ import in_hull
 from .__funcs__ import make_contiguous
+from .__funcs__ import map_blocks
 from .__funcs__ import mesh_region
+from .__morph__ import morphology
 from .__funcs__ import overlay
 from .__funcs__ import norm_to_uniform
 from .__funcs__ import randomize_colors
+from .__regions__ import RegionIndex
 from .__funcs__ import subdivide
 from .__funcs__ import ps_disk
 from .__funcs__ import ps_ball
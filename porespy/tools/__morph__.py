@@ -0,0 +1,178 @@
+import time
+import numpy as np
+import scipy.ndimage as spim
+from functools import lru_cache
+from scipy.signal import fftconvolve
+from porespy.tools.__edt__ import edt
+from porespy.tools.__strel__ import get_strel, _fftconvolve_strel
+
+
+def morphology(im, strel=None, radius=None, shape='ps_ball', mode='opening',
+               backend='auto'):
+    r"""
+    Performs binary morphological operations using whichever of several
+    equivalent methods is expected to be fastest.
+
+    Parameters
+    ----------
+    im : ND-array
+        The binary image on which to perform the morphological operation
+    strel : ND-array
+        The structuring element to use, which must have the same number of
+        dimensions as ``im``.  Either ``strel`` or ``radius`` must be given.
+    radius : scalar
+        The radius of the structuring element, which is then obtained from
+        ``get_strel`` using the given ``shape``.  Specifying the element this
+        way also enables the distance transform based method.
+    shape : string
+        The shape of the structuring element when ``radius`` is given.  The
+        default is ``'ps_ball'``.  See ``get_strel`` for the options.
+    mode : string
+        The type of operation to perform.  Options are 'dilation', 'erosion',
+        'opening' and 'closing'.
+    backend : string
+        The method used to perform the operation.  Options are:
+
+        'auto' - (default) Chooses the fastest method for the given image and
+        element size based on a brief benchmark of the host machine, which is
+        run once per session
+
+        'fft' - Convolves the image with the element using FFTs, as done by
+        ``fftmorphology``.  The cost is insensitive to the element size.
+
+        'direct' - Uses the binary morphology functions in ``scipy.ndimage``,
+        which is fastest for small elements.
+
+        'edt' - Thresholds a distance transform of the image.  The cost is
+        insensitive to the element size, but it is only applicable to
+        spherical elements specified by ``radius``.
+
+    Returns
+    -------
+    image : ND-array
+        A boolean image with the specified morphological operation applied.
+        The result is identical regardless of the ``backend``, and matches
+        that of ``scipy.ndimage`` with voxels beyond the image treated as
+        background.
+
+    See Also
+    --------
+    fftmorphology
+    get_strel
+
+    Examples
+    --------
+    >>> import porespy as ps
+    >>> import scipy.ndimage as spim
+    >>> from numpy import array_equal
+    >>> im = ps.generators.blobs(shape=[100, 100], porosity=0.8)
+    >>> result = ps.tools.morphology(im, radius=5, shape='ball',
+    ...                              mode='opening')
+    >>> strel = ps.tools.get_strel(5, ndim=2, shape='ball')
+    >>> array_equal(result, spim.binary_opening(im, structure=strel))
+    True
+
+    """
+    im = np.asarray(im) > 0
+    if strel is None:
+        if radius is None:
+            raise Exception('Either strel or radius must be given')
+        strel = get_strel(radius, ndim=im.ndim, shape=shape)
+        # skimage only produces a symmetric ball for integer radii
+        spherical = (shape == 'ps_ball') or \
+            (shape == 'ball' and float(radius).is_integer())
+    else:
+        radius = None
+        spherical = False
+    strel = strel > 0
+    if backend == 'auto':
+        backend = _choose_backend(im.size, strel.sum(), im.ndim, spherical)
+    if backend == 'edt' and not spherical:
+        raise Exception('The edt backend requires a spherical element given '
+                        + 'by radius')
+    if backend not in ['fft', 'direct', 'edt']:
+        raise Exception('Unrecognized backend: ' + backend)
+    args = (strel, radius, shape, backend)
+    if mode.startswith('ero'):
+        result = _erode(im, *args)
+    elif mode.startswith('dila'):
+        result = _dilate(im, *args)
+    elif mode.startswith('open'):
+        result = _dilate(_erode(im, *args), *args)
+    elif mode.startswith('clos'):
+        result = _erode(_dilate(im, *args), *args)
+    else:
+        raise Exception('Unrecognized mode: ' + mode)
+    return result
+
+
+def _erode(im, strel, radius, shape, backend):
+    if backend == 'direct':
+        return spim.binary_erosion(im, structure=strel)
+    if backend == 'edt':
+        # Pad with background so voxels beyond the image are accounted for
+        pw = int(np.ceil(radius)) + 1
+        dt = edt(np.pad(im, pad_width=pw, mode='constant'), squared=True)
+        dt = dt[tuple([slice(pw, -pw)]*im.ndim)]
+        if shape == 'ball':
+            return dt > radius**2
+        return dt >= radius**2
+    return _convolve(im, strel, radius, shape) > (strel.sum() - 0.1)
+
+
+def _dilate(im, strel, radius, shape, backend):
+    if backend == 'direct':
+        return spim.binary_dilation(im, structure=strel)
+    if backend == 'edt':
+        dt = edt(~im, squared=True)
+        if shape == 'ball':
+            return dt <= radius**2
+        return dt < radius**2
+    return _convolve(im, strel, radius, shape) > 0.1
+
+
+def _convolve(im, strel, radius, shape):
+    if radius is not None:
+        return _fftconvolve_strel(im, radius, shape=shape)
+    return fftconvolve(im, strel, mode='same')
+
+
+def _choose_backend(size, nnz, ndim, spherical):
+    r"""
+    Predicts the time taken by each backend from the image size and the
+    number of voxels in the element, using the per-voxel costs measured by
+    ``_calibrate``.  The cost of the direct method scales with the surface
+    rather than the volume of the element.
+    """
+    c = _calibrate()
+    cost = {'fft': c['fft']*size*np.log2(max(size, 2)),
+            'direct': c['direct']*size*nnz**((ndim - 1)/ndim)}
+    if spherical:
+        cost['edt'] = c['edt']*size
+    return min(cost, key=cost.get)
+
+
+@lru_cache(maxsize=1)
+def _calibrate():
+    r"""
+    Times each backend on a small test image to find the cost per voxel of
+    each on the host machine.  This is only done once per session.
+    """
+    rs = np.random.RandomState(0)
+    im = spim.gaussian_filter(rs.rand(48, 48, 48), sigma=2) > 0.5
+    strel = get_strel(2, ndim=3, shape='ball')
+    nnz = strel.sum()
+    N = im.size
+    funcs = {
+        'fft': lambda: fftconvolve(im, strel, mode='same'),
+        'direct': lambda: spim.binary_dilation(im, structure=strel),
+        'edt': lambda: edt(~im, squared=True)}
+    costs = {}
+    for k, f in funcs.items():
+        f()  # Warm up, including compiling numba functions
+        tic = time.perf_counter()
+        f()
+        costs[k] = time.perf_counter() - tic
+    return {'fft': costs['fft']/(N*np.log2(N)),
+            'direct': costs['direct']/(N*nnz**(2/3)),
+            'edt': costs['edt']/N}
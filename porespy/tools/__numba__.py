@@ -0,0 +1,67 @@
+import os
+import threading
+import functools
+import numba
+from numba import njit
+
+# Numba's default 'workqueue' threading layer aborts the interpreter if
+# parallel kernels are launched from several threads at once, as happens
+# when functions are run on a ThreadPoolExecutor, so launches are made one
+# at a time unless a threadsafe layer is in use.  Each kernel is itself
+# multithreaded, so little is lost by doing so.
+_lock = threading.RLock()
+# The process in which the kernels were first launched.  Its threads are
+# not carried over when it forks, so a kernel launched in a forked child
+# would wait on them forever.
+_pid = None
+
+
+def parallel_kernel(func):
+    r"""
+    Compiles ``func`` with ``numba.njit(parallel=True)`` and returns a
+    function that launches it, which is safe to call from several threads
+
+    The compiled kernel is available as the ``kernel`` attribute of the
+    returned function, for use by other compiled functions.
+    """
+    kernel = njit(parallel=True)(func)
+
+    @functools.wraps(func)
+    def launch(*args):
+        _check_fork()
+        if _threadsafe():
+            return kernel(*args)
+        with _lock:
+            return kernel(*args)
+    launch.kernel = kernel
+    return launch
+
+
+def _threadsafe():
+    return _started() and (numba.threading_layer() in ['tbb', 'omp'])
+
+
+def _started():
+    try:
+        numba.threading_layer()
+        return True
+    except ValueError:
+        # No parallel kernel has been launched yet
+        return False
+
+
+def _check_fork():
+    r"""
+    Raises an exception if this process was forked from one that had already
+    launched parallel kernels, rather than letting the launch hang
+    """
+    global _pid
+    pid = os.getpid()
+    # The threading layer is only chosen once the threads have started
+    if (_pid is not None) and (_pid != pid) and _started():
+        raise Exception('Parallel kernels cannot be launched in a process '
+                        + 'forked after they were used, so process pools '
+                        + 'must use the spawn or forkserver start method, '
+                        + 'such as ProcessPoolExecutor(mp_context='
+                        + 'multiprocessing.get_context(\'spawn\'))')
+    _pid = pid
@@ -0,0 +1,354 @@
+import numpy as np
+from numba import njit, prange, config
+from porespy.tools.__numba__ import parallel_kernel
+
+
+def insert_spheres(im, centers, radii, mode='union', value=1, shape='ball'):
+    r"""
+    Inserts many spheres into an image at once using a multithreaded kernel
+
+    Parameters
+    ----------
+    im : ND-array
+        The 2D or 3D image into which the spheres are inserted, such as an
+        array of zeros with ``uint8`` type.
+    centers : array_like
+        An N-by-ndim array of the voxel coordinates of the sphere centers.
+        Centers may lie outside the image, in which case only the part of
+        each sphere lying inside it is inserted.
+    radii : array_like
+        The radius of each sphere in voxels, or a scalar to use for all.
+    mode : string
+        Controls the values written into the image.  Options are:
+
+        'union' - (default) All voxels inside any sphere are set to ``value``
+
+        'label' - Voxels inside sphere ``i`` are set to ``i + 1``, with later
+        spheres overwriting earlier ones where they overlap.  The type of
+        ``im`` must be able to hold ``N``.
+
+    value : scalar
+        The value written when ``mode`` is ``'union'``.  The default is 1.
+    shape : string
+        The shape to insert, either ``'ball'`` (default), which includes
+        voxels lying exactly on the radius like ``get_strel``, or ``'cube'``
+        which inserts cubes with a side length of ``2*radius + 1``.
+
+    Returns
+    -------
+    image : ND-array
+        The image with the spheres inserted.  This is ``im`` itself, modified
+        in place, if it is C-contiguous.
+
+    See Also
+    --------
+    insert_cylinders
+    insert_sphere
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> import porespy as ps
+    >>> im = np.zeros([20, 20], dtype=np.uint8)
+    >>> im = ps.tools.insert_spheres(im, centers=[[5, 5], [15, 0]],
+    ...                              radii=[2, 3])
+    >>> print(im.sum())
+    31
+
+    """
+    if shape not in ['ball', 'cube']:
+        raise Exception('Unrecognized shape: ' + shape)
+    im3, centers, radii, values = _parse_args(im, centers, radii, mode, value)
+    _paint_spheres(im3, centers, radii, values, shape == 'cube',
+                   _chunk_bounds(im3.shape[0]))
+    return im3.reshape(im.shape)
+
+
+def insert_cylinders(im, xyz0, xyz1, radii, mode='union', value=1):
+    r"""
+    Inserts many cylinders into an image at once using a multithreaded
+    kernel
+
+    Parameters
+    ----------
+    im : ND-array
+        The 2D or 3D image into which the cylinders are inserted, such as an
+        array of zeros with ``uint8`` type.
+    xyz0, xyz1 : array_like
+        N-by-ndim arrays of the voxel coordinates of the two end points of
+        each cylinder.  Parts of cylinders lying outside the image are
+        ignored.
+    radii : array_like
+        The radius of each cylinder in voxels, or a scalar to use for all.
+    mode : string
+        Controls the values written into the image.  Options are:
+
+        'union' - (default) All voxels inside any cylinder are set to
+        ``value``
+
+        'label' - Voxels inside cylinder ``i`` are set to ``i + 1``, with
+        later cylinders overwriting earlier ones where they overlap.  The type
+        of ``im`` must be able to hold ``N``.
+
+    value : scalar
+        The value written when ``mode`` is ``'union'``.  The default is 1.
+
+    Returns
+    -------
+    image : ND-array
+        The image with the cylinders inserted.  This is ``im`` itself,
+        modified in place, if it is C-contiguous.
+
+    Notes
+    -----
+    Each cylinder comprises all voxels within ``radius`` of the line segment
+    joining its end points, so the ends are hemispherical.  This matches the
+    result of ``insert_cylinder`` for cylinders that are not aligned with an
+    axis.
+
+    See Also
+    --------
+    insert_spheres
+    insert_cylinder
+
+    """
+    im3, xyz0, radii, values = _parse_args(im, xyz0, radii, mode, value)
+    xyz1 = _parse_args(im, xyz1, radii, mode, value)[1]
+    if xyz0.shape != xyz1.shape:
+        raise Exception('xyz0 and xyz1 must contain the same number of points')
+    _paint_cylinders(im3, xyz0, xyz1, radii, values,
+                     _chunk_bounds(im3.shape[0]))
+    return im3.reshape(im.shape)
+
+
+def _points_inside(points, centers, radii, shape='ball', xyz0=None,
+                   xyz1=None, cylinder_radii=None):
+    r"""
+    Finds which of the given voxel coordinates would be set by inserting the
+    given spheres, and optionally cylinders, with the insert functions
+
+    This allows the volume fraction of the shapes to be estimated from a
+    sample of voxels without rasterizing them.  The shapes are first sorted
+    into the cells of a coarse grid covering their bounding boxes, so each
+    point is only tested against the shapes listed in its own cell.
+    """
+    points, centers = _as3d(points), _as3d(centers)
+    radii = np.broadcast_to(np.array(radii, dtype=float),
+                            (centers.shape[0], )).copy()
+    if xyz0 is None:
+        xyz0 = xyz1 = np.zeros((0, 3))
+        cylinder_radii = np.zeros(0)
+    else:
+        xyz0, xyz1 = _as3d(xyz0), _as3d(xyz1)
+        cylinder_radii = np.broadcast_to(np.array(cylinder_radii, dtype=float),
+                                         (xyz0.shape[0], )).copy()
+    inside = np.zeros(points.shape[0], dtype=bool)
+    if points.shape[0] == 0:
+        return inside
+    # Bounding boxes of the spheres and cylinders
+    r = radii[:, None]
+    boxes = [(centers - r, centers + r)]
+    r = cylinder_radii[:, None]
+    boxes.append((np.minimum(xyz0, xyz1) - r, np.maximum(xyz0, xyz1) + r))
+    # Cells about as wide as the spheres, but no more of them than shapes
+    origin = points.min(axis=0)
+    extent = points.max(axis=0) - origin + 1
+    nshapes = max(centers.shape[0] + xyz0.shape[0], 1)
+    ndim = max(np.sum(extent > 1), 1)
+    cell = max(2*np.median(radii) if radii.size else 1.0,
+               (np.prod(extent)/nshapes)**(1/ndim), 1.0)
+    grid = np.ceil(extent/cell).astype(np.int64)
+    buckets = [_bucket(lo, hi, origin, cell, grid) for lo, hi in boxes]
+    _test_points(points, centers, radii, shape == 'cube', xyz0, xyz1,
+                 cylinder_radii, origin, cell, grid, *buckets[0],
+                 *buckets[1], inside)
+    return inside
+
+
+def _bucket(lo, hi, origin, cell, grid):
+    r"""
+    Lists the shapes whose bounding box, from ``lo`` to ``hi``, overlaps each
+    cell of the grid, returning the offsets into the list for each flat cell
+    index and the list itself
+    """
+    ok = np.all((hi >= origin) * (lo < origin + grid*cell), axis=1)
+    a = np.clip(np.floor((lo - origin)/cell), 0, grid - 1).astype(np.int64)
+    b = np.clip(np.floor((hi - origin)/cell), 0, grid - 1).astype(np.int64)
+    counts = np.zeros(np.prod(grid), dtype=np.int64)
+    _count_buckets(a, b, ok, grid, counts)
+    offsets = np.append(0, np.cumsum(counts))
+    ids = np.zeros(offsets[-1], dtype=np.int64)
+    _fill_buckets(a, b, ok, grid, offsets[:-1].copy(), ids)
+    return offsets, ids
+
+
+@njit
+def _count_buckets(a, b, ok, grid, counts):
+    for n in range(a.shape[0]):
+        if ok[n]:
+            for i in range(a[n, 0], b[n, 0] + 1):
+                for j in range(a[n, 1], b[n, 1] + 1):
+                    for k in range(a[n, 2], b[n, 2] + 1):
+                        counts[(i*grid[1] + j)*grid[2] + k] += 1
+
+
+@njit
+def _fill_buckets(a, b, ok, grid, starts, ids):
+    for n in range(a.shape[0]):
+        if ok[n]:
+            for i in range(a[n, 0], b[n, 0] + 1):
+                for j in range(a[n, 1], b[n, 1] + 1):
+                    for k in range(a[n, 2], b[n, 2] + 1):
+                        c = (i*grid[1] + j)*grid[2] + k
+                        ids[starts[c]] = n
+                        starts[c] += 1
+
+
+def _as3d(coords):
+    r"""
+    Pads 2D coordinates with a leading zero to match the 3D kernels
+    """
+    coords = np.array(coords, dtype=float, ndmin=2)
+    N = coords.shape[0]
+    return np.hstack((np.zeros((N, 3 - coords.shape[1])), coords))
+
+
+def _parse_args(im, coords, radii, mode, value):
+    r"""
+    Converts the arguments of the insert functions to the 3D views and
+    arrays expected by the kernels
+    """
+    if im.ndim not in [2, 3]:
+        raise Exception('Only 2D and 3D images are supported')
+    coords = np.array(coords, dtype=float, ndmin=2)
+    if coords.shape[1] != im.ndim:
+        raise Exception('Coordinates do not match dimensionality of image')
+    N = coords.shape[0]
+    coords = np.hstack((np.zeros((N, 3 - im.ndim)), coords))
+    radii = np.broadcast_to(np.array(radii, dtype=float), (N, )).copy()
+    if mode == 'union':
+        values = np.full(N, value, dtype=im.dtype)
+    elif mode == 'label':
+        if (im.dtype.kind in 'iu') and (N > np.iinfo(im.dtype).max):
+            raise Exception('The labels do not fit in the image dtype')
+        values = np.arange(1, N + 1).astype(im.dtype)
+    else:
+        raise Exception('Unrecognized mode: ' + mode)
+    im3 = im.reshape((1, )*(3 - im.ndim) + im.shape)
+    return im3, coords, radii, values
+
+
+def _chunk_bounds(n):
+    r"""
+    Splits the first axis into several chunks per thread so that each thread
+    writes to its own slabs of the image
+    """
+    nchunks = min(n, 4*config.NUMBA_NUM_THREADS)
+    return np.linspace(0, n, nchunks + 1).astype(np.int64)
+
+
+@njit
+def _clip_range(lo, hi, n):
+    a = max(int(np.ceil(lo)), 0)
+    b = min(int(np.floor(hi)) + 1, n)
+    return a, b
+
+
+@parallel_kernel
+def _paint_spheres(im, centers, radii, values, cube, bounds):
+    nx, ny, nz = im.shape
+    for k in prange(bounds.size - 1):
+        for n in range(centers.shape[0]):
+            cx, cy, cz = centers[n, 0], centers[n, 1], centers[n, 2]
+            r = radii[n]
+            i0, i1 = _clip_range(cx - r, cx + r, nx)
+            i0, i1 = max(i0, bounds[k]), min(i1, bounds[k + 1])
+            if i0 >= i1:
+                continue
+            j0, j1 = _clip_range(cy - r, cy + r, ny)
+            l0, l1 = _clip_range(cz - r, cz + r, nz)
+            r2 = r*r
+            for i in range(i0, i1):
+                for j in range(j0, j1):
+                    for m in range(l0, l1):
+                        if not cube:
+                            d2 = (i - cx)**2 + (j - cy)**2 + (m - cz)**2
+                            if d2 > r2:
+                                continue
+                        im[i, j, m] = values[n]
+
+
+@parallel_kernel
+def _paint_cylinders(im, xyz0, xyz1, radii, values, bounds):
+    nx, ny, nz = im.shape
+    for k in prange(bounds.size - 1):
+        for n in range(xyz0.shape[0]):
+            ax, ay, az = xyz0[n, 0], xyz0[n, 1], xyz0[n, 2]
+            dx = xyz1[n, 0] - ax
+            dy = xyz1[n, 1] - ay
+            dz = xyz1[n, 2] - az
+            r = radii[n]
+            i0, i1 = _clip_range(min(ax, ax + dx) - r, max(ax, ax + dx) + r,
+                                 nx)
+            i0, i1 = max(i0, bounds[k]), min(i1, bounds[k + 1])
+            if i0 >= i1:
+                continue
+            j0, j1 = _clip_range(min(ay, ay + dy) - r, max(ay, ay + dy) + r,
+                                 ny)
+            l0, l1 = _clip_range(min(az, az + dz) - r, max(az, az + dz) + r,
+                                 nz)
+            L2 = dx*dx + dy*dy + dz*dz
+            r2 = r*r
+            for i in range(i0, i1):
+                for j in range(j0, j1):
+                    for m in range(l0, l1):
+                        px, py, pz = i - ax, j - ay, m - az
+                        t = 0.0
+                        if L2 > 0:
+                            t = (px*dx + py*dy + pz*dz)/L2
+                            t = min(max(t, 0.0), 1.0)
+                        d2 = (px - t*dx)**2 + (py - t*dy)**2 + (pz - t*dz)**2
+                        if d2 <= r2:
+                            im[i, j, m] = values[n]
+
+
+@parallel_kernel
+def _test_points(points, centers, radii, cube, xyz0, xyz1, cradii, origin,
+                 cell, grid, p_offsets, p_ids, t_offsets, t_ids, inside):
+    for p in prange(points.shape[0]):
+        x, y, z = points[p, 0], points[p, 1], points[p, 2]
+        i = min(int((x - origin[0])/cell), grid[0] - 1)
+        j = min(int((y - origin[1])/cell), grid[1] - 1)
+        k = min(int((z - origin[2])/cell), grid[2] - 1)
+        c = (i*grid[1] + j)*grid[2] + k
+        for q in range(p_offsets[c], p_offsets[c + 1]):
+            n = p_ids[q]
+            dx = abs(x - centers[n, 0])
+            dy = abs(y - centers[n, 1])
+            dz = abs(z - centers[n, 2])
+            r = radii[n]
+            if cube:
+                hit = (dx <= r) and (dy <= r) and (dz <= r)
+            else:
+                hit = dx*dx + dy*dy + dz*dz <= r*r
+            if hit:
+                inside[p] = True
+                break
+        if inside[p]:
+            continue
+        for q in range(t_offsets[c], t_offsets[c + 1]):
+            n = t_ids[q]
+            ax, ay, az = xyz0[n, 0], xyz0[n, 1], xyz0[n, 2]
+            dx = xyz1[n, 0] - ax
+            dy = xyz1[n, 1] - ay
+            dz = xyz1[n, 2] - az
+            px, py, pz = x - ax, y - ay, z - az
+            L2 = dx*dx + dy*dy + dz*dz
+            t = 0.0
+            if L2 > 0:
+                t = (px*dx + py*dy + pz*dz)/L2
+                t = min(max(t, 0.0), 1.0)
+            d2 = (px - t*dx)**2 + (py - t*dy)**2 + (pz - t*dz)**2
+            if d2 <= cradii[n]**2:
+                inside[p] = True
+                break
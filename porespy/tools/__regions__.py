@@ -0,0 +1,202 @@
+import numpy as np
+
+
+class RegionIndex(object):
+    r"""
+    An index of the voxels belonging to each region of a labeled image, stored
+    in compressed sparse row (CSR) form.
+
+    The index is built with a single stable sort of the labels so that every
+    subsequent query about a region costs time proportional to the size of
+    that region rather than to the size of its bounding box or the image.
+
+    Parameters
+    ----------
+    im : ND-array
+        An image of non-negative integer labels.  Voxels labeled 0 are treated
+        as background and are not indexed.
+
+    Attributes
+    ----------
+    shape : tuple
+        The shape of the indexed image
+    num_regions : int
+        The largest label in the image.  Regions are labeled 1 through
+        ``num_regions`` and labels absent from the image are empty.
+    voxels : ND-array
+        The flat (C-order) indices of all labeled voxels, sorted by label and
+        then by position.
+    offsets : ND-array
+        An array of length ``num_regions + 1`` such that the voxels of region
+        ``i`` are ``voxels[offsets[i - 1]:offsets[i]]``.
+    counts : ND-array
+        The number of voxels in each region, offset by 1 so that the size of
+        region 1 is stored in ``counts[0]``.
+    bbox : ND-array
+        An ``num_regions`` by ``2*ndim`` array holding the lower (inclusive)
+        and upper (exclusive) corners of the bounding box of each region,
+        offset by 1 in the same way as ``counts``.  Empty regions have a
+        bounding box of all zeros.
+
+    Notes
+    -----
+    The index can be built once and passed to any of the functions that
+    accept an ``index`` argument, such as ``regions_to_network``, and can be
+    written to disk with ``save`` and reloaded with ``load``.
+
+    Examples
+    --------
+    >>> import porespy as ps
+    >>> import scipy.ndimage as spim
+    >>> im = ps.generators.blobs(shape=[50, 50])
+    >>> labels = spim.label(im)[0]
+    >>> index = ps.tools.RegionIndex(labels)
+    >>> mask = index.mask(1)
+
+    """
+
+    def __init__(self, im=None):
+        if im is None:
+            return
+        im = np.asarray(im)
+        if im.dtype == bool:
+            im = im.astype(np.uint8)
+        if (im.dtype.kind not in 'iu') or (im.size and im.min() < 0):
+            raise Exception('Image must contain non-negative integer labels')
+        flat = im.ravel()
+        self.shape = im.shape
+        voxels = np.flatnonzero(flat)
+        labels = flat[voxels]
+        order = np.argsort(labels, kind='stable')
+        self.voxels = voxels[order]
+        labels = labels[order]
+        N = int(labels[-1]) if labels.size else 0
+        self.num_regions = N
+        self.counts = np.bincount(labels, minlength=N + 1)[1:]
+        self.offsets = np.zeros(N + 1, dtype=np.int64)
+        np.cumsum(self.counts, out=self.offsets[1:])
+        self.bbox = np.zeros((N, 2*im.ndim), dtype=np.int64)
+        full = np.where(self.counts > 0)[0]
+        if full.size:
+            starts = self.offsets[full]
+            coords = np.unravel_index(self.voxels, self.shape)
+            for ax, c in enumerate(coords):
+                self.bbox[full, ax] = np.minimum.reduceat(c, starts)
+                self.bbox[full, ax + im.ndim] = \
+                    np.maximum.reduceat(c, starts) + 1
+
+    def __len__(self):
+        return self.num_regions
+
+    def _check(self, label):
+        if (label < 1) or (label > self.num_regions):
+            raise Exception('Label ' + str(label) + ' is not in the index')
+
+    def indices(self, label):
+        r"""
+        Returns the flat indices of the voxels belonging to the given region
+        """
+        self._check(label)
+        return self.voxels[self.offsets[label - 1]:self.offsets[label]]
+
+    def coords(self, label):
+        r"""
+        Returns a tuple of arrays containing the coordinates of the voxels
+        belonging to the given region, suitable for indexing the image
+        """
+        return np.unravel_index(self.indices(label), self.shape)
+
+    def slices(self, label):
+        r"""
+        Returns a tuple of slice objects spanning the bounding box of the
+        given region, in the same format as ``scipy.ndimage.find_objects``, or
+        ``None`` if the region is empty
+        """
+        self._check(label)
+        if self.counts[label - 1] == 0:
+            return None
+        nd = len(self.shape)
+        b = self.bbox[label - 1]
+        return tuple([slice(b[i], b[i + nd]) for i in range(nd)])
+
+    def mask(self, label, slices=None):
+        r"""
+        Returns a boolean image of the given region cropped to its bounding
+        box, or to ``slices`` if given
+
+        Parameters
+        ----------
+        label : int
+            The region of interest
+        slices : tuple of slice objects
+            The portion of the image to return, such as obtained by applying
+            ``extend_slice`` to the result of ``slices``.  The region must lie
+            within it.
+
+        Returns
+        -------
+        mask : ND-array
+            A boolean image which is ``True`` on the region
+        """
+        if slices is None:
+            slices = self.slices(label)
+        if slices is None:
+            return np.zeros([0]*len(self.shape), dtype=bool)
+        shape = tuple([s.stop - s.start for s in slices])
+        mask = np.zeros(shape, dtype=bool)
+        local = tuple([c - s.start for c, s in
+                       zip(self.coords(label), slices)])
+        mask[local] = True
+        return mask
+
+    def reduce(self, values, func=np.add, fill=0):
+        r"""
+        Applies a reduction to the values lying in each region
+
+        Parameters
+        ----------
+        values : ND-array
+            An image the same shape as the indexed image
+        func : numpy ufunc
+            The reduction to apply, such as ``numpy.maximum``.  The default
+            is ``numpy.add``.
+        fill : scalar
+            The value assigned to empty regions and to the background
+
+        Returns
+        -------
+        result : ND-array
+            An array of length ``num_regions + 1`` with the result for region
+            ``i`` stored in element ``i``, so it can be indexed by a labeled
+            image directly.
+        """
+        if not isinstance(func, np.ufunc):
+            raise Exception('func must be a numpy ufunc, such as np.maximum')
+        vals = np.asarray(values).ravel()[self.voxels]
+        result = np.full(self.num_regions + 1, fill, dtype=vals.dtype)
+        full = np.where(self.counts > 0)[0]
+        if full.size:
+            result[full + 1] = func.reduceat(vals, self.offsets[full])
+        return result
+
+    def save(self, filename):
+        r"""
+        Writes the index to an uncompressed ``npz`` file
+        """
+        np.savez(filename, shape=np.array(self.shape), voxels=self.voxels,
+                 offsets=self.offsets, counts=self.counts, bbox=self.bbox)
+
+    @classmethod
+    def load(cls, filename):
+        r"""
+        Reads an index that was written by ``save``
+        """
+        index = cls()
+        with np.load(filename) as f:
+            index.shape = tuple(f['shape'].tolist())
+            index.voxels = f['voxels']
+            index.offsets = f['offsets']
+            index.counts = f['counts']
+            index.bbox = f['bbox']
+        index.num_regions = index.counts.size
+        return index
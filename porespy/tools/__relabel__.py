@@ -0,0 +1,69 @@
+import numpy as np
+from numba import njit, prange
+from porespy.tools.__numba__ import parallel_kernel
+
+
+def _min_uint(n):
+    r"""
+    Returns the smallest unsigned integer type that can hold the value ``n``
+    """
+    for t in [np.uint8, np.uint16, np.uint32]:
+        if n <= np.iinfo(t).max:
+            return np.dtype(t)
+    return np.dtype(np.uint64)
+
+
+def _label_presence(im):
+    r"""
+    Finds which values in the range ``[im.min(), im.max()]`` occur in ``im``
+
+    Returns
+    -------
+    present, offset : tuple
+        A boolean array with element ``i`` indicating whether the value
+        ``i + offset`` appears in the image, and the value of ``offset``
+    """
+    if im.dtype.kind not in 'biu':
+        raise Exception('Image must contain integer values')
+    flat = im.reshape(-1)
+    if flat.dtype == bool:
+        flat = flat.view(np.uint8)
+    if flat.size == 0:
+        return np.zeros(0, dtype=bool), 0
+    lo, hi = int(flat.min()), int(flat.max())
+    present = np.zeros(hi - lo + 1, dtype=bool)
+    _presence(flat, present, flat.dtype.type(lo))
+    return present, lo
+
+
+def _apply_lut(im, lut, offset, inplace=False):
+    r"""
+    Replaces each value ``v`` in ``im`` with ``lut[v - offset]``, either in
+    place or into a new array of the same type as ``lut``
+    """
+    flat = im.reshape(-1)
+    if flat.dtype == bool:
+        flat = flat.view(np.uint8)
+    if inplace:
+        if not im.flags['C_CONTIGUOUS']:
+            raise Exception('In-place relabeling requires a contiguous array')
+        if lut.size and (lut.max() > np.iinfo(im.dtype).max):
+            raise Exception('The new labels do not fit in the image dtype')
+        lut = lut.astype(im.dtype)
+        out = flat
+    else:
+        out = np.empty(flat.shape, dtype=lut.dtype)
+    _relabel(flat, lut, flat.dtype.type(offset), out)
+    return out.reshape(im.shape) if not inplace else im
+
+
+@njit
+def _presence(flat, present, offset):
+    for i in range(flat.size):
+        present[flat[i] - offset] = True
+
+
+@parallel_kernel
+def _relabel(flat, lut, offset, out):
+    for i in prange(flat.size):
+        out[i] = lut[flat[i] - offset]
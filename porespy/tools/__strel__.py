@@ -0,0 +1,143 @@
+import numpy as np
+import scipy.ndimage as spim
+from collections import namedtuple
+from functools import lru_cache
+from scipy.fftpack import next_fast_len
+from skimage.morphology import ball, disk, cube, square, octahedron, diamond
+from porespy.tools.__edt__ import edt
+
+
+def get_strel(radius, ndim=3, shape='ball', spectrum=None, offsets=False):
+    r"""
+    Returns a cached, read-only structuring element of the requested size and
+    shape.
+
+    Structuring elements are frequently needed repeatedly with the same size,
+    such as once per pore or once per radius in a loop, so this function
+    creates each one only once and returns the same array on subsequent calls.
+
+    Parameters
+    ----------
+    radius : scalar
+        The radius of the structuring element.  For ``'cube'`` the side length
+        of the element is ``2*radius + 1``.
+    ndim : int
+        The number of dimensions of the element, either 2 or 3.  The default
+        is 3.
+    shape : string
+        The shape of the element.  Options are:
+
+        'ball' - A disk or sphere as created by ``skimage.morphology``, which
+        includes voxels lying on the radius
+
+        'ps_ball' - A disk or sphere as created by ``ps_disk`` or ``ps_ball``,
+        which excludes voxels lying on the radius
+
+        'cube' - A square or cube
+
+        'diamond' - A diamond or octahedron
+
+    spectrum : tuple of ints
+        If given, the real FFT of the element zero-padded to this shape is
+        also returned, for use in an FFT based convolution.  Unlike the
+        element itself the spectrum is as large as the padded image, so it is
+        computed on each call rather than cached.
+    offsets : boolean
+        If ``True``, the coordinates of the voxels on the surface of the
+        element, relative to its center, are also returned.
+
+    Returns
+    -------
+    strel : ND-array or named-tuple
+        The structuring element, which cannot be written to; use ``copy`` to
+        obtain a modifiable version.  If ``spectrum`` or ``offsets`` are
+        requested then a named-tuple containing ``strel``, ``spectrum`` and
+        ``offsets`` is returned, with ``None`` for those not requested.
+
+    Examples
+    --------
+    >>> import porespy as ps
+    >>> s = ps.tools.get_strel(radius=2, ndim=2, shape='ball')
+    >>> print(s.shape)
+    (5, 5)
+    >>> s is ps.tools.get_strel(radius=2, ndim=2, shape='ball')
+    True
+
+    """
+    radius = _to_key(radius)
+    strel = _strel(radius, int(ndim), shape)
+    if (spectrum is None) and (not offsets):
+        return strel
+    spec = None
+    if spectrum is not None:
+        spec = _spectrum(radius, int(ndim), shape,
+                         tuple([int(i) for i in spectrum]))
+    offs = _offsets(radius, int(ndim), shape) if offsets else None
+    result = namedtuple('strel', ('strel', 'spectrum', 'offsets'))
+    return result(strel, spec, offs)
+
+
+def _to_key(radius):
+    r"""
+    Converts the radius to a plain python number so that equivalent values,
+    such as ``3``, ``3.0`` and ``numpy.int64(3)``, share a cache entry
+    """
+    radius = float(radius)
+    if radius.is_integer():
+        radius = int(radius)
+    return radius
+
+
+def _readonly(arr):
+    arr.flags.writeable = False
+    return arr
+
+
+@lru_cache(maxsize=256)
+def _strel(radius, ndim, shape):
+    if ndim not in [2, 3]:
+        raise Exception('Structuring elements must be 2D or 3D')
+    if shape == 'ball':
+        strel = ball(radius) if ndim == 3 else disk(radius)
+    elif shape == 'ps_ball':
+        rad = int(np.ceil(radius))
+        other = np.ones([2*rad + 1]*ndim, dtype=bool)
+        other[(rad, )*ndim] = False
+        strel = edt(other) < radius
+    elif shape == 'cube':
+        width = int(2*radius + 1)
+        strel = cube(width) if ndim == 3 else square(width)
+    elif shape == 'diamond':
+        strel = octahedron(radius) if ndim == 3 else diamond(radius)
+    else:
+        raise Exception('Unrecognized structuring element shape: ' + shape)
+    return _readonly(strel)
+
+
+def _spectrum(radius, ndim, shape, fft_shape):
+    strel = _strel(radius, ndim, shape)
+    return _readonly(np.fft.rfftn(strel, s=fft_shape))
+
+
+@lru_cache(maxsize=256)
+def _offsets(radius, ndim, shape):
+    strel = _strel(radius, ndim, shape) > 0
+    inner = spim.binary_erosion(strel, border_value=0)
+    center = np.array(strel.shape)//2
+    return _readonly(np.argwhere(strel*~inner) - center)
+
+
+def _fftconvolve_strel(im, radius, shape='ps_ball'):
+    r"""
+    Equivalent to ``scipy.signal.fftconvolve(im, strel, mode='same')`` but
+    reuses the cached structuring element
+    """
+    strel = get_strel(radius, ndim=im.ndim, shape=shape)
+    full = [a + b - 1 for a, b in zip(im.shape, strel.shape)]
+    fshape = [next_fast_len(i) for i in full]
+    spec = get_strel(radius, ndim=im.ndim, shape=shape,
+                     spectrum=fshape).spectrum
+    result = np.fft.irfftn(np.fft.rfftn(im, s=fshape)*spec, s=fshape)
+    s = tuple([slice((b - 1)//2, (b - 1)//2 + a)
+               for a, b in zip(im.shape, strel.shape)])
+    return result[s]
@@ -184,6 +184,17 @@ class FilterTest():
                                      access_limited=False)
         assert mip.max() <= sizes.max()
 
+    def test_porosimetry_roi(self):
+        roi = ps.tools.cylindrical_roi(self.im.shape, axis=0)
+        mip = ps.filters.porosimetry(self.im, roi=roi)
+        assert sp.all(mip[~roi] == 0)
+        assert sp.all(mip[roi*~self.im] == 0)
+
+    def test_snow_partitioning_roi(self):
+        roi = ps.tools.cylindrical_roi(self.im.shape, axis=0)
+        regions = ps.filters.snow_partitioning(self.im, roi=roi)
+        assert sp.all(regions[~roi] == 0)
+
     def test_morphology_fft_dilate_2D(self):
         im = ps.generators.blobs(shape=[100, 100])
         truth = spim.binary_dilation(im, structure=disk(3))
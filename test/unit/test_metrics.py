@@ -94,6 +94,16 @@ class MetricsTest():
         chords = ps.filters.apply_chords(self.im3D)
         ps.metrics.chord_length_distribution(chords, normalization='length')
 
+    def test_chord_lengths(self):
+        chords = ps.filters.apply_chords(self.blobs, spacing=1, axis=1)
+        a = ps.metrics.chord_counts(chords)
+        b = ps.metrics.chord_lengths(self.blobs, spacing=1, axis=1)
+        assert sp.all(sp.sort(a) == sp.sort(b))
+        c = ps.metrics.chord_lengths(self.blobs, axis=None)
+        assert c.size > b.size
+        cld = ps.metrics.chord_length_distribution(c)
+        assert sp.allclose(sp.sum(cld.relfreq), 1.0)
+
     def test_mesh_surface_area(self):
         region = self.regions == 1
         mesh = ps.tools.mesh_region(region)
@@ -114,6 +124,27 @@ class MetricsTest():
         assert sp.all(ia.conns[0] == [0, 1])
         assert sp.around(ia.area[0], decimals=2) == 8.85
 
+    def test_region_areas(self):
+        im = sp.zeros([20, 10, 10], dtype=int)
+        im[:10, ...] = 1
+        im[10:, ...] = 2
+        areas = ps.metrics.region_areas(im)
+        assert sp.allclose(areas.surface_area[0], areas.surface_area[1])
+        assert sp.all(areas.conns == [[0, 1]])
+        # The shared face is flat apart from where it meets the image edges
+        assert 81 < areas.area[0] < 100
+        areas2 = ps.metrics.region_areas(im, voxel_size=2)
+        assert sp.allclose(areas2.area, 4*areas.area)
+        areas = ps.metrics.region_areas(self.regions)
+        sa = ps.metrics.region_surface_areas(self.regions)
+        conns = ps.metrics.region_interface_areas(self.regions, sa).conns
+        assert sp.all(areas.conns == conns)
+        assert sp.all(areas.surface_area > 0)
+        # Non-positive interfacial areas are replaced in scaled units
+        noise = sp.random.randint(0, 6, size=[8, 8, 8])
+        areas = ps.metrics.region_areas(noise, voxel_size=0.5)
+        assert sp.all(areas.area >= 0.25)
+
     def test_phase_fraction(self):
         im = sp.reshape(sp.random.randint(0, 10, 1000), [10, 10, 10])
         labels = sp.unique(im, return_counts=True)[1]
@@ -125,6 +156,37 @@ class MetricsTest():
         with pytest.raises(Exception):
             ps.metrics.phase_fraction(sp.rand(10, 10, 10), normed=True)
 
+    def test_roi(self):
+        roi = ps.tools.cylindrical_roi(self.blobs.shape, axis=2)
+        phi = ps.metrics.porosity(self.blobs, roi=roi)
+        assert phi == self.blobs[roi].sum()/roi.sum()
+        prof = ps.metrics.porosity_profile(self.blobs, axis=2, roi=roi)
+        assert sp.allclose(prof.mean(), phi*100, rtol=1e-6)
+        counts = ps.metrics.phase_fraction(self.blobs, normed=False, roi=roi)
+        assert counts.sum() == roi.sum()
+        psd = ps.metrics.pore_size_distribution(self.blobs*2.0, roi=roi,
+                                                log=False)
+        assert sp.allclose(psd.cdf[0], 1)
+
+    def test_radial_density_roi(self):
+        for im in [self.blobs, self.blobs[..., 50]]:
+            # The whole-image calculation the cropped one must reproduce
+            dt = spim.distance_transform_edt(im)
+            dt[ps.filters.find_dt_artifacts(dt) == 0] = 0
+            # Boxes reaching the edges, where the artifacts are
+            for box in [slice(0, 30), slice(65, None)]:
+                roi = sp.zeros(im.shape, dtype=bool)
+                roi[(box, )*im.ndim] = True
+                roi *= ps.tools.cylindrical_roi(im.shape, axis=0)
+                x = dt[roi]
+                h = sp.histogram(x[x > 0], bins=10, density=True)
+                den = ps.metrics.radial_density(im, roi=roi)
+                assert sp.allclose(den.pdf, h[0])
+                assert sp.allclose(den.bin_edges, h[1])
+                den = ps.metrics.radial_density(
+                    spim.distance_transform_edt(im), roi=roi)
+                assert sp.allclose(den.pdf, h[0])
+
 
 if __name__ == '__main__':
     t = MetricsTest()
@@ -1,8 +1,45 @@
+import os
+import sys
+import tempfile
+import multiprocessing
 import pytest
 import numpy as np
+import scipy.ndimage as spim
 import porespy as ps
 import openpnm as op
 from numpy.testing import assert_allclose
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from skimage.segmentation import find_boundaries
+
+
+def _old_boundary_regions(regions, faces):
+    # The whole-image algorithm add_boundary_regions replaced, apart from
+    # offsetting each face by one more than the largest label
+    im = np.pad(regions, 1, 'edge')
+    if im.ndim == 3:
+        sides = [(['left'], ['right']), (['front'], ['back']),
+                 (['bottom'], ['top'])]
+        order = [(2, 0), (2, 1), (0, 0), (0, 1), (1, 0), (1, 1)]
+    else:
+        sides = [(['left'], ['right']), (['front', 'bottom'], ['back', 'top'])]
+        order = [(0, 0), (0, 1), (1, 0), (1, 1)]
+
+    def plane(ax, side):
+        ind = [slice(None)]*im.ndim
+        ind[ax] = -side
+        return tuple(ind)
+    for ax, side in order:
+        im[plane(ax, side)] += im.max() + 1
+    for ax, side in order:
+        p = im[plane(ax, side)]
+        im[plane(ax, side)] = ~find_boundaries(p, mode='outer')*p
+    im = np.pad(im, 2, 'edge')
+    for ax, (lo, hi) in enumerate(sides):
+        ind = [slice(None)]*im.ndim
+        ind[ax] = slice(0 if set(lo) & set(faces) else 3,
+                        None if set(hi) & set(faces) else -3)
+        im = im[tuple(ind)]
+    return im
 
 
 class NetExtractTest():
@@ -21,6 +58,98 @@ class NetExtractTest():
                 found_nans = True
         assert found_nans is False
 
+    def test_regions_to_network_throats(self):
+        im = np.array([[1, 1, 2, 2],
+                       [1, 1, 2, 2],
+                       [3, 3, 3, 3]])
+        dt = np.array([[1.0, 1.0, 1.0, 1.0],
+                       [1.0, 2.0, 3.0, 1.0],
+                       [1.0, 1.0, 1.0, 1.0]])
+        net = ps.networks.regions_to_network(im, dt=dt)
+        assert np.all(net['throat.conns'] == [[0, 1], [0, 2], [1, 2]])
+        assert np.all(net['throat.area'] == [2, 2, 2])
+        assert np.all(net['throat.inscribed_diameter'] == [6, 2, 2])
+        assert np.all(net['throat.perimeter'] == [1, 2, 2])
+        assert np.all(net['throat.centroid'][:, :2] == [[1, 2], [2, 0],
+                                                        [2, 2]])
+
+    def test_regions_to_network_pores(self):
+        im = np.ones([5, 7], dtype=int)
+        im[:, 4:] = 2
+        net = ps.networks.regions_to_network(im, dt=np.ones(im.shape))
+        assert np.all(net['pore.volume'] == [20, 15])
+        assert np.all(net['pore.inscribed_diameter'] == [4, 4])
+        assert np.all(net['pore.surface_area'] == [14, 12])
+        assert np.all(net['pore.coords'][:, :2] == [[1, 1], [1, 5]])
+
+    def test_regions_to_network_inscribed_diameter(self):
+        np.random.seed(0)
+        for shape in [[120, 120], [50, 50, 50]]:
+            im = ps.generators.blobs(shape=shape, porosity=0.6)
+            regions = ps.filters.snow_partitioning(im)
+            net = ps.networks.regions_to_network(regions)
+            # The padded transform of each region on its own
+            dia = []
+            for i, s in enumerate(spim.find_objects(regions)):
+                pore_dt = spim.distance_transform_edt(
+                    np.pad(regions[s] == i + 1, 1, mode='constant'))
+                dia.append(2*pore_dt.max())
+            assert_allclose(net['pore.inscribed_diameter'], dia)
+
+    def test_regions_to_network_executor(self):
+        im = self.snow.regions*self.im
+        net = ps.networks.regions_to_network(im)
+        with ThreadPoolExecutor(2) as ex:
+            net2 = ps.networks.regions_to_network(im, executor=ex)
+        for key in net.keys():
+            assert_allclose(net2[key], net[key])
+        with ProcessPoolExecutor(2) as ex:
+            with pytest.raises(Exception):
+                ps.networks.regions_to_network(im, executor=ex)
+
+    def test_regions_to_network_matches_openpnm_models(self):
+        net = ps.networks.regions_to_network(self.snow3d.regions*self.im3d,
+                                             voxel_size=1e-5)
+        pn = op.network.GenericNetwork()
+        pn.update(net)
+        pn.add_model(propname='throat.endpoints',
+                     model=op.models.geometry.throat_endpoints.spherical_pores,
+                     pore_diameter='pore.inscribed_diameter',
+                     throat_diameter='throat.inscribed_diameter')
+        pn.add_model(propname='throat.conduit_lengths',
+                     model=op.models.geometry.throat_length.conduit_lengths)
+        pn.add_model(propname='pore.area',
+                     model=op.models.geometry.pore_area.sphere)
+        for key in ['throat.endpoints.head', 'throat.endpoints.tail',
+                    'throat.conduit_lengths.pore1',
+                    'throat.conduit_lengths.pore2',
+                    'throat.conduit_lengths.throat', 'pore.area']:
+            assert_allclose(net[key], pn[key])
+        op.Workspace().close_project(pn.project)
+
+    def test_snow_tiled(self):
+        np.random.seed(0)
+        im = ps.generators.blobs(shape=[90, 90], porosity=0.6, blobiness=1)
+        net1 = ps.networks.snow(im)
+        with ThreadPoolExecutor(2) as ex:
+            net2 = ps.networks.snow(im, divs=3, overlap=30, executor=ex)
+        assert net1['pore.all'].size == net2['pore.all'].size
+        assert net1['throat.all'].size == net2['throat.all'].size
+        for key in ['pore.volume', 'pore.inscribed_diameter',
+                    'pore.surface_area']:
+            assert_allclose(np.sort(net1[key]), np.sort(net2[key]))
+        # The regions are the same apart from their labels
+        pairs = set(zip(net1.regions.flat, net2.regions.flat))
+        assert len(pairs) == np.unique(net1.regions).size
+        assert len(pairs) == np.unique(net2.regions).size
+        # Process pools only accept a start method from Python 3.7
+        if sys.version_info >= (3, 7):
+            ctx = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(2, mp_context=ctx) as ex:
+                net3 = ps.networks.snow(im, divs=3, overlap=30, executor=ex)
+            assert_allclose(np.sort(net3['pore.volume']),
+                            np.sort(net1['pore.volume']))
+
     def test_snow_2D(self):
         a = np.unique(self.snow.peaks*self.im)
         b = np.unique(self.snow.regions*self.im)
@@ -48,6 +177,12 @@ class NetExtractTest():
                 found_nans = True
         assert found_nans is False
 
+    def test_snow_has_no_complex_values(self):
+        im = ps.generators.blobs([80, 80, 40], porosity=0.6)
+        net = ps.networks.snow(im)
+        for key in net.keys():
+            assert not np.iscomplexobj(net[key]), key
+
     # def test_snow_dual_2d(self):
     #     net = ps.networks.snow_dual(self.im)
     #     found_nans = False
@@ -64,6 +199,93 @@ class NetExtractTest():
                 found_nans = True
         assert found_nans is False
 
+    def test_snow_dual_without_images(self):
+        net = ps.networks.snow_dual(self.im3d)
+        net2 = ps.networks.snow_dual(self.im3d, return_images=False)
+        assert not hasattr(net2, 'regions')
+        assert np.all(net['pore.solid'] == net2['pore.solid'])
+        assert np.all(net.dt[3:-3, 3:-3, 3:-3] ==
+                      net.pore_dt + net.solid_dt)
+
+    def test_snow_update(self):
+        im = self.im3d.copy()
+        net = ps.networks.snow(im)
+        Np = net['pore.all'].size
+        im[23:27, 23:27, 23:27] = True
+        s = (slice(23, 27), slice(23, 27), slice(23, 27))
+        new = ps.networks.snow_update(net, im, s, halo=8)
+        regions = new.regions
+        assert regions.max() == new['pore.all'].size
+        assert np.all(new['pore.label'] == np.arange(1, regions.max() + 1))
+        counts = np.bincount(regions.ravel(), minlength=regions.max() + 1)
+        assert np.all(counts[1:] == new['pore.volume'])
+        assert new['throat.conns'].max() < new['pore.all'].size
+        assert np.all(new.im[3:-3, 3:-3, 3:-3] == im)
+        assert abs(new['pore.all'].size - Np) < Np/2
+        # Edits near a boundary face lead to a full extraction
+        im[0:2, 0:2, 0:2] = False
+        new = ps.networks.snow_update(new, im, (slice(0, 2), )*3, halo=8)
+        assert np.all(new.im[3:-3, 3:-3, 3:-3] == im)
+
+    def test_network_save_load(self):
+        net = ps.networks.snow(self.im3d)
+        assert isinstance(net, ps.networks.Network)
+        small = net.compact()
+        assert small['pore.volume'].dtype == np.float32
+        assert small['throat.conns'].dtype == np.int32
+        assert small.regions is net.regions
+        fname = os.path.join(tempfile.mkdtemp(), 'net.psn')
+        small.save(fname, images=True)
+        loaded = ps.networks.Network.load(fname)
+        assert isinstance(loaded['pore.volume'], np.memmap)
+        assert set(loaded.keys()) == set(net.keys())
+        for k in net.keys():
+            assert np.all(loaded[k] == small[k])
+        assert np.all(loaded.regions == net.regions)
+        small.save(fname)
+        assert ps.networks.Network.load(fname).images == []
+        regions = np.array(net.regions)
+        net.set_image('regions', regions, weak=True)
+        assert 'regions' in net.images
+        del regions
+        assert not hasattr(net, 'regions')
+
+    def test_flow_properties(self):
+        net = {'throat.conns': np.array([[0, 1]]),
+               'pore.coords': np.array([[0., 0., 0.], [10., 0., 0.]]),
+               'pore.inscribed_diameter': np.array([2., 2.]),
+               'throat.inscribed_diameter': np.array([1.]),
+               'throat.conduit_lengths.pore1': np.array([1.]),
+               'throat.conduit_lengths.throat': np.array([8.]),
+               'throat.conduit_lengths.pore2': np.array([1.])}
+        flow = ps.networks.flow_properties(net, domain_size=[10, 4, 4], mu=2)
+        R = 128*2/np.pi*(1/2**4 + 8/1**4 + 1/2**4)
+        assert_allclose(flow.permeability[0], (1/R)*2*10/16)
+        R = 4/np.pi*(1/2**2 + 8/1**2 + 1/2**2)
+        assert_allclose(flow.formation_factor[0], 16/((1/R)*10))
+        assert np.all(np.isnan(flow.permeability[1:]))
+        net = ps.networks.snow(self.im3d)
+        a = ps.networks.flow_properties(net)
+        b = ps.networks.flow_properties(net, solver='cg')
+        assert np.all(a.permeability > 0)
+        assert np.all(a.formation_factor > 1)
+        assert_allclose(a.permeability, b.permeability, rtol=1e-3)
+
+    def test_regions_to_batches(self):
+        im = self.snow.regions*self.im
+        net = ps.networks.regions_to_network(im, dt=self.snow.dt,
+                                             voxel_size=2)
+        batches = list(ps.networks.regions_to_batches(im, dt=self.snow.dt,
+                                                      voxel_size=2,
+                                                      batch_size=50))
+        pores = np.concatenate([r for e, r in batches if e == 'pore'])
+        throats = np.concatenate([r for e, r in batches if e == 'throat'])
+        assert all([r.size == 50 for e, r in batches[:-1] if e == 'throat'])
+        for name in pores.dtype.names:
+            assert_allclose(pores[name], net['pore.' + name])
+        for name in throats.dtype.names:
+            assert_allclose(throats[name], net['throat.' + name])
+
     def test_add_bounadary_regions_2D(self):
         im = self.im
         regions = ps.filters.snow_partitioning(im)
@@ -93,12 +315,49 @@ class NetExtractTest():
         f = ['bottom', 'top']
         bd = ps.networks.add_boundary_regions(regions, faces=f)
         assert bd.shape[2] > regions.shape[2]
+
+    def test_add_boundary_regions_keeps_interior(self):
+        regions = self.snow3d.regions
+        f = ['left', 'top']
+        bd = ps.networks.add_boundary_regions(regions, faces=f)
+        assert bd.shape == (53, 50, 53)
+        assert bd.dtype == np.uint16 or bd.dtype == np.uint8
+        inner = ps.tools.make_contiguous(regions)
+        assert np.all(bd[3:, :, :-3] == inner)
+        assert bd[:3, :, :-3].min() == 0
+        assert np.all(bd[:3, :, :-3][bd[:3, :, :-3] > 0] > inner.max())
         f = ['bottom', 'top', 'left', 'right', 'front', 'back']
         bd = ps.networks.add_boundary_regions(regions, faces=f)
         assert bd.shape[0] > regions.shape[0]
         assert bd.shape[1] > regions.shape[1]
         assert bd.shape[2] > regions.shape[2]
 
+    def test_add_boundary_regions_matches_old_algorithm(self):
+        rng = np.random.RandomState(0)
+        every = ['left', 'right', 'front', 'back', 'top', 'bottom']
+        for ndim in [2, 3]:
+            for trial in range(5):
+                regions = spim.label(rng.rand(*[12]*ndim) < 0.6)[0]
+                for f in [['left'], ['right', 'bottom'], ['back'], every]:
+                    old = _old_boundary_regions(regions, f)
+                    new = ps.networks.add_boundary_regions(regions, faces=f)
+                    assert old.shape == new.shape
+                    assert np.all((old == 0) == (new == 0))
+                    # The labels differ only in their numbering
+                    pairs = set(zip(old.flat, new.flat))
+                    assert len(pairs) == np.unique(old).size
+                    assert len(pairs) == np.unique(new).size
+
+    def test_add_boundary_regions_keeps_solid_apart(self):
+        regions = np.zeros([6, 6], dtype=int)
+        regions[0, 4:] = 1
+        regions[3:5, 2:4] = 2
+        bd = ps.networks.add_boundary_regions(regions, faces=['left'])
+        # The solid on the face is not merged with the largest label, 2
+        solid = bd[:3, 1:3]
+        assert np.all(solid > 0)
+        assert not np.any(np.isin(solid, bd[3:]))
+
     def test_map_to_regions(self):
         im = self.im
         regions = ps.filters.snow_partitioning(im)
@@ -113,6 +372,23 @@ class NetExtractTest():
         with pytest.raises(Exception):
             mapped = ps.networks.map_to_regions(regions, values)
 
+    def test_map_to_regions_batch(self):
+        regions = ps.filters.snow_partitioning(self.im)
+        values = np.random.rand(4, regions.max() + 1)
+        images = ps.networks.map_to_regions_batch(regions, values)
+        assert images.shape == (4, ) + regions.shape
+        for i in range(4):
+            im = ps.networks.map_to_regions(regions, values[i])
+            assert np.all(images[i] == im)
+            assert np.all(images[i, 10:20, 5] == im[10:20, 5])
+        assert np.all(images[1:3][1] == images[2])
+        fname = os.path.join(tempfile.mkdtemp(), 'mapped.dat')
+        out = np.memmap(fname, dtype=float, mode='w+', shape=images.shape)
+        out = ps.networks.map_to_regions_batch(regions, values, out=out)
+        assert np.all(out == np.array(images))
+        with pytest.raises(Exception):
+            ps.networks.map_to_regions_batch(regions, values[:, 1:])
+
     def test_planar_2d_image(self):
         np.random.seed(1)
         im1 = ps.generators.blobs([100, 100, 1])
@@ -166,6 +442,11 @@ class NetExtractTest():
         assert_allclose(actual=porosity_actual, desired=porosity_desired,
                         rtol=0.05)
 
+    def test_generate_voxel_image_rejects_cuboid_first(self):
+        # Raised before any estimates of max_dim are made
+        with pytest.raises(Exception):
+            ps.networks.generate_voxel_image({}, throat_shape='cuboid')
+
 
 if __name__ == '__main__':
     t = NetExtractTest()
@@ -1,8 +1,13 @@
 import porespy as ps
 import scipy as sp
+import numpy as np
 import scipy.ndimage as spim
 import matplotlib.pyplot as plt
 import pytest
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 
 class ToolsTest():
@@ -34,6 +39,17 @@ class ToolsTest():
         b = ps.tools.make_contiguous(im, keep_zeros=False).max()
         assert a == b
 
+    def test_make_contiguous_dtype_and_inplace(self):
+        im = sp.array([[0, 0, 300, 7], [7, 900, 0, 300]])
+        cont_im = ps.tools.make_contiguous(im)
+        assert cont_im.dtype == sp.uint8
+        assert sp.all(cont_im == [[0, 0, 2, 1], [1, 3, 0, 2]])
+        temp = im.copy()
+        ps.tools.make_contiguous(temp, inplace=True)
+        assert sp.all(temp == cont_im)
+        rand_im = ps.tools.randomize_colors(im)
+        assert rand_im.dtype == sp.uint16
+
     def test_get_slice(self):
         one_lab = self.labels == 10
         my_slice = ps.tools.get_slice(one_lab, center=[75, 9], size=10)
@@ -113,6 +129,228 @@ class ToolsTest():
         im = ps.tools.insert_sphere(im, [10, 100, 100], 50)
         im = ps.tools.insert_sphere(im, [180, 100, 100], 50)
 
+    def test_edt(self):
+        im = ps.generators.blobs(shape=[50, 60, 70])
+        dt = spim.distance_transform_edt(im)
+        assert sp.all(ps.tools.edt(im) == dt)
+        dt2 = spim.distance_transform_edt(im[..., 0])
+        assert sp.all(ps.tools.edt(im[..., 0]) == dt2)
+        sq = ps.tools.edt(im, squared=True)
+        assert sq.dtype == sp.int32
+        assert sp.all(sq == sp.around(dt**2))
+        out = sp.zeros(im.shape, dtype=sp.float32)
+        ps.tools.edt(im, out=out, slab_size=7)
+        assert sp.allclose(out, dt)
+        # Images with no solid receive a finite distance
+        dt = ps.tools.edt(sp.ones([4, 3], dtype=bool))
+        assert sp.all(dt == 5)
+
+    def test_edt_signed(self):
+        im = ps.generators.blobs(shape=[50, 60, 70])
+        sdt = ps.tools.edt(im, signed=True)
+        assert sp.all(sdt[im] > 0) and sp.all(sdt[~im] < 0)
+        dt = spim.distance_transform_edt(im) + spim.distance_transform_edt(~im)
+        assert sp.allclose(sp.absolute(sdt), dt)
+        im2 = im[..., 0]
+        dt2 = (spim.distance_transform_edt(im2) +
+               spim.distance_transform_edt(~im2))
+        sq = ps.tools.edt(im2, squared=True, signed=True)
+        assert sp.all(sp.absolute(sq) == sp.around(dt2**2))
+        with pytest.raises(Exception):
+            ps.tools.edt(im, squared=True, signed=True, dtype=sp.uint32)
+
+    def test_edt_in_forked_process(self):
+        from porespy.tools import __numba__
+        im = ps.generators.blobs(shape=[20, 20])
+        ps.tools.edt(im)
+        # As seen by a child forked after the kernels were launched
+        pid = __numba__._pid
+        __numba__._pid = pid + 1
+        try:
+            with pytest.raises(Exception):
+                ps.tools.edt(im)
+        finally:
+            __numba__._pid = pid
+        assert sp.all(ps.tools.edt(im) == spim.distance_transform_edt(im))
+
+    def test_region_index(self):
+        labels = self.labels
+        index = ps.tools.RegionIndex(labels)
+        assert index.num_regions == labels.max()
+        slices = spim.find_objects(labels)
+        for i in [1, 5, index.num_regions]:
+            assert index.slices(i) == slices[i - 1]
+            assert sp.all(index.mask(i) == (labels[slices[i - 1]] == i))
+            assert index.counts[i - 1] == sp.sum(labels == i)
+        vmax = index.reduce(labels*2.0, np.maximum)
+        with pytest.raises(Exception):
+            index.reduce(labels*2.0, max)
+        assert sp.all(vmax[1:] == 2*sp.arange(1, index.num_regions + 1))
+        fname = os.path.join(tempfile.mkdtemp(), 'index.npz')
+        index.save(fname)
+        index2 = ps.tools.RegionIndex.load(fname)
+        assert sp.all(index2.voxels == index.voxels)
+        assert index2.slices(5) == index.slices(5)
+
+    def test_map_blocks(self):
+        im = self.im3D
+        dt = ps.tools.edt(im)
+        out = sp.zeros(im.shape, dtype=float)
+        with ThreadPoolExecutor(2) as ex:
+            res = ps.tools.map_blocks(ps.tools.edt, im, divs=[2, 3, 1],
+                                      halo=int(dt.max()) + 1, executor=ex,
+                                      out=out, max_pending=2)
+        assert res is out
+        assert sp.all(out == dt)
+        phi = ps.tools.map_blocks(ps.metrics.porosity, im, divs=3,
+                                  reduce='mean')
+        assert sp.allclose(phi, ps.metrics.porosity(im))
+        n = ps.tools.map_blocks(sp.sum, im, divs=2, reduce='sum')
+        assert n == sp.sum(im)
+        # The results of halo-extended blocks cannot be reduced
+        with pytest.raises(Exception):
+            ps.tools.map_blocks(np.sum, np.ones((20, 20)), divs=2, halo=3,
+                                reduce='sum')
+
+    def test_get_strel(self):
+        from skimage.morphology import ball, cube
+        s = ps.tools.get_strel(3, ndim=3, shape='ball')
+        assert sp.all(s == ball(3))
+        assert s is ps.tools.get_strel(3.0, ndim=3, shape='ball')
+        assert not s.flags.writeable
+        assert sp.all(ps.tools.get_strel(1, shape='cube') == cube(3))
+        assert sp.all(ps.tools.ps_ball(2.5) ==
+                      ps.tools.get_strel(2.5, ndim=3, shape='ps_ball'))
+        r = ps.tools.get_strel(2, ndim=2, spectrum=[16, 16], offsets=True)
+        assert r.spectrum.shape == (16, 9)
+        assert len(r.offsets) == 8
+        assert sp.all(sp.absolute(r.offsets).max(axis=1) >= 1)
+
+    def test_fft_morphology_releases_memory(self):
+        import gc
+        import tracemalloc
+        im = self.im3D
+        ps.tools.morphology(im, radius=1, mode='opening', backend='fft')
+        gc.collect()
+        tracemalloc.start()
+        try:
+            for r in range(1, 6):
+                ps.tools.morphology(im, radius=r, mode='opening',
+                                    backend='fft')
+            gc.collect()
+            current = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        # No image sized spectra are kept once the calls return
+        assert current < im.size
+
+    def test_morphology(self):
+        im = self.im3D
+        for mode in ['erosion', 'dilation', 'opening', 'closing']:
+            func = getattr(spim, 'binary_' + mode)
+            for shape in ['ball', 'ps_ball']:
+                strel = ps.tools.get_strel(3, ndim=3, shape=shape)
+                ref = func(im, structure=strel)
+                for backend in ['auto', 'fft', 'direct', 'edt']:
+                    r = ps.tools.morphology(im, radius=3, shape=shape,
+                                            mode=mode, backend=backend)
+                    assert sp.all(r == ref)
+        strel = ps.tools.get_strel(2, ndim=3, shape='cube')
+        r = ps.tools.morphology(im, strel=strel, mode='dilation')
+        assert sp.all(r == spim.binary_dilation(im, structure=strel))
+        with pytest.raises(Exception):
+            ps.tools.morphology(im, strel=strel, backend='edt')
+
+    def test_cylindrical_roi(self):
+        roi = ps.tools.cylindrical_roi(shape=[20, 31, 31], axis=0)
+        assert roi.shape == (20, 31, 31)
+        assert not roi.flags.writeable
+        assert sp.all(roi == roi[0])
+        assert roi[0, 15, 0] and not roi[0, 0, 0]
+        im = ps.tools.extract_cylinder(sp.zeros([20, 31, 31], dtype=bool))
+        assert sp.all(im == ~roi)
+
+    def test_insert_spheres(self):
+        im = sp.zeros([40, 40, 40], dtype=sp.uint8)
+        im = ps.tools.insert_spheres(im, centers=[[20, 20, 20], [0, 0, 39]],
+                                     radii=[5, 3])
+        ref = sp.zeros_like(im)
+        ref[15:26, 15:26, 15:26] = ps.tools.get_strel(5, shape='ball')
+        ref[:4, :4, 36:] = ps.tools.get_strel(3, shape='ball')[3:, 3:, :4]
+        assert sp.all(im == ref)
+        im = sp.zeros([40, 40], dtype=sp.uint16)
+        im = ps.tools.insert_spheres(im, centers=[[10, 10], [14, 10]],
+                                     radii=3, mode='label', shape='cube')
+        assert sp.all(im[7:11, 7:14] == 1)
+        assert sp.all(im[11:18, 7:14] == 2)
+
+    def test_insert_cylinders(self):
+        im = sp.zeros([30, 30, 30], dtype=sp.uint8)
+        im = ps.tools.insert_cylinders(im, xyz0=[[5, 15, 15], [15, 5, 15]],
+                                       xyz1=[[25, 15, 15], [15, 5, 15]],
+                                       radii=[3, 2])
+        disk = ps.tools.get_strel(3, ndim=2, shape='ball')
+        assert sp.all(im[5:26, 12:19, 12:19] == disk)
+        assert sp.all(im[13:18, 3:8, 13:18] == ps.tools.get_strel(2))
+        assert im.sum() == 21*disk.sum() + 2*(ps.tools.get_strel(3).sum() -
+                                              disk.sum())//2 + \
+            ps.tools.get_strel(2).sum()
+
+    def test_cache(self):
+        from porespy.tools.__cache__ import _settings
+        saved = dict(_settings)
+        path = tempfile.mkdtemp()
+        ps.tools.set_cache(cache_dir=path)
+        try:
+            im = ps.generators.blobs(shape=[40, 40])
+            lt = ps.filters.local_thickness(im, sizes=5)
+            assert len(os.listdir(path)) == 1
+            lt2 = ps.filters.local_thickness(im, sizes=5)
+            assert isinstance(lt2, sp.memmap)
+            assert sp.all(lt == lt2)
+            ps.filters.local_thickness(im, sizes=6)
+            assert len(os.listdir(path)) == 2
+            ps.tools.set_cache(max_size=lt.nbytes + 1000)
+            ps.filters.local_thickness(~im, sizes=5)
+            assert len(os.listdir(path)) == 1
+            ps.tools.clear_cache()
+            assert len(os.listdir(path)) == 0
+        finally:
+            ps.tools.set_cache(**saved)
+            shutil.rmtree(path, ignore_errors=True)
+
+    def test_points_inside_matches_inserted_shapes(self):
+        from porespy.tools.__raster__ import _points_inside
+        centers = [[8, 8, 8], [20, 4, 25]]
+        xyz0, xyz1 = [[8, 8, 8]], [[20, 4, 25]]
+        im = sp.zeros([30, 30, 30], dtype=bool)
+        im = ps.tools.insert_spheres(im, centers=centers, radii=[4, 6])
+        im = ps.tools.insert_cylinders(im, xyz0=xyz0, xyz1=xyz1, radii=2)
+        points = sp.vstack(sp.where(sp.ones_like(im))).T
+        inside = _points_inside(points, centers=centers, radii=[4, 6],
+                                xyz0=xyz0, xyz1=xyz1, cylinder_radii=2)
+        assert sp.all(inside == im.flatten())
+        # Many shapes, sorted into several cells, some beyond the image
+        rs = np.random.RandomState(0)
+        for shape in [[40, 50], [30, 35, 40]]:
+            n = 60
+            centers = rs.rand(n, len(shape))*(np.array(shape) + 10) - 5
+            radii = rs.randint(1, 5, n)
+            conns = rs.randint(0, n, (n, 2))
+            for elem in ['ball', 'cube']:
+                im = sp.zeros(shape, dtype=bool)
+                im = ps.tools.insert_spheres(im, centers=centers, radii=radii,
+                                             shape=elem)
+                im = ps.tools.insert_cylinders(im, xyz0=centers[conns[:, 0]],
+                                               xyz1=centers[conns[:, 1]],
+                                               radii=1)
+                points = sp.vstack(sp.where(sp.ones_like(im))).T
+                inside = _points_inside(points, centers=centers, radii=radii,
+                                        shape=elem, xyz0=centers[conns[:, 0]],
+                                        xyz1=centers[conns[:, 1]],
+                                        cylinder_radii=1)
+                assert sp.all(inside == im.flatten())
+
 
 if __name__ == '__main__':
     t = ToolsTest()